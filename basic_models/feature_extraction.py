@@ -1,54 +1,103 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
 import numpy as np
 import pandas as pd
 
+# допустимый возраст; до AGE_OUTLIER_MAX - выброс сверху, дальше - явный мусор
+AGE_MIN, AGE_MAX, AGE_OUTLIER_MAX = 15, 100, 200
+
 class UpliftFeatureExtractor:
     """
     Feature extractor для uplift-моделирования на основе данных X5
     Включает все этапы предобработки и генерации признаков из EDA
     """
 
-    def __init__(self, drop_redundant=True):
+    def __init__(self, drop_redundant=True, n_jobs=1, low_memory=False):
         self.feature_names = []
         self.drop_redundant = drop_redundant
+        # n_jobs > 1 (или -1 - все ядра): поведенческие признаки считаются в пуле процессов
+        self.n_jobs = n_jobs
+        # low_memory=True: без полных копий датафреймов, purchases в компактных типах
+        # (float32/int32, store_id/product_id - category); суммы во float32 могут
+        # отличаться от обычного режима в последних знаках
+        self.low_memory = low_memory
+        # константы предобработки, подобранные на обучении (см. preprocess_clients)
+        self.preprocessing = {}
 
     def safe_div(self, a, b):
         """Безопасное деление с защитой от деления на ноль"""
         return np.where(b == 0, 0, a / b)
 
+    @staticmethod
+    def fit_age_imputation(age):
+        """
+        Статистики для замены возраста вне [AGE_MIN, AGE_MAX]: средние первого
+        и четвёртого квартилей допустимых значений и общее среднее
+        """
+        valid_ages = age[(age >= AGE_MIN) & (age <= AGE_MAX)]
+        q1, q3 = valid_ages.quantile([0.25, 0.75])
+        return {
+            'mean_q1': float(valid_ages[valid_ages <= q1].mean()),
+            'mean_q4': float(valid_ages[valid_ages > q3].mean()),
+            'mean': float(valid_ages.mean()),
+        }
+
+    @staticmethod
+    def impute_age(age, params):
+        """
+        Замена возраста: < AGE_MIN - mean_q1, (AGE_MAX, AGE_OUTLIER_MAX] - mean_q4,
+        остальное (больше AGE_OUTLIER_MAX и пропуски) - mean
+        """
+        values = age.to_numpy(dtype=np.float64, na_value=np.nan)
+        imputed = np.select(
+            [(values >= AGE_MIN) & (values <= AGE_MAX), values < AGE_MIN, values <= AGE_OUTLIER_MAX],
+            [values, params['mean_q1'], params['mean_q4']],
+            default=params['mean'],
+        )
+        return pd.Series(imputed, index=age.index, name=age.name)
+
     def preprocess_clients(self, clients_df, train_df, treatment_df, target_df):
         """Предобработка данных о клиентах"""
         # Объединение данных
         df_clients = pd.concat([train_df, treatment_df, target_df], axis=1)
         df_clients = pd.merge(df_clients, clients_df, on='client_id')
         
-        # Обработка возраста
-        valid_mask = (df_clients['age'] >= 15) & (df_clients['age'] <= 100)
-        valid_ages = df_clients.loc[valid_mask, 'age']
-        
-        # Расчет квартилей для возраста
-        q1, q3 = valid_ages.quantile([0.25, 0.75])
-        mean_q1 = valid_ages[(valid_ages >= 15) & (valid_ages <= q1)].mean()
-        mean_q4 = valid_ages[(valid_ages > q3) & (valid_ages <= 100)].mean()
-        
-        def replace_age_with_quartile_mean(age):
-            if 15 <= age <= 100:
-                return age
-            if age < 15:
-                return mean_q1
-            elif 100 < age <= 200:
-                return mean_q4
-            else:
-                return valid_ages.mean()
-        
-        df_clients['age'] = df_clients['age'].apply(replace_age_with_quartile_mean)
+        # Обработка возраста: статистики считаются по обучающей выборке
+        # и сохраняются вместе с моделью (preprocessing), инференс применяет их же
+        age_params = self.fit_age_imputation(df_clients['age'])
+        self.preprocessing = {'age': age_params}
+        df_clients['age'] = self.impute_age(df_clients['age'], age_params)
         df_clients['gender'] = df_clients['gender'].astype('category')
         df_clients['is_activated'] = np.where(df_clients['first_redeem_date'].notna(), 1, 0)
         
         return df_clients.set_index('client_id')
     
+    def compact_purchases(self, purchases_df):
+        """
+        Проекция purchases на нужные колонки без копирования неизменяемых данных
+        и перевод в компактные типы (для low_memory)
+        """
+        cols = [col for col in PURCHASES_COLUMNS if col in purchases_df.columns]
+        purchases = pd.DataFrame({col: purchases_df[col] for col in cols}, copy=False)
+        
+        for col in cols:
+            s = purchases[col]
+            if col in ('store_id', 'product_id'):
+                purchases[col] = s.astype('category')
+            elif col in ('client_id', 'transaction_id', 'transaction_datetime'):
+                continue
+            elif pd.api.types.is_float_dtype(s) and s.dtype != np.float32:
+                purchases[col] = s.astype(np.float32)
+            elif pd.api.types.is_integer_dtype(s):
+                purchases[col] = pd.to_numeric(s, downcast='integer')
+        
+        return purchases
+    
     def preprocess_purchases(self, purchases_df):
         """Предобработка транзакционных данных"""
-        purchases = purchases_df.copy()
+        purchases = self.compact_purchases(purchases_df) if self.low_memory else purchases_df.copy()
         
         # Заполнение пропусков
         purchases['trn_sum_from_red'] = purchases['trn_sum_from_red'].fillna(purchases['trn_sum_from_iss'])
@@ -59,21 +108,38 @@ class UpliftFeatureExtractor:
         
         return purchases
     
+    def group_mode(self, df, key, col):
+        """
+        Мода col внутри групп key без Python-лямбд: подсчёт пар (key, col) и idxmax.
+        Как и Series.mode()[0], при равенстве частот берётся наименьшее значение, NaN не учитываются.
+        Возвращает (мода, её частота), индексированные по key
+        """
+        counts = df.groupby([key, col], sort=True, observed=True).size().rename('cnt').reset_index()
+        # внутри группы строки отсортированы по col, idxmax берёт первую - наименьшее значение
+        top = counts.loc[counts.groupby(key, sort=False)['cnt'].idxmax()].set_index(key)
+        mode = top[col]
+        if isinstance(mode.dtype, pd.CategoricalDtype):
+            mode = mode.astype(mode.cat.categories.dtype)
+        return mode, top['cnt']
+
     def generate_behavioral_features(self, purchases_df):
         """Генерация поведенческих признаков"""
-        df = purchases_df.copy()
+        df = purchases_df if self.low_memory else purchases_df.copy()
         
         # Уникальные транзакции
         trans_cols = ['client_id', 'transaction_id', 'transaction_datetime', 
                      'regular_points_received', 'express_points_received',
                      'regular_points_spent', 'express_points_spent', 
                      'purchase_sum', 'store_id']
-        unique_trans = df[trans_cols].drop_duplicates('transaction_id')
+        # transaction_id уникален в рамках клиента - так признаки клиента
+        # не зависят от остальных клиентов (и от разбиения на чанки)
+        # копируются только строки уникальных транзакций, а не вся проекция
+        unique_trans = df.loc[~df.duplicated(['client_id', 'transaction_id']), trans_cols]
         
         # Продуктовые данные
         product_cols = ['client_id', 'transaction_id', 'product_id', 
                        'product_quantity', 'trn_sum_from_iss', 'trn_sum_from_red']
-        product_data = df[product_cols]
+        product_data = pd.DataFrame({col: df[col] for col in product_cols}, copy=False)
         
         features = {}
         
@@ -143,12 +209,11 @@ class UpliftFeatureExtractor:
         unique_trans['transaction_weekday'] = unique_trans['transaction_datetime'].dt.dayofweek
         unique_trans['transaction_hour'] = unique_trans['transaction_datetime'].dt.hour
         
-        features['most_frequent_weekday'] = unique_trans.groupby('client_id')['transaction_weekday'].agg(
-            lambda x: x.mode()[0] if len(x.mode()) > 0 else -1
-        )
-        features['most_frequent_hour'] = unique_trans.groupby('client_id')['transaction_hour'].agg(
-            lambda x: x.mode()[0] if len(x.mode()) > 0 else -1
-        )
+        clients_index = features['total_transactions'].index
+        weekday_mode, _ = self.group_mode(unique_trans, 'client_id', 'transaction_weekday')
+        hour_mode, _ = self.group_mode(unique_trans, 'client_id', 'transaction_hour')
+        features['most_frequent_weekday'] = weekday_mode.reindex(clients_index, fill_value=-1)
+        features['most_frequent_hour'] = hour_mode.reindex(clients_index, fill_value=-1)
         
         # Частота транзакций
         features['transactions_per_day'] = (
@@ -157,18 +222,17 @@ class UpliftFeatureExtractor:
         
         # Фичи по магазинам
         features['unique_stores_visited'] = client_trans['store_id'].nunique()
-        features['most_frequent_store'] = client_trans['store_id'].agg(
-            lambda x: x.mode()[0] if len(x.mode()) > 0 else -1
-        )
-        features['store_loyalty_ratio'] = client_trans['store_id'].agg(
-            lambda x: x.value_counts().iloc[0] / len(x) if len(x) > 0 else 0
+        store_mode, store_mode_count = self.group_mode(unique_trans, 'client_id', 'store_id')
+        features['most_frequent_store'] = store_mode.reindex(clients_index, fill_value=-1)
+        features['store_loyalty_ratio'] = (
+            store_mode_count.reindex(clients_index, fill_value=0) / client_trans.size()
         )
         
         return pd.DataFrame(features)
     
     def generate_static_features(self, clients_df):
         """Генерация статических признаков"""
-        df = clients_df.copy()
+        df = clients_df if self.low_memory else clients_df.copy()
         features = pd.DataFrame(index=df.index)
         
         first_issue = pd.to_datetime(df['first_issue_date'], errors='coerce')
@@ -293,7 +357,54 @@ class UpliftFeatureExtractor:
         processed_purchases = self.preprocess_purchases(purchases_df)
 
         # Генерация признаков
-        behavioral_features = self.generate_behavioral_features(processed_purchases)
+        n_jobs = os.cpu_count() if self.n_jobs in (None, -1) else self.n_jobs
+        if n_jobs > 1:
+            behavioral_features = generate_behavioral_features_parallel(self, processed_purchases, n_jobs)
+        else:
+            behavioral_features = self.generate_behavioral_features(processed_purchases)
+        
+        return self.assemble_features(processed_clients, behavioral_features)
+    
+    def calculate_features_chunked(self, clients_df, train_df, treatment_df, target_df, purchases_chunks):
+        """
+        Потоковый вариант calculate_features с ограниченной пиковой памятью.
+        purchases_chunks - итератор DataFrame'ов, в котором все строки одного клиента
+        лежат в одном чанке (см. iter_client_chunks / read_purchases_chunks).
+        Все поведенческие признаки считаются внутри клиента, поэтому результат
+        совпадает с calculate_features на полной таблице
+        """
+        processed_clients = self.preprocess_clients(clients_df, train_df, treatment_df, target_df)
+
+        parts = []
+        for chunk in purchases_chunks:
+            processed_chunk = self.preprocess_purchases(chunk)
+            parts.append(self.generate_behavioral_features(processed_chunk))
+            del processed_chunk
+
+        behavioral_features = pd.concat(parts).sort_index()
+        
+        return self.assemble_features(processed_clients, behavioral_features)
+    
+    def sanitize_features(self, final_df):
+        """
+        inf/-inf -> 1e9, clip в [-1e9, 1e9], round(6) - одной операцией над
+        float-матрицей всех числовых колонок; типы колонок сохраняются
+        """
+        num_cols = final_df.select_dtypes(include=[np.number]).columns
+        if len(num_cols) == 0:
+            return final_df
+        
+        dtypes = final_df[num_cols].dtypes
+        values = final_df[num_cols].to_numpy(dtype=np.float64)
+        values[np.isinf(values)] = 1e9
+        np.clip(values, -1e9, 1e9, out=values)
+        np.round(values, 6, out=values)
+        
+        final_df[num_cols] = values
+        return final_df.astype(dtypes.to_dict())
+    
+    def assemble_features(self, processed_clients, behavioral_features):
+        """Статические и бизнес-признаки, демография, очистка - всё после поведенческих признаков"""
         static_features = self.generate_static_features(processed_clients)
         
         # Объединение и создание бизнес-признаков
@@ -312,12 +423,160 @@ class UpliftFeatureExtractor:
             final_df = self.remove_redundant_features(final_df)
         
         # Обработка бесконечных значений
-        for col in final_df.select_dtypes(include=[np.number]).columns:
-            s = final_df[col]
-            s = s.replace([np.inf, -np.inf], 1e9)
-            s = np.clip(s, -1e9, 1e9)
-            final_df[col] = s.round(6)
+        final_df = self.sanitize_features(final_df)
         
         self.feature_names = [col for col in final_df.columns if col not in ['treatment_flg', 'target']]
         
         return final_df
+
+
+PURCHASES_COLUMNS = [
+    'client_id', 'transaction_id', 'transaction_datetime',
+    'regular_points_received', 'express_points_received',
+    'regular_points_spent', 'express_points_spent', 'purchase_sum', 'store_id',
+    'product_id', 'product_quantity', 'trn_sum_from_iss', 'trn_sum_from_red',
+]
+
+
+def iter_client_chunks(raw_chunks, key='client_id'):
+    """
+    Перенарезка произвольных чанков так, чтобы клиент не разрывался между ними:
+    строки последнего клиента чанка переносятся в следующий.
+    Вход должен быть сгруппирован по client_id (как purchases.csv в X5), иначе ValueError
+    """
+    carry = None
+    finished = set()
+
+    for chunk in raw_chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if chunk.empty:
+            continue
+
+        keys = chunk[key]
+        last = keys.iloc[-1]
+        tail_mask = (keys == last).to_numpy()
+        # хвост - только непрерывный блок последнего клиента в конце чанка
+        tail_start = len(chunk) - np.argmin(tail_mask[::-1]) if not tail_mask.all() else 0
+        carry = chunk.iloc[tail_start:]
+        ready = chunk.iloc[:tail_start]
+        if ready.empty:
+            continue
+
+        ready_clients = ready[key].unique()
+        if finished.intersection(ready_clients) or last in ready_clients:
+            raise ValueError("purchases must be grouped by client_id for chunked processing")
+        finished.update(ready_clients)
+        yield ready
+
+    if carry is not None and not carry.empty:
+        if carry[key].iloc[0] in finished:
+            raise ValueError("purchases must be grouped by client_id for chunked processing")
+        yield carry
+
+
+def read_purchases_chunks(path, chunksize=2_000_000, columns=None):
+    """
+    Чтение purchases по частям из CSV (в т.ч. .csv.gz) или Parquet
+    с перенарезкой по границам клиентов
+    """
+    columns = columns or PURCHASES_COLUMNS
+
+    if str(path).endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        raw_chunks = (
+            batch.to_pandas()
+            for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns)
+        )
+    else:
+        raw_chunks = pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+    return iter_client_chunks(raw_chunks)
+
+
+# Колонки purchases, которые перед передачей в пул кодируются целыми числами
+ENCODED_COLUMNS = ['client_id', 'transaction_id', 'store_id', 'product_id']
+
+_shared_columns = {}
+
+
+def _attach_shared_columns(spec):
+    """Инициализатор воркера: подключение к блокам shared memory с колонками purchases"""
+    for col, (name, dtype, length) in spec.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _shared_columns[col] = (shm, np.ndarray((length,), dtype=dtype, buffer=shm.buf))
+
+
+def _behavioral_partition(extractor, start, end):
+    """Поведенческие признаки для одной партиции (строки [start, end) в shared memory)"""
+    df = pd.DataFrame({col: array[start:end] for col, (_, array) in _shared_columns.items()})
+    df['transaction_datetime'] = df['transaction_datetime'].astype('datetime64[ns]')
+    return extractor.generate_behavioral_features(df)
+
+
+def generate_behavioral_features_parallel(extractor, purchases_df, n_jobs):
+    """
+    generate_behavioral_features в пуле процессов.
+
+    Строковые id кодируются factorize(sort=True) (порядок кодов совпадает с порядком
+    значений, поэтому моды и сортировка по client_id не меняются), даты переводятся в int64.
+    Строки хеш-партиционируются по client_id и раскладываются по партициям в блоки
+    shared memory - воркеры читают свой диапазон без пиклинга больших DataFrame.
+    Результаты партиций склеиваются, декодируются и сортируются по client_id,
+    поэтому результат совпадает с однопоточным
+    """
+    n = len(purchases_df)
+    columns = {}
+    uniques = {}
+    for col in purchases_df.columns:
+        values = purchases_df[col]
+        if col in ENCODED_COLUMNS:
+            codes, uniques[col] = pd.factorize(values, sort=True)
+            # NaN -> NaN, а не -1, чтобы nunique и моды его не учитывали
+            columns[col] = codes.astype(np.float64) if (codes < 0).any() else codes.astype(np.int64)
+            if (codes < 0).any():
+                columns[col][codes < 0] = np.nan
+        elif col == 'transaction_datetime':
+            columns[col] = pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        else:
+            columns[col] = values.to_numpy(dtype=np.float64)
+
+    # хеш-партиционирование по клиенту; stable сохраняет исходный порядок строк внутри партиции
+    client_codes = np.nan_to_num(columns['client_id'], nan=-1).astype(np.int64)
+    partition = pd.util.hash_array(client_codes) % np.uint64(n_jobs)
+    order = np.argsort(partition, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(partition.astype(np.int64), minlength=n_jobs))])
+
+    blocks = []
+    spec = {}
+    try:
+        for col, array in columns.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(shm)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array[order]
+            spec[col] = (shm.name, array.dtype.str, n)
+        del columns, order
+
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_attach_shared_columns, initargs=(spec,)) as pool:
+            futures = [
+                pool.submit(_behavioral_partition, extractor, int(bounds[i]), int(bounds[i + 1]))
+                for i in range(n_jobs)
+                if bounds[i + 1] > bounds[i]
+            ]
+            parts = [f.result() for f in futures]
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    features = pd.concat(parts).sort_index()
+
+    # обратно к исходным значениям id
+    features.index = pd.Index(uniques['client_id'].take(features.index.to_numpy(dtype=np.int64)), name='client_id')
+    store = features['most_frequent_store'].to_numpy()
+    decoded = np.asarray(uniques['store_id'], dtype=object).take(np.where(store >= 0, store, 0).astype(np.int64))
+    features['most_frequent_store'] = np.where(store >= 0, decoded, -1)
+
+    return features
@@ -1,4 +1,7 @@
-from typing import List, Dict
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Optional
 import numpy as np
 import pandas as pd
 
@@ -8,7 +11,7 @@ from sklearn.pipeline import Pipeline
 from sklearn.linear_model import LogisticRegression
 from sklearn.base import BaseEstimator, clone
 
-from catboost import CatBoostClassifier, CatBoostRegressor
+from catboost import CatBoost, CatBoostClassifier, CatBoostRegressor, Pool
 from sklift.models import TwoModels
 
 T_SOLVER_LOGREG_BEST_PARAMS: Dict[str, object] = {
@@ -140,26 +143,66 @@ def build_s_learner_catboost(cat_features: List[int]) -> CatBoostClassifier:
     )
 
 
-def predict_uplift_s_learner(model: CatBoostClassifier, X: pd.DataFrame, treatment_col: str):
-    X_treat = X.copy()
-    X_ctrl = X.copy()
+def predict_uplift_s_learner(model: CatBoostClassifier, X: pd.DataFrame, treatment_col: str,
+                             batch_size: int = 200_000):
+    """
+    uplift = p(treatment_col=1) - p(treatment_col=0). Оба варианта строк складываются
+    в одну таблицу и предсказываются одним predict_proba; X обрабатывается батчами
+    по batch_size строк, поэтому удвоенная копия есть только у текущего батча
+    """
+    uplift = np.empty(len(X))
+    for start in range(0, len(X), batch_size):
+        chunk = X.iloc[start:start + batch_size]
+        n = len(chunk)
 
-    X_treat[treatment_col] = 1
-    X_ctrl[treatment_col] = 0
+        stacked = pd.concat([chunk, chunk], ignore_index=True)
+        stacked[treatment_col] = np.repeat([1, 0], n)
 
-    p1 = model.predict_proba(X_treat)[:, 1]
-    p0 = model.predict_proba(X_ctrl)[:, 1]
+        p = model.predict_proba(stacked)[:, 1]
+        uplift[start:start + n] = p[:n] - p[n:]
 
-    return p1 - p0
+    return uplift
 
 
-class MyXLearner(BaseEstimator):
+def _fit_estimator(estimator, X, y):
+    """Обучение одной модели (в потоке или процессе пула); возвращает (модель, секунды)"""
+    start = time.perf_counter()
+    estimator.fit(X, y)
+    return estimator, time.perf_counter() - start
+
+
+def _clone_learner(learner):
+    """clone для шаблона модели: CatBoost (cat_features) не проходит проверку sklearn.clone"""
+    if isinstance(learner, CatBoost):
+        return learner.copy()
+    return clone(learner)
+
 
-    def __init__(self, outcome_learner, effect_learner, propensity_learner):
+def set_thread_budget(estimator, threads: int) -> None:
+    """Ограничить число потоков модели, чтобы параллельные модели не делили ядра с перебором"""
+    if isinstance(estimator, CatBoost):
+        estimator.set_params(thread_count=threads)
+    elif "n_jobs" in estimator.get_params():
+        estimator.set_params(n_jobs=threads)
+
+
+class MyXLearner(BaseEstimator):
+    """
+    X-learner. n_jobs=None - модели обучаются по очереди, как есть;
+    n_jobs=k (-1 - все ядра) - независимые модели этапа (mu_0, mu_1, propensity,
+    затем tau_0, tau_1) обучаются одновременно в пуле backend ("thread" | "process"),
+    а k ядер делятся между ними (thread_count у CatBoost, n_jobs у sklearn).
+    После fit: fit_times_ - время обучения каждой модели, stage_times_ - время этапов
+    """
+
+    def __init__(self, outcome_learner, effect_learner, propensity_learner,
+                 n_jobs: Optional[int] = None, backend: str = "thread"):
         self.outcome_learner = outcome_learner
 
         self.effect_learner = effect_learner
         self.propensity_learner = propensity_learner
+        self.n_jobs = n_jobs
+        self.backend = backend
 
         self.model_mu_0 = None
         self.model_mu_1 = None
@@ -167,6 +210,28 @@ class MyXLearner(BaseEstimator):
         self.model_tau_1 = None
         self.model_propensity = None
 
+    def _fit_stage(self, tasks, executor, budget):
+        """tasks - {имя: (learner, X, y)}; возвращает {имя: обученная копия learner}"""
+        models = {name: _clone_learner(learner) for name, (learner, _, _) in tasks.items()}
+
+        if executor is None:
+            results = {name: _fit_estimator(models[name], X, y) for name, (_, X, y) in tasks.items()}
+        else:
+            workers = min(len(tasks), budget)
+            for i, model in enumerate(models.values()):
+                # остаток ядер - первым моделям этапа
+                extra = 1 if workers == len(tasks) and i < budget % workers else 0
+                set_thread_budget(model, budget // workers + extra)
+            futures = {
+                name: executor.submit(_fit_estimator, models[name], X, y)
+                for name, (_, X, y) in tasks.items()
+            }
+            results = {name: future.result() for name, future in futures.items()}
+
+        for name, (_, seconds) in results.items():
+            self.fit_times_[name] = seconds
+        return {name: model for name, (model, _) in results.items()}
+
     def fit(self, X, y, treatment):
         y = np.asarray(y)
         t = np.asarray(treatment)
@@ -176,34 +241,60 @@ class MyXLearner(BaseEstimator):
         X_t = X[t == 1]
         y_t = y[t == 1]
 
-        # outcome models
-        self.model_mu_0 = clone(self.outcome_learner)
-        self.model_mu_0.fit(X_c, y_c)
-
-        self.model_mu_1 = clone(self.outcome_learner)
-        self.model_mu_1.fit(X_t, y_t)
-
-        # propensity
-        self.model_propensity = clone(self.propensity_learner)
-        self.model_propensity.fit(X, t)
-
-        # pseudo-effects
-        mu1_on_c = self.model_mu_1.predict_proba(X_c)[:, 1]
-        mu0_on_t = self.model_mu_0.predict_proba(X_t)[:, 1]
-
-        D0 = mu1_on_c - y_c
-        D1 = y_t - mu0_on_t
-
-        # effect models
-        self.model_tau_0 = clone(self.effect_learner)
-        self.model_tau_0.fit(X_c, D0)
-
-        self.model_tau_1 = clone(self.effect_learner)
-        self.model_tau_1.fit(X_t, D1)
+        self.fit_times_ = {}
+        self.stage_times_ = {}
+
+        executor, budget = None, 1
+        if self.n_jobs is not None:
+            budget = os.cpu_count() if self.n_jobs == -1 else max(1, self.n_jobs)
+            if self.backend not in ("thread", "process"):
+                raise ValueError(f"Unknown backend: {self.backend}")
+            pool = ThreadPoolExecutor if self.backend == "thread" else ProcessPoolExecutor
+            executor = pool(max_workers=min(3, budget))
+
+        try:
+            # outcome models и propensity друг от друга не зависят
+            start = time.perf_counter()
+            models = self._fit_stage({
+                "mu_0": (self.outcome_learner, X_c, y_c),
+                "mu_1": (self.outcome_learner, X_t, y_t),
+                "propensity": (self.propensity_learner, X, t),
+            }, executor, budget)
+            self.model_mu_0 = models["mu_0"]
+            self.model_mu_1 = models["mu_1"]
+            self.model_propensity = models["propensity"]
+            self.stage_times_["outcome"] = time.perf_counter() - start
+
+            # pseudo-effects
+            start = time.perf_counter()
+            mu1_on_c = self.model_mu_1.predict_proba(X_c)[:, 1]
+            mu0_on_t = self.model_mu_0.predict_proba(X_t)[:, 1]
+
+            D0 = mu1_on_c - y_c
+            D1 = y_t - mu0_on_t
+            self.stage_times_["pseudo_effects"] = time.perf_counter() - start
+
+            # effect models
+            start = time.perf_counter()
+            models = self._fit_stage({
+                "tau_0": (self.effect_learner, X_c, D0),
+                "tau_1": (self.effect_learner, X_t, D1),
+            }, executor, budget)
+            self.model_tau_0 = models["tau_0"]
+            self.model_tau_1 = models["tau_1"]
+            self.stage_times_["effect"] = time.perf_counter() - start
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
         return self
 
     def predict(self, X):
+        models = (self.model_tau_0, self.model_tau_1, self.model_propensity)
+        if not isinstance(X, Pool) and all(isinstance(m, CatBoost) for m in models):
+            # модели обучены на одних и тех же колонках: X переводится в Pool один раз на все три
+            X = Pool(X, cat_features=self.model_propensity.get_cat_feature_indices())
+
         tau0 = self.model_tau_0.predict(X)
         tau1 = self.model_tau_1.predict(X)
 
@@ -212,7 +303,8 @@ class MyXLearner(BaseEstimator):
         return g * tau0 + (1 - g) * tau1
 
 
-def build_x_learner_catboost(cat_features: List[str]) -> MyXLearner:
+def build_x_learner_catboost(cat_features: List[str], n_jobs: Optional[int] = None,
+                             backend: str = "thread") -> MyXLearner:
     outcome_est = CatBoostClassifier(
         **XL_OUTCOME_CATBOOST_PARAMS,
         cat_features=cat_features,
@@ -230,4 +322,6 @@ def build_x_learner_catboost(cat_features: List[str]) -> MyXLearner:
         outcome_learner=outcome_est,
         effect_learner=effect_est,
         propensity_learner=propensity_est,
+        n_jobs=n_jobs,
+        backend=backend,
     )
@@ -30,13 +30,78 @@ class History(Base):
     __tablename__ = "history"
     
     id = Column(Integer, primary_key=True, index=True)
-    ts = Column(String)
+    ts = Column(String, index=True)
     processing_time = Column(Float)
     input_size = Column(Integer)
     input_tokens = Column(Integer)
-    status_code = Column(Integer)
+    status_code = Column(Integer, index=True)
     input_data = Column(Text)
     output_data = Column(Text)
+    queue_time = Column(Float)
+    compute_time = Column(Float)
+    stage_timings = Column(Text)
+
+class RequestStatsSnapshot(Base):
+    __tablename__ = "request_stats"
+    
+    id = Column(Integer, primary_key=True)
+    updated_ts = Column(String)
+    state = Column(Text)
+
+class ClientProfile(Base):
+    __tablename__ = "client_profiles"
+    
+    client_id = Column(Integer, primary_key=True)
+    age = Column(Float)
+    gender = Column(String)
+    first_issue_date = Column(String)
+    first_redeem_date = Column(String)
+    updated_ts = Column(String)
+
+class ClientAggregate(Base):
+    __tablename__ = "client_aggregates"
+    
+    client_id = Column(Integer, primary_key=True)
+    n_transactions = Column(Integer)
+    purchase_sum_total = Column(Float)
+    purchase_sum_count = Column(Integer)
+    purchase_sum_min = Column(Float)
+    purchase_sum_max = Column(Float)
+    regular_points_received_total = Column(Float)
+    regular_points_received_count = Column(Integer)
+    express_points_received_total = Column(Float)
+    express_points_received_count = Column(Integer)
+    regular_points_spent_total = Column(Float)
+    express_points_spent_total = Column(Float)
+    product_quantity_total = Column(Float)
+    product_quantity_count = Column(Integer)
+    trn_sum_from_iss_total = Column(Float)
+    trn_sum_from_red_total = Column(Float)
+    first_transaction_ts = Column(String)
+    last_transaction_ts = Column(String)
+    updated_ts = Column(String)
+
+class ClientTransaction(Base):
+    __tablename__ = "client_transactions"
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    client_id = Column(Integer, primary_key=True)
+    transaction_id = Column(String, primary_key=True)
+
+class ClientStore(Base):
+    __tablename__ = "client_stores"
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    client_id = Column(Integer, primary_key=True)
+    store_id = Column(String, primary_key=True)
+    n_transactions = Column(Integer)
+
+class ClientProduct(Base):
+    __tablename__ = "client_products"
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    client_id = Column(Integer, primary_key=True)
+    product_id = Column(String, primary_key=True)
 
 class Admin(Base):
     __tablename__ = "admins"
@@ -0,0 +1,31 @@
+"""history ts and status_code indexes
+
+Revision ID: 5b8e2f1a9d3c
+Revises: c296a4967fea
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e2f1a9d3c'
+down_revision: Union[str, Sequence[str], None] = 'c296a4967fea'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # сервис при старте тоже создаёт эти индексы (CREATE INDEX IF NOT EXISTS)
+    op.create_index(op.f('ix_history_ts'), 'history', ['ts'], unique=False, if_not_exists=True)
+    op.create_index(op.f('ix_history_status_code'), 'history', ['status_code'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_history_status_code'), table_name='history')
+    op.drop_index(op.f('ix_history_ts'), table_name='history')
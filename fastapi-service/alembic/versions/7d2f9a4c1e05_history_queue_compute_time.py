@@ -0,0 +1,39 @@
+"""history queue_time and compute_time
+
+Revision ID: 7d2f9a4c1e05
+Revises: e3a7c5f19b82
+Create Date: 2026-10-18 17:05:13.274902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2f9a4c1e05'
+down_revision: Union[str, Sequence[str], None] = 'e3a7c5f19b82'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _history_columns():
+    return {col['name'] for col in sa.inspect(op.get_bind()).get_columns('history')}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # колонки могли уже появиться при старте сервиса (init_db), а в SQLite
+    # нет ADD COLUMN IF NOT EXISTS
+    existing = _history_columns()
+    for name in ('queue_time', 'compute_time'):
+        if name not in existing:
+            op.add_column('history', sa.Column(name, sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('history') as batch_op:
+        batch_op.drop_column('compute_time')
+        batch_op.drop_column('queue_time')
@@ -0,0 +1,34 @@
+"""request_stats snapshot table
+
+Revision ID: 9c41d7e0b2a6
+Revises: 5b8e2f1a9d3c
+Create Date: 2026-10-18 12:40:07.118530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c41d7e0b2a6'
+down_revision: Union[str, Sequence[str], None] = '5b8e2f1a9d3c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('request_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('updated_ts', sa.String(), nullable=True),
+    sa.Column('state', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('request_stats')
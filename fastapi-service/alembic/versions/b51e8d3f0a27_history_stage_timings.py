@@ -0,0 +1,32 @@
+"""history stage_timings
+
+Revision ID: b51e8d3f0a27
+Revises: 7d2f9a4c1e05
+Create Date: 2026-10-18 19:42:37.518206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b51e8d3f0a27'
+down_revision: Union[str, Sequence[str], None] = '7d2f9a4c1e05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # колонку мог уже добавить init_db при старте сервиса
+    existing = {col['name'] for col in sa.inspect(op.get_bind()).get_columns('history')}
+    if 'stage_timings' not in existing:
+        op.add_column('history', sa.Column('stage_timings', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('history') as batch_op:
+        batch_op.drop_column('stage_timings')
@@ -0,0 +1,86 @@
+"""client state tables
+
+Revision ID: e3a7c5f19b82
+Revises: 9c41d7e0b2a6
+Create Date: 2026-10-18 15:22:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a7c5f19b82'
+down_revision: Union[str, Sequence[str], None] = '9c41d7e0b2a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('client_profiles',
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('age', sa.Float(), nullable=True),
+    sa.Column('gender', sa.String(), nullable=True),
+    sa.Column('first_issue_date', sa.String(), nullable=True),
+    sa.Column('first_redeem_date', sa.String(), nullable=True),
+    sa.Column('updated_ts', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('client_id'),
+    if_not_exists=True
+    )
+    op.create_table('client_aggregates',
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('n_transactions', sa.Integer(), nullable=True),
+    sa.Column('purchase_sum_total', sa.Float(), nullable=True),
+    sa.Column('purchase_sum_count', sa.Integer(), nullable=True),
+    sa.Column('purchase_sum_min', sa.Float(), nullable=True),
+    sa.Column('purchase_sum_max', sa.Float(), nullable=True),
+    sa.Column('regular_points_received_total', sa.Float(), nullable=True),
+    sa.Column('regular_points_received_count', sa.Integer(), nullable=True),
+    sa.Column('express_points_received_total', sa.Float(), nullable=True),
+    sa.Column('express_points_received_count', sa.Integer(), nullable=True),
+    sa.Column('regular_points_spent_total', sa.Float(), nullable=True),
+    sa.Column('express_points_spent_total', sa.Float(), nullable=True),
+    sa.Column('product_quantity_total', sa.Float(), nullable=True),
+    sa.Column('product_quantity_count', sa.Integer(), nullable=True),
+    sa.Column('trn_sum_from_iss_total', sa.Float(), nullable=True),
+    sa.Column('trn_sum_from_red_total', sa.Float(), nullable=True),
+    sa.Column('first_transaction_ts', sa.String(), nullable=True),
+    sa.Column('last_transaction_ts', sa.String(), nullable=True),
+    sa.Column('updated_ts', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('client_id'),
+    if_not_exists=True
+    )
+    op.create_table('client_transactions',
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('transaction_id', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('client_id', 'transaction_id'),
+    sqlite_with_rowid=False,
+    if_not_exists=True
+    )
+    op.create_table('client_stores',
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('store_id', sa.String(), nullable=False),
+    sa.Column('n_transactions', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('client_id', 'store_id'),
+    sqlite_with_rowid=False,
+    if_not_exists=True
+    )
+    op.create_table('client_products',
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('client_id', 'product_id'),
+    sqlite_with_rowid=False,
+    if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('client_products')
+    op.drop_table('client_stores')
+    op.drop_table('client_transactions')
+    op.drop_table('client_aggregates')
+    op.drop_table('client_profiles')
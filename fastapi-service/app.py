@@ -1,19 +1,53 @@
 import os
-import pickle
 import sqlite3
 import json
+import asyncio
+import tempfile
+import threading
+import time
 import uvicorn
 import pandas as pd
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone, timedelta
-from fastapi import FastAPI, Request, Response, Header, HTTPException, Depends
+from fastapi import FastAPI, Request, Response, Header, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from utils.inference_feature_extractor import UpliftFeatureExtractorInference
+from utils.model_artifact import load_model
+from utils.fused_scorer import build_fused_scorer
+from utils.scoring import score_clients_batch, score_clients_per_client
+from utils.history_writer import HistoryWriter
+from utils.request_stats import RequestStats
+from utils.client_feature_cache import ClientFeatureCache
+from utils.client_state import init_client_state, ingest, score_clients_from_state
+from utils.arrow_io import ARROW_STREAM_MIME, read_arrow_frames, results_to_arrow
+from utils.streaming import iter_ndjson_batches, score_ndjson_batch
+from utils.micro_batcher import MicroBatcher
+from utils.stage_timing import NULL_TIMER, StageMetrics, StageTimer
+from utils.scoring_pool import (
+    ScoringPool, ScoringOverloaded, ScoringQueueTimeout,
+    init_scoring_worker, ingest_in_worker, score_in_worker, score_ndjson_in_worker, score_state_in_worker,
+)
 import jwt # PyJWT !!!!!!!!!!!!!!! pip show PyJWT чек
 import numpy as np
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    history_writer.start()
+    yield
+    # на остановке дописываем накопленную историю и статистику
+    if micro_batcher is not None:
+        await micro_batcher.stop()
+    scoring_pool.shutdown()
+    history_writer.close()
+    conn = sqlite3.connect(DB_FILE)
+    with conn:
+        request_stats.persist(conn)
+    conn.close()
+
+app = FastAPI(lifespan=lifespan)
 
 security = HTTPBearer()
 
@@ -27,18 +61,70 @@ class AdminUser(BaseModel):
     username: str
     password: str
 
-try:
-    with open("data/model.pkl", "rb") as f:
-        loaded = pickle.load(f)
-    model = loaded["model"]
-    feature_names = loaded["feature_names"]
-except FileNotFoundError:
-    model = None
-    feature_names = []
-
-fe = UpliftFeatureExtractorInference(drop_redundant=True)
-
-DB_FILE = "data/uplift-modeling.db"
+# модель грузится лениво при первом запросе: сначала ищется mmap-артефакт
+# (python -m utils.model_artifact data/model.pkl data/model_artifact), иначе pickle
+MODEL_ARTIFACT_DIR = os.getenv("MODEL_ARTIFACT_DIR", "data/model_artifact")
+MODEL_PICKLE_PATH = os.getenv("MODEL_PATH", "data/model.pkl")
+# 1 - предсказывать свёрнутым NumPy-скорером (float32), 0 - исходной моделью
+FUSED_SCORER = os.getenv("FUSED_SCORER", "1") == "1"
+
+model = None
+feature_names = []
+_model_lock = threading.Lock()
+
+def get_model():
+    global model, feature_names
+    if model is None:
+        with _model_lock:
+            if model is None:
+                loaded_model, loaded_features, preprocessing = load_model(MODEL_ARTIFACT_DIR, MODEL_PICKLE_PATH)
+                if FUSED_SCORER and loaded_model is not None:
+                    loaded_model = build_fused_scorer(loaded_model, loaded_features)
+                # статистики возраста с обучения; у старых моделей их нет - считаются по батчу
+                fe.set_preprocessing(preprocessing)
+                feature_names = loaded_features
+                model = loaded_model
+    return model
+
+# FEATURES_LOW_MEMORY=1 - признаки без копий датафреймов и в компактных типах
+FEATURES_LOW_MEMORY = os.getenv("FEATURES_LOW_MEMORY", "0") == "1"
+fe = UpliftFeatureExtractorInference(drop_redundant=True, low_memory=FEATURES_LOW_MEMORY)
+
+# batch - один calculate_features и один predict на весь запрос,
+# per_client - старый поштучный режим
+SCORING_MODE = os.getenv("SCORING_MODE", "batch")
+
+# кэш признаков повторно присылаемых клиентов (batch-режим); FEATURE_CACHE_SIZE=0 - выключен
+FEATURE_CACHE_SIZE = int(os.getenv("FEATURE_CACHE_SIZE", "100000"))
+feature_cache = None
+if FEATURE_CACHE_SIZE > 0:
+    feature_cache = ClientFeatureCache(
+        max_entries=FEATURE_CACHE_SIZE,
+        ttl_seconds=float(os.getenv("FEATURE_CACHE_TTL", "3600")),
+        max_bytes=int(float(os.getenv("FEATURE_CACHE_MAX_MB", "256")) * 1024 * 1024),
+    )
+
+# /forward/stream: клиентов в микробатче и сколько байт тела держать в памяти (дальше - на диске)
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+STREAM_SPOOL_BYTES = int(os.getenv("STREAM_SPOOL_BYTES", str(16 * 1024 * 1024)))
+
+# пул для CPU-части скоринга: thread | process, ограничение одновременных задач и очереди
+SCORING_POOL = os.getenv("SCORING_POOL", "thread")
+scoring_pool = ScoringPool(
+    kind=SCORING_POOL,
+    max_workers=int(os.getenv("SCORING_WORKERS", "2")),
+    max_queue=int(os.getenv("SCORING_QUEUE_SIZE", "32")),
+    queue_timeout=float(os.getenv("SCORING_QUEUE_TIMEOUT", "30")),
+    initializer=init_scoring_worker,
+    initargs=(MODEL_ARTIFACT_DIR, MODEL_PICKLE_PATH, FUSED_SCORER, FEATURES_LOW_MEMORY),
+)
+
+# поэтапное время /forward (parse, dataframe, queue, features, predict, serialize, log):
+# пишется в history.stage_timings и в /metrics; STAGE_TIMINGS=0 - без замеров
+STAGE_TIMINGS = os.getenv("STAGE_TIMINGS", "1") == "1"
+stage_metrics = StageMetrics()
+
+DB_FILE = os.getenv("DB_FILE", "data/uplift-modeling.db")
 
 def init_db():
     conn = sqlite3.connect(DB_FILE)
@@ -52,9 +138,17 @@ def init_db():
             input_tokens INTEGER,
             status_code INTEGER,
             input_data TEXT,
-            output_data TEXT
+            output_data TEXT,
+            queue_time REAL,
+            compute_time REAL,
+            stage_timings TEXT
         )
     """)
+    # БД, созданная до появления колонок времени очереди/вычисления и этапов
+    history_columns = {row[1] for row in cur.execute("PRAGMA table_info(history)")}
+    for col, col_type in (("queue_time", "REAL"), ("compute_time", "REAL"), ("stage_timings", "TEXT")):
+        if col not in history_columns:
+            cur.execute(f"ALTER TABLE history ADD COLUMN {col} {col_type}")
     cur.execute("""
         CREATE TABLE IF NOT EXISTS admins (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -62,31 +156,52 @@ def init_db():
             password_hash TEXT
         )
     """)
+    # индексы под фильтры /history (те же, что создаёт миграция alembic)
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_history_ts ON history (ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_history_status_code ON history (status_code)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS request_stats (
+            id INTEGER PRIMARY KEY,
+            updated_ts TEXT,
+            state TEXT
+        )
+    """)
+    # накопленное состояние клиентов для скоринга по client_id
+    init_client_state(conn)
+    # WAL: чтение /history и /stats не блокирует фоновую запись
+    cur.execute("PRAGMA journal_mode=WAL")
     conn.commit()
     conn.close()
 
 init_db()
 
-def log_request_to_db(input_data, output_data, status, processing_time: float, input_size: int, input_tokens: int):
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO history (ts, processing_time, input_size, input_tokens, status_code, input_data, output_data) 
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            datetime.now().isoformat(),
-            processing_time,
-            input_size,
-            input_tokens,
-            status,
-            json.dumps(input_data, ensure_ascii=False),
-            json.dumps(output_data, ensure_ascii=False)
-        ))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Ошибка логирования: {e}")
+# агрегаты для /stats, обновляются при записи истории
+request_stats = RequestStats(
+    persist_interval=float(os.getenv("STATS_PERSIST_INTERVAL", "5")),
+    window_seconds=int(os.getenv("STATS_WINDOW_SECONDS", "3600")),
+    max_windows=int(os.getenv("STATS_MAX_WINDOWS", "48")),
+)
+_stats_conn = sqlite3.connect(DB_FILE)
+request_stats.load(_stats_conn)
+_stats_conn.close()
+
+history_writer = HistoryWriter(
+    DB_FILE,
+    batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "200")),
+    flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5")),
+    max_queue_size=int(os.getenv("HISTORY_QUEUE_SIZE", "10000")),
+    overflow=os.getenv("HISTORY_OVERFLOW", "drop_oldest"),
+    on_write=request_stats.record_rows,
+)
+
+def log_request_to_db(input_data, output_data, status, processing_time: float, input_size: int, input_tokens: int,
+                      queue_time: Optional[float] = None, compute_time: Optional[float] = None,
+                      stage_timings: Optional[dict] = None):
+    """Ставит строку истории в очередь фоновой записи, не блокируя обработчик"""
+    history_writer.put(
+        input_data, output_data, status, processing_time, input_size, input_tokens, queue_time, compute_time,
+        stage_timings,
+    )
 
 def verify_token(token: str) -> bool:
     """Проверяет JWT токен"""
@@ -150,63 +265,287 @@ async def admin_login(user: AdminUser):
 
     return {"access_token": token, "token_type": "bearer"}
 
+def _score_frames(client_df, purchases_df, timed=False):
+    """(результаты, этапы {features, predict}) - как score_in_worker в пуле процессов"""
+    model = get_model()
+    timer = StageTimer() if timed else NULL_TIMER
+    if SCORING_MODE == "per_client":
+        results = score_clients_per_client(fe, model, client_df, purchases_df, timer)
+    else:
+        results = score_clients_batch(fe, model, client_df, purchases_df, feature_cache, timer)
+    return results, timer.stages
+
+async def run_scoring(client_df, purchases_df, admit=True):
+    """Скоринг в пуле: (результаты, queue_time, compute_time, этапы скоринга)"""
+    if scoring_pool.kind == "process":
+        fn = score_in_worker
+        args = (SCORING_MODE, client_df, purchases_df, STAGE_TIMINGS)
+    else:
+        fn = _score_frames
+        args = (client_df, purchases_df, STAGE_TIMINGS)
+    (results, stages), queue_time, compute_time = await scoring_pool.run(fn, *args, admit=admit)
+    return results, queue_time, compute_time, stages
+
+# микробатчинг конкурентных /forward (batch-режим), включается MICRO_BATCH_MAX_WAIT_MS > 0:
+# одиночный запрос ждёт попутные до этого времени даже без нагрузки
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "0"))
+micro_batcher = None
+if MICRO_BATCH_MAX_WAIT_MS > 0 and SCORING_MODE == "batch":
+    micro_batcher = MicroBatcher(
+        run_scoring,
+        max_wait=MICRO_BATCH_MAX_WAIT_MS / 1000,
+        max_clients=int(os.getenv("MICRO_BATCH_MAX_CLIENTS", "256")),
+        max_queue=int(os.getenv("MICRO_BATCH_QUEUE_SIZE", "1024")),
+    )
+
+def _overloaded_response(error, start_time, input_data, input_size, input_tokens, timer=NULL_TIMER):
+    """429 - очередь пула полна, 503 - не дождались воркера"""
+    status = 429 if isinstance(error, ScoringOverloaded) else 503
+    _log_forward(timer, input_data, {"error": str(error)}, status, start_time, input_size, input_tokens)
+    return Response(str(error), status_code=status, headers={"Retry-After": "1"})
+
+def _log_forward(timer, input_data, output_data, status, start_time, input_size, input_tokens,
+                 queue_time=None, compute_time=None):
+    """Строка истории /forward с этапами и их учёт в /metrics (этап log - только в метриках)"""
+    processing_time = (datetime.now() - start_time).total_seconds()
+    stages = dict(timer.stages) or None
+    with timer.stage("log"):
+        log_request_to_db(
+            input_data, output_data, status, processing_time, input_size, input_tokens,
+            queue_time, compute_time, stages,
+        )
+    # без замеров (NULL_TIMER) учитывается только счётчик запросов
+    stage_metrics.observe("/forward", status, timer.stages)
+
+def _is_arrow(content_type: Optional[str]) -> bool:
+    return bool(content_type) and ARROW_STREAM_MIME in content_type.lower()
+
 @app.post("/forward")
 async def forward(request: Request):
     start_time = datetime.now()
+    timer = StageTimer() if STAGE_TIMINGS else NULL_TIMER
+
+    if _is_arrow(request.headers.get("content-type")):
+        # Arrow IPC: два потока подряд (client, purchases), без разбора JSON
+        with timer.stage("parse"):
+            body = await request.body()
+        input_size = len(body)
+        input_tokens = 0
+        try:
+            with timer.stage("dataframe"):
+                client_df, purchases_df = read_arrow_frames(body)
+            input_data = {"format": "arrow", "client_rows": len(client_df), "purchases_rows": len(purchases_df)}
+        except ImportError:
+            _log_forward(timer, {}, {"error": "pyarrow is not installed"}, 415, start_time, input_size, 0)
+            return Response("Arrow format is not supported: pyarrow is not installed", status_code=415)
+        except Exception:
+            _log_forward(timer, {}, {"error": "Arrow parse error"}, 400, start_time, input_size, 0)
+            return Response("bad request", status_code=400)
+    else:
+        # читаем JSON и считаем размеры
+        try:
+            with timer.stage("parse"):
+                data = await request.json()
+                input_data = data
+                raw = json.dumps(data, ensure_ascii=False)
+                input_size = len(raw.encode("utf-8"))
+                input_tokens = len(raw.split())
+        except Exception:
+            _log_forward(timer, {}, {"error": "JSON parse error"}, 400, start_time, 0, 0)
+            return Response("bad request", status_code=400)
 
-    # читаем JSON и считаем размеры
-    try:
-        data = await request.json()
-        input_data = data
-        raw = json.dumps(data, ensure_ascii=False)
-        input_size = len(raw.encode("utf-8"))
-        input_tokens = len(raw.split())
-    except Exception:
-        processing_time = (datetime.now() - start_time).total_seconds()
-        log_request_to_db({}, {"error": "JSON parse error"}, 400, processing_time, 0, 0)
-        return Response("bad request", status_code=400)
+        try:
+            with timer.stage("dataframe"):
+                client_df = pd.DataFrame(data["client"])
+                purchases_df = pd.DataFrame(data["purchases"])
+        except Exception:
+            client_df = purchases_df = None
 
     # базовая проверка структуры
     try:
-        client_df = pd.DataFrame(data["client"])
-        purchases_df = pd.DataFrame(data["purchases"])
-
+        if client_df is None or purchases_df is None:
+            raise ValueError("client and purchases are required")
         if "client_id" not in client_df.columns or "client_id" not in purchases_df.columns:
             raise ValueError("client_id is required")
 
     except Exception:
-        processing_time = (datetime.now() - start_time).total_seconds()
-        log_request_to_db(
+        _log_forward(timer, input_data, {"error": "Invalid data structure"}, 400, start_time, input_size, input_tokens)
+        return Response("bad request", status_code=400)
+
+    # скоринг клиентов - в пуле, event loop при этом обслуживает другие запросы
+    try:
+        if micro_batcher is not None:
+            results, queue_time, compute_time, stages = await micro_batcher.submit(client_df, purchases_df)
+        else:
+            results, queue_time, compute_time, stages = await run_scoring(client_df, purchases_df)
+        timer.add("queue", queue_time)
+        timer.update(stages)
+
+        response_body = {"uplift": results}
+        with timer.stage("serialize"):
+            if _is_arrow(request.headers.get("accept")):
+                response = Response(results_to_arrow(results), media_type=ARROW_STREAM_MIME)
+            else:
+                # тот же JSON, что отдал бы FastAPI, но сериализация попадает в замер
+                response = JSONResponse(response_body)
+
+        _log_forward(
+            timer, input_data, response_body, 200, start_time, input_size, input_tokens, queue_time, compute_time
+        )
+        return response
+
+    except (ScoringOverloaded, ScoringQueueTimeout) as e:
+        return _overloaded_response(e, start_time, input_data, input_size, input_tokens, timer)
+
+    except Exception as e: 
+        _log_forward(
+            timer,
             input_data,
-            {"error": "Invalid data structure"},
-            400,
-            processing_time,
+            {"error": "Model processing failed", "details": str(e)},
+            403,
+            start_time,
             input_size,
             input_tokens,
         )
+        return Response("Модель не смогла обработать данные", status_code=403)
+
+@app.post("/forward/stream")
+async def forward_stream(request: Request):
+    """
+    NDJSON: строка запроса - {"client": {...}, "purchases": [...]}, строка ответа -
+    {"client_id", "uplift"}. Скоринг микробатчами по STREAM_BATCH_SIZE клиентов
+    """
+    start_time = datetime.now()
+
+    # uvicorn (ASGI 2.3) не даёт читать тело, пока отдаётся StreamingResponse,
+    # поэтому тело сначала сбрасывается во временный файл - память не растёт с размером запроса
+    spool = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_BYTES)
+    input_size = 0
+    async for chunk in request.stream():
+        spool.write(chunk)
+        input_size += len(chunk)
+    spool.seek(0)
+
+    # загрузка модели и разбор строк - не в event loop: большой запрос не задерживает остальные
+    model = await asyncio.to_thread(get_model) if scoring_pool.kind == "thread" else None
+    batches = iter_ndjson_batches(spool, STREAM_BATCH_SIZE)
+
+    async def generate():
+        lines_total, scored, errors = 0, 0, 0
+        try:
+            while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+                clients, purchases, parse_errors = batch
+                # микробатчи уже принятого запроса ждут воркер без отказа по очереди
+                if scoring_pool.kind == "process":
+                    (lines, n), _, _ = await scoring_pool.run(
+                        score_ndjson_in_worker, clients, purchases, admit=False
+                    )
+                else:
+                    (lines, n), _, _ = await scoring_pool.run(
+                        score_ndjson_batch, fe, model, clients, purchases, feature_cache, admit=False
+                    )
+                lines_total += len(clients) + len(parse_errors)
+                scored += n
+                errors += len(parse_errors) + (len(lines) - n)
+                if parse_errors or lines:
+                    yield "".join(parse_errors + lines)
+        finally:
+            spool.close()
+            processing_time = (datetime.now() - start_time).total_seconds()
+            log_request_to_db(
+                {"format": "ndjson", "lines": lines_total},
+                {"scored": scored, "errors": errors},
+                200,
+                processing_time,
+                input_size,
+                0,
+            )
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+def _ingest_clients(client_df, purchases_df):
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        return ingest(conn, fe, client_df, purchases_df)
+    finally:
+        conn.close()
+
+def _score_known_clients(client_ids):
+    model = get_model()
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        return score_clients_from_state(conn, fe, model, client_ids, feature_names)
+    finally:
+        conn.close()
+
+@app.post("/clients/ingest")
+async def ingest_clients(request: Request):
+    """
+    Добавить в состояние клиентов профили ("client", необязательно) и только новые
+    покупки ("purchases"). Уже учтённые транзакции пропускаются
+    """
+    try:
+        data = await request.json()
+        client_df = pd.DataFrame(data.get("client") or [])
+        purchases_df = pd.DataFrame(data.get("purchases") or [])
+        if len(client_df) and "client_id" not in client_df.columns:
+            raise ValueError("client_id is required")
+        if len(purchases_df) and not {"client_id", "transaction_id"} <= set(purchases_df.columns):
+            raise ValueError("client_id and transaction_id are required")
+    except Exception:
         return Response("bad request", status_code=400)
 
-    # поштучная обработка клиентов
+    # агрегаты покупок - та же CPU-работа, что и скоринг: пул с его очередью и отказами
     try:
-        results = []
+        if scoring_pool.kind == "process":
+            summary, _, _ = await scoring_pool.run(ingest_in_worker, DB_FILE, client_df, purchases_df)
+        else:
+            summary, _, _ = await scoring_pool.run(_ingest_clients, client_df, purchases_df)
+    except (ScoringOverloaded, ScoringQueueTimeout) as e:
+        status = 429 if isinstance(e, ScoringOverloaded) else 503
+        return Response(str(e), status_code=status, headers={"Retry-After": "1"})
+    except Exception as e:
+        return Response(f"ingest failed: {e}", status_code=400)
+    return {"status": "ok", **summary}
 
-        for cid, one_client_rows in client_df.groupby("client_id"):
-            one_client_df = one_client_rows.iloc[[0]].copy()
-            one_pur_df = purchases_df[purchases_df["client_id"] == cid].copy()
-            
-            df_feat = fe.calculate_features(one_client_df, one_pur_df)
-            X = df_feat[fe.feature_names].copy()
+@app.post("/forward/clients")
+async def forward_known_clients(request: Request):
+    """Скоринг по client_id из накопленного состояния: {"client_ids": [...]}"""
+    start_time = datetime.now()
 
-            u = float(model.predict(X)[0])
-            results.append({"client_id": int(cid), "uplift": u})
+    try:
+        data = await request.json()
+        input_data = data
+        raw = json.dumps(data, ensure_ascii=False)
+        input_size = len(raw.encode("utf-8"))
+        input_tokens = len(raw.split())
+        client_ids = [int(cid) for cid in data["client_ids"]]
+    except Exception:
+        processing_time = (datetime.now() - start_time).total_seconds()
+        log_request_to_db({}, {"error": "Invalid data structure"}, 400, processing_time, 0, 0)
+        return Response("bad request", status_code=400)
 
-        response_body = {"uplift": results}
+    try:
+        if scoring_pool.kind == "process":
+            (results, unknown), queue_time, compute_time = await scoring_pool.run(
+                score_state_in_worker, DB_FILE, client_ids
+            )
+        else:
+            (results, unknown), queue_time, compute_time = await scoring_pool.run(
+                _score_known_clients, client_ids
+            )
+        response_body = {"uplift": results, "unknown_client_ids": unknown}
 
         processing_time = (datetime.now() - start_time).total_seconds()
-        log_request_to_db(input_data, response_body, 200, processing_time, input_size, input_tokens)
+        log_request_to_db(
+            input_data, response_body, 200, processing_time, input_size, input_tokens, queue_time, compute_time
+        )
         return response_body
 
-    except Exception as e: 
+    except (ScoringOverloaded, ScoringQueueTimeout) as e:
+        return _overloaded_response(e, start_time, input_data, input_size, input_tokens)
+
+    except Exception as e:
         processing_time = (datetime.now() - start_time).total_seconds()
 
         log_request_to_db(
@@ -220,47 +559,101 @@ async def forward(request: Request):
         return Response("Модель не смогла обработать данные", status_code=403)
 
 # GET-запрос /history
+HISTORY_LIGHT_COLUMNS = (
+    "id, ts, processing_time, queue_time, compute_time, stage_timings, input_size, input_tokens, status_code"
+)
+
+def _to_db_ts(value: datetime) -> str:
+    """ts в таблице хранится как локальное время в isoformat без таймзоны"""
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat()
+
 @app.get("/history", dependencies=[Depends(get_current_admin)])
-async def get_history():
+async def get_history(
+    response: Response,
+    before_id: Optional[int] = Query(None, description="вернуть записи с id меньше этого (keyset-пагинация)"),
+    limit: int = Query(100, ge=1, le=1000),
+    ts_from: Optional[datetime] = Query(None, description="ts >= ts_from"),
+    ts_to: Optional[datetime] = Query(None, description="ts < ts_to"),
+    status_code: Optional[int] = None,
+    include_payload: bool = Query(True, description="false - без input/output, дешёвый листинг"),
+):
+    # фильтры опираются на индексы ix_history_ts / ix_history_status_code и первичный ключ
+    where, params = [], []
+    if before_id is not None:
+        where.append("id < ?")
+        params.append(before_id)
+    if ts_from is not None:
+        where.append("ts >= ?")
+        params.append(_to_db_ts(ts_from))
+    if ts_to is not None:
+        where.append("ts < ?")
+        params.append(_to_db_ts(ts_to))
+    if status_code is not None:
+        where.append("status_code = ?")
+        params.append(status_code)
+
+    columns = "*" if include_payload else HISTORY_LIGHT_COLUMNS
+    query = f"SELECT {columns} FROM history"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+
     conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row
     cur = conn.cursor()
-    cur.execute("SELECT * FROM history ORDER BY id DESC")
+    cur.execute(query, params)
     rows = cur.fetchall()
-    
+    conn.close()
+
     history = []
     for row in rows:
-        try:
-            inp = json.loads(row["input_data"])
-        except:
-            inp = row["input_data"]
-            
-        try:
-            out = json.loads(row["output_data"])
-        except:
-            out = row["output_data"]
-
-        history.append({
+        item = {
             "id": row["id"],
             "timestamp": row["ts"],
             "processing_time": row["processing_time"],
+            "queue_time": row["queue_time"],
+            "compute_time": row["compute_time"],
+            "stage_timings": json.loads(row["stage_timings"]) if row["stage_timings"] else None,
             "input_size": row["input_size"],
             "input_tokens": row["input_tokens"],
-            "input": inp,
-            "output": out,
-            "status": row["status_code"]
-        })
-    
-    conn.close()
+        }
+
+        if include_payload:
+            try:
+                inp = json.loads(row["input_data"])
+            except:
+                inp = row["input_data"]
+
+            try:
+                out = json.loads(row["output_data"])
+            except:
+                out = row["output_data"]
+
+            item["input"] = inp
+            item["output"] = out
+
+        item["status"] = row["status_code"]
+        history.append(item)
+
+    # курсор для следующей страницы: передать его как before_id
+    if len(history) == limit:
+        response.headers["X-Next-Before-Id"] = str(history[-1]["id"])
+
     return history
 
 # DELETE-запрос /history
 @app.delete("/history", dependencies=[Depends(get_current_admin)])
 async def clear_history():
+    # сначала дописываем очередь, чтобы старые строки не появились после очистки
+    await asyncio.to_thread(history_writer.flush)
     conn = sqlite3.connect(DB_FILE)
     cur = conn.cursor()
     cur.execute("DELETE FROM history")
     cur.execute("DELETE FROM sqlite_sequence WHERE name='history'")
+    request_stats.reset(conn)
     conn.commit()
     conn.close()
     
@@ -268,50 +661,54 @@ async def clear_history():
 
 @app.get("/stats", dependencies=[Depends(get_current_admin)])
 async def get_stats():
-    """Статистика запросов: время обработки, квантили, характеристики входных данных"""
-    conn = sqlite3.connect(DB_FILE)
-    
-    # Статистика времени обработки
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT processing_time, input_size, input_tokens 
-        FROM history 
-        WHERE processing_time IS NOT NULL AND processing_time > 0
-    """)
-    rows = cur.fetchall()
-    conn.close()
-    
-    if not rows:
-        return {"error": "No processing data available"}
-    
-    times = [row[0] for row in rows]
-    input_sizes = [row[1] for row in rows if row[1]]
-    input_token_counts = [row[2] for row in rows if row[2]]
-    
-    stats = {
-        "processing_time": {
-            "mean": float(np.mean(times)),
-            "p50": float(np.percentile(times, 50)),
-            "p95": float(np.percentile(times, 95)),
-            "p99": float(np.percentile(times, 99)),
-            "count": len(times),
-            "total": float(np.sum(times)),
-        },
-        "input_characteristics": {
-            "input_size_bytes": {
-                "mean": float(np.mean(input_sizes)) if input_sizes else 0.0,
-                "total": float(np.sum(input_sizes)) if input_sizes else 0.0,
-                "count": len(input_sizes),
-            },
-            "input_tokens": {
-                "mean": float(np.mean(input_token_counts)) if input_token_counts else 0.0,
-                "total": float(np.sum(input_token_counts)) if input_token_counts else 0.0,
-                "count": len(input_token_counts),
-            },
-        },
-    }
-    
+    """Статистика запросов: время обработки, квантили, характеристики входных данных,
+    разбивка по статусам и временным окнам. Считается инкрементально при записи
+    истории (квантили - по DDSketch с точностью ~1%), а не перечитыванием таблицы"""
+    stats = request_stats.summary()
+    stats["scoring_pool"] = scoring_pool.stats()
+    if micro_batcher is not None:
+        stats["micro_batching"] = micro_batcher.stats()
+    if feature_cache is not None:
+        stats["feature_cache"] = feature_cache.stats()
     return stats
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Метрики в текстовом формате Prometheus: гистограммы этапов /forward
+    (uplift_request_stage_seconds), счётчики запросов по статусам и состояние
+    пула скоринга, очереди истории и кэша признаков
+    """
+    pool = scoring_pool.stats()
+    gauges = {
+        "scoring_pool_pending": pool["pending"],
+        "history_queue_size": history_writer.queue_size,
+    }
+    counters = {
+        "scoring_pool_rejected_total": pool["rejected"],
+        "scoring_pool_timed_out_total": pool["timed_out"],
+        "history_written_total": history_writer.written,
+        "history_dropped_total": history_writer.dropped,
+    }
+    if feature_cache is not None:
+        cache = feature_cache.stats()
+        gauges.update(feature_cache_entries=cache["entries"], feature_cache_bytes=cache["bytes"])
+        counters.update(feature_cache_hits_total=cache["hits"], feature_cache_misses_total=cache["misses"])
+    if micro_batcher is not None:
+        gauges["micro_batch_queued"] = micro_batcher.stats()["queued"]
+        counters["micro_batches_total"] = micro_batcher.batches
+        counters["micro_batch_rejected_total"] = micro_batcher.rejected
+    return PlainTextResponse(stage_metrics.render(gauges, counters), media_type="text/plain; version=0.0.4")
+
+# DELETE-запрос /cache
+@app.delete("/cache", dependencies=[Depends(get_current_admin)])
+async def clear_feature_cache(
+    client_id: Optional[List[int]] = Query(None, description="только эти клиенты; без параметра - весь кэш"),
+):
+    if feature_cache is None:
+        return {"status": "ok", "message": "Feature cache is disabled", "removed": 0}
+    removed = feature_cache.invalidate(client_id)
+    return {"status": "ok", "message": "Feature cache cleared", "removed": removed}
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Бенчмарк мод в generate_behavioral_features: старые groupby(...).agg(lambda x: x.mode()[0])
+и value_counts() против подсчёта пар (client_id, значение) + idxmax.
+
+    python -m benchmarks.bench_behavioral_features --rows 45000000
+
+Проверяет, что результаты совпадают, и печатает время обоих вариантов.
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic_x5 import generate_x5
+from utils.feature_extraction import UpliftFeatureExtractor
+
+
+def legacy_mode_features(unique_trans):
+    """Исходная реализация на Python-лямбдах"""
+    features = {}
+    features['most_frequent_weekday'] = unique_trans.groupby('client_id')['transaction_weekday'].agg(
+        lambda x: x.mode()[0] if len(x.mode()) > 0 else -1
+    )
+    features['most_frequent_hour'] = unique_trans.groupby('client_id')['transaction_hour'].agg(
+        lambda x: x.mode()[0] if len(x.mode()) > 0 else -1
+    )
+    client_trans = unique_trans.groupby('client_id')
+    features['most_frequent_store'] = client_trans['store_id'].agg(
+        lambda x: x.mode()[0] if len(x.mode()) > 0 else -1
+    )
+    features['store_loyalty_ratio'] = client_trans['store_id'].agg(
+        lambda x: x.value_counts().iloc[0] / len(x) if len(x) > 0 else 0
+    )
+    return pd.DataFrame(features)
+
+
+def vectorized_mode_features(extractor, unique_trans):
+    """Новая реализация (та же логика, что в generate_behavioral_features)"""
+    features = {}
+    client_trans = unique_trans.groupby('client_id')
+    clients_index = client_trans.size().index
+    weekday_mode, _ = extractor.group_mode(unique_trans, 'client_id', 'transaction_weekday')
+    hour_mode, _ = extractor.group_mode(unique_trans, 'client_id', 'transaction_hour')
+    store_mode, store_mode_count = extractor.group_mode(unique_trans, 'client_id', 'store_id')
+    features['most_frequent_weekday'] = weekday_mode.reindex(clients_index, fill_value=-1)
+    features['most_frequent_hour'] = hour_mode.reindex(clients_index, fill_value=-1)
+    features['most_frequent_store'] = store_mode.reindex(clients_index, fill_value=-1)
+    features['store_loyalty_ratio'] = store_mode_count.reindex(clients_index, fill_value=0) / client_trans.size()
+    return pd.DataFrame(features)
+
+
+def prepare_unique_trans(purchases):
+    unique_trans = purchases[['client_id', 'transaction_id', 'transaction_datetime', 'store_id']]
+    unique_trans = unique_trans.drop_duplicates('transaction_id').copy()
+    unique_trans['transaction_datetime'] = pd.to_datetime(unique_trans['transaction_datetime'])
+    unique_trans['transaction_weekday'] = unique_trans['transaction_datetime'].dt.dayofweek
+    unique_trans['transaction_hour'] = unique_trans['transaction_datetime'].dt.hour
+    return unique_trans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2_000_000, help="строк в синтетической purchases")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-legacy", action="store_true", help="не запускать старую реализацию")
+    args = parser.parse_args()
+
+    data = generate_x5(args.rows, seed=args.seed)
+    purchases = data["purchases"]
+    unique_trans = prepare_unique_trans(purchases)
+    print(f"purchases: {len(purchases):,} строк, транзакций: {len(unique_trans):,}, "
+          f"клиентов: {unique_trans['client_id'].nunique():,}")
+
+    extractor = UpliftFeatureExtractor()
+
+    start = time.perf_counter()
+    new = vectorized_mode_features(extractor, unique_trans)
+    new_time = time.perf_counter() - start
+    print(f"vectorized: {new_time:.2f} s")
+
+    if not args.skip_legacy:
+        start = time.perf_counter()
+        old = legacy_mode_features(unique_trans)
+        old_time = time.perf_counter() - start
+        print(f"legacy:     {old_time:.2f} s  (x{old_time / new_time:.1f})")
+        pd.testing.assert_frame_equal(new, old, check_dtype=False)
+        print("результаты совпадают")
+
+    # весь generate_behavioral_features целиком
+    processed = extractor.preprocess_purchases(purchases)
+    start = time.perf_counter()
+    extractor.generate_behavioral_features(processed)
+    print(f"generate_behavioral_features: {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
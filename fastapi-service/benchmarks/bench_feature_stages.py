@@ -0,0 +1,209 @@
+"""
+Бенчмарк этапов UpliftFeatureExtractor.calculate_features: время и память каждого
+этапа на синтетических данных X5 нескольких масштабов.
+
+    python -m benchmarks.bench_feature_stages --rows 100000,1000000 --out stages.json
+    python -m benchmarks.bench_feature_stages --rows 1000000 --low-memory --repeat 5
+
+Этапы - методы экстрактора, которые вызывает calculate_features: preprocess_clients,
+preprocess_purchases, generate_behavioral_features, generate_static_features,
+create_business_features, remove_redundant_features, sanitize_features.
+Методы оборачиваются на экземпляре, а сам calculate_features вызывается как есть,
+поэтому меряется именно рабочий путь; остальное (join демографии и т.п.) - этап other.
+
+Время - медиана по --repeat прогонам без tracemalloc. Память - отдельным прогоном
+под tracemalloc: peak_mb - пик сверх памяти на входе в этап, retained_mb - сколько
+осталось занято после него (результат этапа). Отчёт - JSON.
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_x5 import generate_x5
+from utils.feature_extraction import UpliftFeatureExtractor
+
+STAGES = (
+    "preprocess_clients",
+    "preprocess_purchases",
+    "generate_behavioral_features",
+    "generate_static_features",
+    "create_business_features",
+    "remove_redundant_features",
+    "sanitize_features",
+)
+
+MB = 1024 * 1024
+
+
+def instrument(extractor, record, trace_memory=False):
+    """
+    Обернуть этапы extractor: record[stage] = {"seconds", ...} за последний вызов,
+    с trace_memory - ещё пик/остаток памяти этапа и общий пик record["total_peak_mb"]
+    """
+    for stage in STAGES:
+        method = getattr(extractor, stage)
+
+        @functools.wraps(method)
+        def wrapper(*args, _method=method, _stage=stage, **kwargs):
+            if trace_memory:
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+            start = time.perf_counter()
+            result = _method(*args, **kwargs)
+            entry = {"seconds": time.perf_counter() - start}
+            if trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                entry["peak_mb"] = (peak - before) / MB
+                entry["retained_mb"] = (current - before) / MB
+                # reset_peak сбрасывает и общий пик - копим его по этапам
+                record["total_peak_mb"] = max(record.get("total_peak_mb", 0.0), peak / MB)
+            record[_stage] = entry
+            return result
+
+        setattr(extractor, stage, wrapper)
+
+
+def run_once(data, low_memory, trace_memory=False):
+    """Один calculate_features. Возвращает (этапы, полное время, форма результата)"""
+    extractor = UpliftFeatureExtractor(drop_redundant=True, low_memory=low_memory)
+    record = {}
+    instrument(extractor, record, trace_memory)
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        df = extractor.calculate_features(
+            clients_df=data["clients"],
+            train_df=data["train"],
+            treatment_df=data["treatment"],
+            target_df=data["target"],
+            purchases_df=data["purchases"],
+        )
+        total = time.perf_counter() - start
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / MB
+            record["total_peak_mb"] = max(record.get("total_peak_mb", 0.0), peak)
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    return record, total, df.shape
+
+
+def bench_scale(n_rows, args):
+    data = generate_x5(n_rows, seed=args.seed, string_ids=not args.int_ids)
+    purchases = data["purchases"]
+    scale = {
+        "rows": len(purchases),
+        "clients": len(data["clients"]),
+        "transactions": int(purchases["transaction_id"].nunique()),
+        "purchases_mb": purchases.memory_usage(deep=True).sum() / MB,
+        "low_memory": args.low_memory,
+    }
+
+    timings = {stage: [] for stage in STAGES}
+    totals = []
+    for _ in range(args.repeat):
+        record, total, shape = run_once(data, args.low_memory)
+        totals.append(total)
+        for stage in STAGES:
+            timings[stage].append(record[stage]["seconds"])
+
+    memory = {}
+    if not args.skip_memory:
+        memory, _, _ = run_once(data, args.low_memory, trace_memory=True)
+
+    stages = []
+    for stage in STAGES:
+        row = {
+            "stage": stage,
+            "seconds": float(np.median(timings[stage])),
+            "seconds_min": float(np.min(timings[stage])),
+        }
+        if stage in memory:
+            row["peak_mb"] = memory[stage]["peak_mb"]
+            row["retained_mb"] = memory[stage]["retained_mb"]
+        stages.append(row)
+
+    total = float(np.median(totals))
+    stages.append({"stage": "other", "seconds": max(total - sum(row["seconds"] for row in stages), 0.0)})
+    for row in stages:
+        row["share"] = row["seconds"] / total
+
+    scale.update(
+        features_shape=list(shape),
+        total_seconds=total,
+        total_peak_mb=memory.get("total_peak_mb"),
+        stages=stages,
+    )
+    return scale
+
+
+def print_scale(scale):
+    print(f"\n{scale['rows']:,} строк purchases, {scale['clients']:,} клиентов, "
+          f"{scale['transactions']:,} транзакций (low_memory={scale['low_memory']}): "
+          f"{scale['total_seconds']:.2f} s"
+          + (f", пик {scale['total_peak_mb']:.0f} МБ" if scale["total_peak_mb"] is not None else ""))
+    for row in scale["stages"]:
+        memory = ""
+        if "peak_mb" in row:
+            memory = f"  peak {row['peak_mb']:8.1f} МБ  retained {row['retained_mb']:8.1f} МБ"
+        print(f"  {row['stage']:<30} {row['seconds']:8.3f} s  {row['share']:6.1%}{memory}")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="100000,300000,1000000", help="масштабы: строк purchases через запятую")
+    parser.add_argument("--repeat", type=int, default=3, help="прогонов для времени (медиана)")
+    parser.add_argument("--low-memory", action="store_true", help="UpliftFeatureExtractor(low_memory=True)")
+    parser.add_argument("--int-ids", action="store_true", help="числовые id (по умолчанию строковые, как в X5)")
+    parser.add_argument("--skip-memory", action="store_true", help="без прогона под tracemalloc")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="куда сохранить JSON-отчёт")
+    args = parser.parse_args()
+
+    scales = []
+    for n_rows in (int(v) for v in args.rows.split(",")):
+        scale = bench_scale(n_rows, args)
+        print_scale(scale)
+        scales.append(scale)
+
+    report = {
+        "environment": {
+            "commit": _git_commit(),
+            "timestamp": pd.Timestamp.now(tz="UTC").isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "args": {k: v for k, v in vars(args).items() if k != "out"},
+        "scales": scales,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nотчёт сохранён в {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Нагрузочный бенчмарк сервиса: пропускная способность и p50/p95/p99 задержки
+для /forward, /history и /stats.
+
+    python -m benchmarks.bench_service --out bench.json
+    python -m benchmarks.bench_service --sizes 1,10,100 --requests 200 --concurrency 1,8
+    python -m benchmarks.bench_service --compare bench_old.json --out bench_new.json
+
+Сервис запускается в этом же процессе (uvicorn в отдельном потоке) на временной
+SQLite-базе и синтетической модели: T-learner обучается на синтетических данных
+в формате X5 (benchmarks.synthetic_x5) и сохраняется mmap-артефактом, как в
+utils/train_model.py. Запросы /forward - тоже синтетические X5-клиенты с
+покупками, у каждого запроса свои client_id. Кэш признаков по умолчанию выключен
+(иначе повторные запросы измеряют попадания в кэш), остальные настройки сервиса
+берутся из переменных окружения как обычно.
+
+Результат - JSON с окружением (коммит, версии, настройки) и строкой на каждый
+сценарий; --compare печатает изменение относительно прошлого отчёта.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_x5 import ROWS_PER_CLIENT, generate_x5
+
+JWT_SECRET = "benchmark-secret-benchmark-secret"
+PERCENTILES = (50, 95, 99)
+
+
+def build_synthetic_model(artifact_dir, n_rows=200_000, seed=0):
+    """Обучить T-learner на синтетических X5 и сохранить артефакт сервиса"""
+    from utils.feature_extraction import UpliftFeatureExtractor
+    from utils.model_artifact import export_t_learner_artifact
+    from utils.model_extraction import build_t_learner_logreg
+
+    data = generate_x5(n_rows, seed=seed, string_ids=False)
+    extractor = UpliftFeatureExtractor(drop_redundant=True)
+    df = extractor.calculate_features(
+        clients_df=data["clients"],
+        train_df=data["train"],
+        treatment_df=data["treatment"],
+        target_df=data["target"],
+        purchases_df=data["purchases"],
+    )
+    X = df[extractor.feature_names]
+    num_cols = X.select_dtypes(include=["number"]).columns.tolist()
+    cat_cols = X.select_dtypes(include=["object"]).columns.tolist()
+
+    model = build_t_learner_logreg(num_cols=num_cols, cat_cols=cat_cols)
+    model.fit(X, df["target"].values, treatment=df["treatment_flg"].values)
+    export_t_learner_artifact(model, extractor.feature_names, artifact_dir, extractor.preprocessing)
+
+
+def _records(df):
+    # NaN -> null, даты - строками, как их присылают клиенты сервиса
+    return json.loads(df.to_json(orient="records", date_format="iso"))
+
+
+def make_forward_bodies(n_clients, n_bodies, seed=0, first_client_id=1):
+    """
+    n_bodies разных тел /forward по n_clients клиентов и число строк покупок в каждом.
+    client_id не пересекаются между телами (иначе микробатчинг разводит их по батчам)
+    """
+    bodies, purchase_rows = [], []
+    next_id = first_client_id
+    for i in range(n_bodies):
+        data = generate_x5(n_clients * ROWS_PER_CLIENT, seed=seed + i, string_ids=False)
+        clients, purchases = data["clients"], data["purchases"]
+        purchases["transaction_datetime"] = purchases["transaction_datetime"].dt.strftime("%Y-%m-%d %H:%M:%S")
+
+        ids = dict(zip(clients["client_id"], range(next_id, next_id + len(clients))))
+        next_id += len(clients)
+        clients = clients.assign(client_id=clients["client_id"].map(ids))
+        purchases["client_id"] = purchases["client_id"].map(ids)
+
+        body = {"client": _records(clients), "purchases": _records(purchases)}
+        bodies.append(json.dumps(body).encode("utf-8"))
+        purchase_rows.append(len(purchases))
+    return bodies, purchase_rows, next_id
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServiceThread:
+    """uvicorn с приложением сервиса в фоновом потоке (lifespan отрабатывает как обычно)"""
+
+    def __init__(self, app, port):
+        import uvicorn
+
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("Service did not start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+
+def latency_summary(latencies):
+    values = np.asarray(latencies) * 1000
+    summary = {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+    summary["mean"] = float(values.mean())
+    summary["max"] = float(values.max())
+    return summary
+
+
+async def run_scenario(client, method, url, n_requests, concurrency, bodies=None, headers=None):
+    """n_requests запросов, не больше concurrency одновременно; тела берутся по кругу"""
+    import httpx
+
+    latencies, status_codes = [], {}
+    counter = iter(range(n_requests))
+
+    async def worker():
+        for i in counter:
+            content = bodies[i % len(bodies)] if bodies else None
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, content=content, headers=headers)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            status_codes[status] = status_codes.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "errors": n_requests - status_codes.get("200", 0),
+        "status_codes": status_codes,
+        "seconds": elapsed,
+        "throughput_rps": n_requests / elapsed,
+        "latency_ms": latency_summary(latencies),
+    }
+
+
+async def run_benchmark(base_url, token, args):
+    import httpx
+
+    json_headers = {"Content-Type": "application/json"}
+    admin_headers = {"Authorization": f"Bearer {token}"}
+    results = []
+    next_id = 1
+
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        for n_clients in args.sizes:
+            bodies, purchase_rows, next_id = make_forward_bodies(
+                n_clients, args.bodies, seed=args.seed, first_client_id=next_id
+            )
+            payload = {
+                "clients": n_clients,
+                "purchases": int(np.mean(purchase_rows)),
+                "bytes": int(np.mean([len(b) for b in bodies])),
+            }
+            # прогрев: ленивая загрузка модели, пул, первые записи истории
+            await run_scenario(client, "POST", "/forward", args.warmup, 1, bodies, json_headers)
+
+            for concurrency in args.concurrency:
+                row = await run_scenario(
+                    client, "POST", "/forward", args.requests, concurrency, bodies, json_headers
+                )
+                row.update(endpoint="/forward", payload=payload)
+                results.append(row)
+                print(_format_row(row), flush=True)
+
+        read_endpoints = [
+            ("/history", f"/history?limit={args.history_limit}&include_payload=false"),
+            # с телами запросов ответ на порядок тяжелее (сериализация input/output)
+            ("/history?include_payload", f"/history?limit={args.history_payload_limit}"),
+            ("/stats", "/stats"),
+        ]
+        for name, url in read_endpoints:
+            await run_scenario(client, "GET", url, args.warmup, 1, headers=admin_headers)
+            for concurrency in args.concurrency:
+                row = await run_scenario(client, "GET", url, args.requests, concurrency, headers=admin_headers)
+                row.update(endpoint=name)
+                results.append(row)
+                print(_format_row(row), flush=True)
+
+    return results
+
+
+def _scenario_key(row):
+    return row["endpoint"], (row.get("payload") or {}).get("clients"), row["concurrency"]
+
+
+def _format_row(row):
+    clients = (row.get("payload") or {}).get("clients")
+    name = row["endpoint"] + (f" [{clients} clients]" if clients else "")
+    lat = row["latency_ms"]
+    return (f"{name:<36} c={row['concurrency']:<3} {row['throughput_rps']:8.1f} rps  "
+            f"p50 {lat['p50']:8.1f}  p95 {lat['p95']:8.1f}  p99 {lat['p99']:8.1f} ms  errors {row['errors']}")
+
+
+def compare(old_report, new_report):
+    """Изменение throughput и перцентилей относительно прошлого отчёта, в процентах"""
+    old = {_scenario_key(row): row for row in old_report["results"]}
+    print(f"\nсравнение с {old_report['environment'].get('commit')}:")
+    for row in new_report["results"]:
+        prev = old.get(_scenario_key(row))
+        if prev is None:
+            continue
+        diffs = {"rps": (row["throughput_rps"] / prev["throughput_rps"] - 1) * 100}
+        for p in PERCENTILES:
+            diffs[f"p{p}"] = (row["latency_ms"][f"p{p}"] / prev["latency_ms"][f"p{p}"] - 1) * 100
+        clients = (row.get("payload") or {}).get("clients")
+        name = row["endpoint"] + (f" [{clients} clients]" if clients else "")
+        print(f"{name:<36} c={row['concurrency']:<3} " + "  ".join(f"{k} {v:+6.1f}%" for k, v in diffs.items()))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=_int_list, default=[1, 10, 100], help="клиентов в запросе /forward")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8], help="одновременных запросов")
+    parser.add_argument("--requests", type=int, default=100, help="запросов на сценарий")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--bodies", type=int, default=20, help="разных тел /forward на размер")
+    parser.add_argument("--history-limit", type=int, default=100, help="limit для /history без тел")
+    parser.add_argument("--history-payload-limit", type=int, default=10, help="limit для /history с телами")
+    parser.add_argument("--model-rows", type=int, default=200_000, help="строк purchases для синтетической модели")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="куда сохранить JSON-отчёт")
+    parser.add_argument("--compare", help="прошлый JSON-отчёт для сравнения")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="uplift-bench-")
+    artifact_dir = os.path.join(workdir, "model_artifact")
+    print(f"синтетическая модель ({args.model_rows:,} строк purchases) -> {artifact_dir}", flush=True)
+    build_synthetic_model(artifact_dir, args.model_rows, args.seed)
+
+    # настройки читаются при импорте app, поэтому окружение задаётся до него
+    os.environ.update({
+        "DB_FILE": os.path.join(workdir, "uplift-modeling.db"),
+        "MODEL_ARTIFACT_DIR": artifact_dir,
+        "MODEL_PATH": os.path.join(workdir, "missing.pkl"),
+        "JWT_SECRET": JWT_SECRET,
+    })
+    os.environ.setdefault("FEATURE_CACHE_SIZE", "0")
+    service = importlib.import_module("app")
+
+    import jwt
+
+    token = jwt.encode({"username": "benchmark", "exp": int(time.time()) + 24 * 3600}, JWT_SECRET, algorithm="HS256")
+    port = _free_port()
+    with ServiceThread(service.app, port):
+        results = asyncio.run(run_benchmark(f"http://127.0.0.1:{port}", token, args))
+
+    settings = [
+        "SCORING_MODE", "SCORING_POOL", "SCORING_WORKERS", "SCORING_QUEUE_SIZE", "FUSED_SCORER",
+        "FEATURES_LOW_MEMORY", "FEATURE_CACHE_SIZE", "MICRO_BATCH_MAX_WAIT_MS", "MICRO_BATCH_MAX_CLIENTS",
+        "STAGE_TIMINGS",
+    ]
+    report = {
+        "environment": {
+            "commit": _git_commit(),
+            "timestamp": pd.Timestamp.now(tz="UTC").isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {name: os.environ.get(name) for name in settings if name in os.environ},
+        },
+        "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "results": results,
+    }
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"отчёт сохранён в {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
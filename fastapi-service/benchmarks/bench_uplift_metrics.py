@@ -0,0 +1,97 @@
+"""
+Бенчмарк метрик uplift: sklift.metrics (uplift@k, Qini AUC, AUUC - каждая со своей
+сортировкой) против utils.uplift_metrics.uplift_metrics (одна сортировка), бутстреп
+циклом по sklift против bootstrap_metrics, и UpliftHistogram по частям.
+
+    python -m benchmarks.bench_uplift_metrics --rows 2000000 --bootstrap-rows 100000
+
+Данные синтетические: скор с шумом, отклик зависит от скора в treatment-группе.
+Проверяет, что метрики совпадают с sklift, и печатает время.
+"""
+import argparse
+import time
+
+import numpy as np
+from sklift.metrics import qini_auc_score, uplift_at_k, uplift_auc_score
+
+from utils.uplift_metrics import UpliftHistogram, bootstrap_metrics, uplift_metrics
+
+
+def generate(n_rows, seed):
+    rng = np.random.default_rng(seed)
+    effect = rng.normal(0.0, 0.1, n_rows)
+    treatment = rng.integers(0, 2, n_rows)
+    y = (rng.random(n_rows) < np.clip(0.3 + treatment * effect, 0, 1)).astype(int)
+    uplift = np.round(effect + rng.normal(0.0, 0.05, n_rows), 4)  # с повторами скора
+    return y, uplift, treatment
+
+
+def legacy_metrics(y, uplift, treatment, k):
+    return {
+        "uplift_at_k": uplift_at_k(y, uplift, treatment, strategy="overall", k=k),
+        "qini_auc": qini_auc_score(y, uplift, treatment),
+        "auuc": uplift_auc_score(y, uplift, treatment),
+    }
+
+
+def timed(fn, repeat):
+    result = fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--bootstrap-rows", type=int, default=100_000)
+    parser.add_argument("--n-bootstrap", type=int, default=200)
+    parser.add_argument("--bins", type=int, default=1000, help="корзин UpliftHistogram")
+    parser.add_argument("--chunks", type=int, default=4, help="частей для UpliftHistogram")
+    parser.add_argument("--k", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    y, uplift, treatment = generate(args.rows, args.seed)
+    old_time, old = timed(lambda: legacy_metrics(y, uplift, treatment, args.k), args.repeat)
+    new_time, new = timed(lambda: uplift_metrics(y, uplift, treatment, args.k), args.repeat)
+    for name in old:
+        np.testing.assert_allclose(new[name], old[name], rtol=1e-12, atol=1e-12)
+    print(f"метрики, {args.rows:,} строк:")
+    print(f"  sklift: {old_time:7.2f} s")
+    print(f"  new:    {new_time:7.2f} s   (x{old_time / new_time:.2f}), значения совпадают")
+
+    start = time.perf_counter()
+    hist = UpliftHistogram(bins=args.bins, score_range=(uplift.min(), uplift.max()))
+    for part in np.array_split(np.arange(args.rows), args.chunks):
+        hist.merge(UpliftHistogram(bins=args.bins, score_range=(uplift.min(), uplift.max()))
+                   .update(y[part], uplift[part], treatment[part]))
+    hist_time = time.perf_counter() - start
+    approx = hist.metrics(args.k)
+    print(f"  UpliftHistogram, {args.chunks} части, {args.bins} корзин: {hist_time:.2f} s, "
+          + ", ".join(f"{name} {approx[name] - new[name]:+.1e}" for name in new))
+
+    n = args.bootstrap_rows
+    y, uplift, treatment = y[:n], uplift[:n], treatment[:n]
+    rng = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+    for _ in range(args.n_bootstrap):
+        idx = rng.integers(0, n, n)
+        legacy_metrics(y[idx], uplift[idx], treatment[idx], args.k)
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    samples = bootstrap_metrics(y, uplift, treatment, args.n_bootstrap, args.k, random_state=args.seed)
+    new_time = time.perf_counter() - start
+    print(f"\nбутстреп, {args.n_bootstrap} выборок по {n:,} строк:")
+    print(f"  sklift циклом: {old_time:7.2f} s")
+    print(f"  new:           {new_time:7.2f} s   (x{old_time / new_time:.2f})")
+    print("  " + ", ".join(f"{name} {values.mean():.4f} ± {values.std():.4f}" for name, values in samples.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Бенчмарк predict X-learner и S-learner: старые пути (три predict по одному X;
+две копии X и два predict_proba) против нового (один Pool на три модели X-learner;
+treatment- и control-варианты одной таблицей, батчами).
+
+    python -m benchmarks.bench_uplift_predict --predict-rows 1000000
+
+Модели обучаются на признаках синтетических X5, для предсказания строки признаков
+размножаются до --predict-rows. Печатает время (медиана по --repeat) и пик RSS
+сверх памяти до вызова, в пересчёте на 1 млн строк.
+Пик RSS снимается фоновым потоком из /proc/self/statm (только Linux), каждый вариант -
+в отдельном процессе: иначе следующий вариант переиспользует память, освобождённую
+предыдущим, и его пик занижен. Совпадение предсказаний старых и новых путей
+проверяет tests/test_uplift_predict.py.
+"""
+import argparse
+import gc
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from benchmarks.synthetic_x5 import generate_x5
+from utils.feature_extraction import UpliftFeatureExtractor
+from utils.model_extraction import (
+    build_s_learner_catboost,
+    build_x_learner_catboost,
+    predict_uplift_s_learner,
+)
+
+TREATMENT_COL = "treatment_flg"
+MB = 1024 * 1024
+
+
+class RssPeak:
+    """with RssPeak() as peak: ... -> peak.mb - пик RSS в блоке сверх RSS на входе"""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.mb = 0.0
+        self._page = os.sysconf("SC_PAGE_SIZE")
+
+    def _rss(self):
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * self._page
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self._peak = max(self._peak, self._rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        gc.collect()
+        self._start = self._peak = self._rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, self._rss())
+        self.mb = (self._peak - self._start) / MB
+
+
+def legacy_x_predict(model, X):
+    """Исходный MyXLearner.predict: каждая модель сама переводит X в Pool"""
+    tau0 = model.model_tau_0.predict(X)
+    tau1 = model.model_tau_1.predict(X)
+    g = model.model_propensity.predict_proba(X)[:, 1]
+    return g * tau0 + (1 - g) * tau1
+
+
+def legacy_s_predict(model, X, treatment_col):
+    """Исходный predict_uplift_s_learner: две полные копии X и два predict_proba"""
+    X_treat = X.copy()
+    X_ctrl = X.copy()
+    X_treat[treatment_col] = 1
+    X_ctrl[treatment_col] = 0
+    return model.predict_proba(X_treat)[:, 1] - model.predict_proba(X_ctrl)[:, 1]
+
+
+def train_models(args):
+    data = generate_x5(args.train_rows, seed=args.seed, string_ids=False)
+    extractor = UpliftFeatureExtractor(drop_redundant=True)
+    df = extractor.calculate_features(
+        clients_df=data["clients"],
+        train_df=data["train"],
+        treatment_df=data["treatment"],
+        target_df=data["target"],
+        purchases_df=data["purchases"],
+    )
+    X = df[extractor.feature_names]
+    y = df["target"].to_numpy()
+    t = df[TREATMENT_COL].to_numpy()
+    cat_cols = X.select_dtypes(include=["object", "category"]).columns.tolist()
+
+    x_learner = build_x_learner_catboost(cat_cols)
+    for learner in (x_learner.outcome_learner, x_learner.effect_learner):
+        learner.set_params(verbose=0)
+    x_learner.fit(X, y, t)
+
+    X_s = X.assign(**{TREATMENT_COL: t})
+    s_learner = build_s_learner_catboost([X_s.columns.get_loc(col) for col in cat_cols])
+    # без eval_set: use_best_model выключен, итераций меньше - бенчмарк про predict
+    s_learner.set_params(iterations=args.s_iterations, use_best_model=False, verbose=0)
+    s_learner.fit(X_s, y)
+
+    return X, x_learner, s_learner
+
+
+VARIANTS = {
+    "x_legacy": lambda X, X_s, x_learner, s_learner, batch_size: legacy_x_predict(x_learner, X),
+    "x_new": lambda X, X_s, x_learner, s_learner, batch_size: x_learner.predict(X),
+    "s_legacy": lambda X, X_s, x_learner, s_learner, batch_size: legacy_s_predict(s_learner, X_s, TREATMENT_COL),
+    "s_new": lambda X, X_s, x_learner, s_learner, batch_size: predict_uplift_s_learner(
+        s_learner, X_s, TREATMENT_COL, batch_size
+    ),
+}
+
+
+def _peak_in_process(state_path, variant, batch_size):
+    with open(state_path, "rb") as f:
+        X, X_s, x_learner, s_learner = pickle.load(f)
+    with RssPeak() as peak:
+        VARIANTS[variant](X, X_s, x_learner, s_learner, batch_size)
+    return peak.mb
+
+
+def measure(variant, state, state_path, args):
+    """(медиана времени, пик RSS МБ)"""
+    fn = lambda: VARIANTS[variant](*state, args.batch_size)
+    fn()  # прогрев
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        peak_mb = pool.submit(_peak_in_process, state_path, variant, args.batch_size).result()
+    return float(np.median(times)), peak_mb
+
+
+def report(name, legacy, new, n_rows):
+    scale = 1_000_000 / n_rows
+    (old_time, old_mb), (new_time, new_mb) = legacy, new
+    print(f"\n{name} (на 1 млн строк):")
+    print(f"  legacy: {old_time * scale:7.2f} s   пик RSS {old_mb * scale:8.1f} МБ")
+    print(f"  new:    {new_time * scale:7.2f} s   пик RSS {new_mb * scale:8.1f} МБ   "
+          f"(время x{old_time / new_time:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--train-rows", type=int, default=1_000_000, help="строк purchases для обучения моделей")
+    parser.add_argument("--predict-rows", type=int, default=1_000_000, help="строк признаков для predict")
+    parser.add_argument("--s-iterations", type=int, default=300, help="итераций S-learner")
+    parser.add_argument("--batch-size", type=int, default=200_000, help="batch_size predict_uplift_s_learner")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    X_train, x_learner, s_learner = train_models(args)
+    rng = np.random.default_rng(args.seed)
+    X = X_train.iloc[rng.integers(0, len(X_train), args.predict_rows)].reset_index(drop=True)
+    X_s = X.assign(**{TREATMENT_COL: 0})
+    print(f"обучение на {len(X_train):,} клиентах, predict на {len(X):,} строках "
+          f"({X.memory_usage(deep=True).sum() / MB:.0f} МБ)")
+
+    state = (X, X_s, x_learner, s_learner)
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = os.path.join(tmp, "state.pkl")
+        with open(state_path, "wb") as f:
+            pickle.dump(state, f)
+
+        for name, legacy, new in (("X-learner predict", "x_legacy", "x_new"),
+                                  ("S-learner uplift", "s_legacy", "s_new")):
+            report(
+                name,
+                measure(legacy, state, state_path, args),
+                measure(new, state, state_path, args),
+                len(X),
+            )
+
+
+if __name__ == "__main__":
+    main()
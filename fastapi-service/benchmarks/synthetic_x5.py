@@ -0,0 +1,126 @@
+"""
+Генератор синтетических данных в формате X5 RetailHero (sklift.datasets.fetch_x5).
+
+Пропорции как в оригинале: ~45.8M строк purchases на ~400k клиентов,
+~10 товаров в чеке, ~2.4k магазинов, ~43k товаров. Число транзакций на клиента
+и товаров в чеке - с тяжёлым хвостом, выбор магазина и товара - по Ципфу.
+"""
+import numpy as np
+import pandas as pd
+
+ROWS_PER_CLIENT = 114
+ROWS_PER_TRANSACTION = 10
+N_STORES = 2400
+N_PRODUCTS = 43000
+
+
+def _hex_ids(n, rng, prefix=""):
+    """Строковые id вида 000012768d, как в X5"""
+    values = rng.choice(16 ** 9, size=n, replace=False)
+    return np.array([f"{prefix}{v:010x}" for v in values], dtype=object)
+
+
+def _zipf_choice(n_items, size, rng, a=1.2):
+    ranks = rng.zipf(a, size=size)
+    return (ranks - 1) % n_items
+
+
+def generate_x5(n_rows=1_000_000, seed=0, string_ids=True):
+    """
+    Возвращает dict с clients, train, treatment, target, purchases -
+    теми же объектами, что ждёт UpliftFeatureExtractor.calculate_features
+    """
+    rng = np.random.default_rng(seed)
+    n_clients = max(n_rows // ROWS_PER_CLIENT, 1)
+
+    # транзакции: у клиента - лог-нормальное число чеков
+    trans_per_client = np.maximum(
+        rng.lognormal(mean=np.log(ROWS_PER_CLIENT / ROWS_PER_TRANSACTION) - 0.5, sigma=1.0, size=n_clients), 1
+    ).astype(np.int64)
+    n_trans = int(trans_per_client.sum())
+    trans_client = np.repeat(np.arange(n_clients), trans_per_client)
+
+    # товары в чеке: геометрическое распределение, подгоняем общее число строк
+    items_per_trans = rng.geometric(1 / ROWS_PER_TRANSACTION, size=n_trans)
+    scale = n_rows / items_per_trans.sum()
+    items_per_trans = np.maximum(np.round(items_per_trans * scale), 1).astype(np.int64)
+    row_trans = np.repeat(np.arange(n_trans), items_per_trans)
+    n = len(row_trans)
+
+    # атрибуты транзакций
+    start = np.datetime64("2018-11-21T00:00:00")
+    trans_dt = start + rng.integers(0, 118 * 24 * 3600, size=n_trans).astype("timedelta64[s]")
+    client_store = _zipf_choice(N_STORES, n_clients, rng)
+    # часть чеков - в "своём" магазине клиента
+    trans_store = np.where(
+        rng.random(n_trans) < 0.7, client_store[trans_client], _zipf_choice(N_STORES, n_trans, rng)
+    )
+    purchase_sum = np.round(rng.lognormal(6, 1, size=n_trans), 2)
+    regular_received = np.round(purchase_sum * 0.02 * rng.random(n_trans), 1)
+    express_received = np.where(rng.random(n_trans) < 0.05, rng.integers(10, 100, n_trans), 0).astype(float)
+    regular_spent = np.where(rng.random(n_trans) < 0.1, -np.round(purchase_sum * 0.1, 1), 0.0)
+    express_spent = np.where(rng.random(n_trans) < 0.02, -rng.integers(10, 100, n_trans), 0).astype(float)
+
+    product = _zipf_choice(N_PRODUCTS, n, rng, a=1.1)
+    quantity = rng.geometric(0.7, size=n).astype(float)
+    trn_sum_from_iss = np.round(purchase_sum[row_trans] / items_per_trans[row_trans], 2)
+    trn_sum_from_red = np.where(rng.random(n) < 0.05, trn_sum_from_iss, np.nan)
+
+    if string_ids:
+        client_ids = _hex_ids(n_clients, rng)
+        trans_ids = _hex_ids(n_trans, rng)
+        store_ids = _hex_ids(N_STORES, rng)
+        product_ids = _hex_ids(N_PRODUCTS, rng)
+    else:
+        client_ids = np.arange(n_clients)
+        trans_ids = np.arange(n_trans)
+        store_ids = np.arange(N_STORES)
+        product_ids = np.arange(N_PRODUCTS)
+
+    purchases = pd.DataFrame({
+        "client_id": client_ids[trans_client[row_trans]],
+        "transaction_id": trans_ids[row_trans],
+        "transaction_datetime": pd.Series(trans_dt[row_trans]).dt.strftime("%Y-%m-%d %H:%M:%S")
+        if string_ids else trans_dt[row_trans],
+        "regular_points_received": regular_received[row_trans],
+        "express_points_received": express_received[row_trans],
+        "regular_points_spent": regular_spent[row_trans],
+        "express_points_spent": express_spent[row_trans],
+        "purchase_sum": purchase_sum[row_trans],
+        "store_id": store_ids[trans_store[row_trans]],
+        "product_id": product_ids[product],
+        "product_quantity": quantity,
+        "trn_sum_from_iss": trn_sum_from_iss,
+        "trn_sum_from_red": trn_sum_from_red,
+    })
+
+    # клиенты: возраст с выбросами, как в X5
+    age = rng.normal(46, 14, size=n_clients).round()
+    outliers = rng.random(n_clients) < 0.01
+    age[outliers] = rng.choice([-7000, 0, 5, 120, 180, 1900], size=outliers.sum())
+    issue = np.datetime64("2017-04-01") + rng.integers(0, 580, size=n_clients).astype("timedelta64[D]")
+    redeem = issue + rng.integers(0, 300, size=n_clients).astype("timedelta64[D]")
+    redeem_str = pd.Series(redeem).dt.strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object)
+    redeem_str[rng.random(n_clients) < 0.08] = np.nan
+
+    clients = pd.DataFrame({
+        "client_id": client_ids,
+        "first_issue_date": pd.Series(issue).dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "first_redeem_date": redeem_str,
+        "age": age.astype(np.int64),
+        "gender": rng.choice(["U", "F", "M"], size=n_clients, p=[0.45, 0.35, 0.2]),
+    })
+
+    treatment = pd.Series(rng.integers(0, 2, size=n_clients), name="treatment_flg")
+    target = pd.Series(
+        (rng.random(n_clients) < 0.6 + 0.03 * treatment.to_numpy()).astype(int), name="target"
+    )
+    train = pd.DataFrame({"client_id": client_ids})
+
+    return {
+        "clients": clients,
+        "train": train,
+        "treatment": treatment,
+        "target": target,
+        "purchases": purchases,
+    }
@@ -0,0 +1,146 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# сценарий против запущенного сервиса (tests/inference_test.sh), не pytest
+collect_ignore = ["test_app.py"]
+
+MODEL_ARTIFACT_DIR = str(ROOT / "data" / "model_artifact")
+MODEL_PICKLE_PATH = str(ROOT / "data" / "model.pkl")
+
+
+def make_client(client_id, age=35, gender="F", first_redeem_date=None):
+    return {
+        "client_id": client_id,
+        "age": age,
+        "gender": gender,
+        "first_issue_date": "2022-01-10",
+        "first_redeem_date": first_redeem_date,
+    }
+
+
+def make_purchase(client_id, transaction_id, purchase_sum, day=1, store_id="54a4a11a29", product_id="9a80204f78"):
+    return {
+        "client_id": client_id,
+        "transaction_id": transaction_id,
+        "transaction_datetime": f"2024-02-{day:02d} 12:30:00",
+        "purchase_sum": purchase_sum,
+        "store_id": store_id,
+        "regular_points_received": purchase_sum // 25,
+        "express_points_received": 0,
+        "regular_points_spent": 0,
+        "express_points_spent": 0,
+        "product_id": product_id,
+        "product_quantity": 2,
+        "trn_sum_from_iss": purchase_sum,
+        "trn_sum_from_red": 0,
+    }
+
+
+@pytest.fixture
+def payload():
+    """Запрос /forward: клиенты 7 и 555 - с возрастом вне [15, 100]"""
+    return {
+        "client": [
+            make_client(123, age=35),
+            make_client(555, age=420, gender="M", first_redeem_date="2021-06-20"),
+            make_client(7, age=5),
+            make_client(9, age=61, gender="U"),
+        ],
+        "purchases": [
+            make_purchase(123, 1, 540, day=1),
+            make_purchase(123, 2, 1200, day=2, store_id="b2c3d4e5f6", product_id="1b2c3d4e5f"),
+            make_purchase(555, 3, 340, day=1),
+            make_purchase(7, 4, 90, day=3),
+            make_purchase(9, 5, 2500, day=4, store_id="b2c3d4e5f6"),
+            make_purchase(9, 5, 2500, day=4, store_id="b2c3d4e5f6", product_id="1b2c3d4e5f"),
+        ],
+    }
+
+
+@pytest.fixture(scope="session")
+def service(tmp_path_factory):
+    """Модуль app на временной БД; импортируется один раз - настройки читаются при импорте"""
+    os.environ["JWT_SECRET"] = "test-secret-" + "0" * 32
+    os.environ["DB_FILE"] = str(tmp_path_factory.mktemp("db") / "uplift-modeling.db")
+    os.environ["MODEL_ARTIFACT_DIR"] = MODEL_ARTIFACT_DIR
+    os.environ["MODEL_PATH"] = MODEL_PICKLE_PATH
+    import app
+    return app
+
+
+@pytest.fixture(scope="session")
+def api(service):
+    from fastapi.testclient import TestClient
+
+    # один клиент на сессию: lifespan останавливает пул скоринга и запись истории
+    with TestClient(service.app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def admin_headers(service):
+    """Authorization для эндпоинтов администратора"""
+    import jwt
+
+    token = jwt.encode({"username": "admin"}, service.JWT_SECRET, algorithm=service.ALGORITHM)
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(scope="session")
+def model():
+    """(model, feature_names, preprocessing) из артефакта сервиса"""
+    from utils.model_artifact import load_model
+
+    return load_model(MODEL_ARTIFACT_DIR, MODEL_PICKLE_PATH)
+
+
+@pytest.fixture
+def history_db(tmp_path):
+    """Временная БД с таблицами history и request_stats (как в init_db сервиса)"""
+    import sqlite3
+
+    db_file = str(tmp_path / "history.db")
+    conn = sqlite3.connect(db_file)
+    conn.executescript("""
+        CREATE TABLE history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT,
+            processing_time REAL,
+            input_size INTEGER,
+            input_tokens INTEGER,
+            status_code INTEGER,
+            input_data TEXT,
+            output_data TEXT,
+            queue_time REAL,
+            compute_time REAL,
+            stage_timings TEXT
+        );
+        CREATE TABLE request_stats (id INTEGER PRIMARY KEY, updated_ts TEXT, state TEXT);
+    """)
+    conn.close()
+    return db_file
+
+
+@pytest.fixture(scope="session")
+def x5_data():
+    """Синтетические X5 (benchmarks/synthetic_x5.py): ~20 тыс. строк purchases, у части покупок нет store_id"""
+    import numpy as np
+
+    from benchmarks.synthetic_x5 import generate_x5
+
+    data = generate_x5(20_000, seed=0)
+    purchases = data["purchases"]
+    purchases.loc[np.random.default_rng(0).random(len(purchases)) < 0.02, "store_id"] = np.nan
+    return data
+
+
+@pytest.fixture
+def x5(x5_data):
+    """Копии x5_data: экстракторы могут менять входные таблицы"""
+    return {name: frame.copy() for name, frame in x5_data.items()}
@@ -209,6 +209,19 @@ def test_final_admin_routes(token: str):
         extra += f", len={len(hist)}"
     results["GET /history before delete"] = (ok, extra)
 
+    r = requests.get(
+        f"{BASE_URL}/history",
+        params={"limit": 2, "include_payload": "false"},
+        headers=headers,
+    )
+    ok_page = r.status_code == 200 and len(r.json()) <= 2
+    extra_page = f"status={r.status_code}"
+    if ok_page:
+        page = r.json()
+        ok_page = all("input" not in row for row in page)
+        extra_page += f", len={len(page)}, next_before_id={r.headers.get('X-Next-Before-Id')}"
+    results["GET /history?limit=2&include_payload=false"] = (ok_page, extra_page)
+
     r = requests.get(f"{BASE_URL}/stats", headers=headers)
     ok_stats = r.status_code == 200
     results["GET /stats"] = (ok_stats, f"status={r.status_code}")
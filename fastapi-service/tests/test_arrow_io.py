@@ -0,0 +1,71 @@
+import sys
+
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from utils.arrow_io import ARROW_STREAM_MIME, read_arrow_frames, results_to_arrow, write_arrow_frames
+
+ARROW = {"Content-Type": ARROW_STREAM_MIME}
+
+
+def arrow_body(payload):
+    return write_arrow_frames(pd.DataFrame(payload["client"]), pd.DataFrame(payload["purchases"]))
+
+
+def read_results(content):
+    (results,) = read_arrow_frames(content, n_frames=1)
+    return results
+
+
+def test_frames_round_trip(payload):
+    client_df, purchases_df = pd.DataFrame(payload["client"]), pd.DataFrame(payload["purchases"])
+    client_back, purchases_back = read_arrow_frames(write_arrow_frames(client_df, purchases_df))
+
+    pd.testing.assert_frame_equal(client_back, client_df)
+    pd.testing.assert_frame_equal(purchases_back, purchases_df)
+
+
+def test_results_to_arrow_schema():
+    schema = pa.ipc.open_stream(results_to_arrow([])).schema
+    assert schema.names == ["client_id", "uplift"]
+    assert schema.types == [pa.int64(), pa.float64()]
+    assert read_results(results_to_arrow([{"client_id": 7, "uplift": 0.25}])).to_dict("list") == {
+        "client_id": [7], "uplift": [0.25],
+    }
+
+
+def test_arrow_round_trip_matches_json(api, payload):
+    expected = api.post("/forward", json=payload).json()["uplift"]
+
+    response = api.post("/forward", content=arrow_body(payload), headers={**ARROW, "Accept": ARROW_STREAM_MIME})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == ARROW_STREAM_MIME
+    assert read_results(response.content).to_dict("records") == expected
+
+    # Arrow на входе, JSON на выходе - и наоборот
+    assert api.post("/forward", content=arrow_body(payload), headers=ARROW).json()["uplift"] == expected
+    json_in = api.post("/forward", json=payload, headers={"Accept": ARROW_STREAM_MIME})
+    assert read_results(json_in.content).to_dict("records") == expected
+
+
+@pytest.mark.parametrize("mutate", [
+    lambda body: body[: len(body) // 2],
+    lambda body: body + b"trailing",
+], ids=["truncated", "trailing-data"])
+def test_malformed_arrow_is_rejected(api, payload, mutate):
+    response = api.post("/forward", content=mutate(arrow_body(payload)), headers=ARROW)
+    assert response.status_code == 400
+
+
+def test_arrow_without_pyarrow_is_415(api, payload, monkeypatch):
+    body = arrow_body(payload)
+    # import pyarrow падает с ImportError, как если бы пакет не был установлен
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+
+    response = api.post("/forward", content=body, headers=ARROW)
+    assert response.status_code == 415
+    assert "pyarrow" in response.text
+    # JSON работает и без pyarrow
+    assert api.post("/forward", json=payload).status_code == 200
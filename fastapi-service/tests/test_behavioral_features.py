@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from benchmarks.bench_behavioral_features import legacy_mode_features, prepare_unique_trans
+from benchmarks.synthetic_x5 import generate_x5
+from utils.feature_extraction import UpliftFeatureExtractor
+from utils.inference_feature_extractor import UpliftFeatureExtractorInference
+
+MODE_COLUMNS = ["most_frequent_weekday", "most_frequent_hour", "most_frequent_store", "store_loyalty_ratio"]
+
+
+@pytest.fixture(scope="module")
+def purchases():
+    return generate_x5(20_000, seed=0)["purchases"]
+
+
+@pytest.mark.parametrize("extractor", [UpliftFeatureExtractor, UpliftFeatureExtractorInference])
+def test_mode_features_match_legacy(purchases, extractor):
+    fe = extractor()
+    expected = legacy_mode_features(prepare_unique_trans(purchases))
+
+    features = fe.generate_behavioral_features(fe.preprocess_purchases(purchases))
+    pd.testing.assert_frame_equal(
+        features[MODE_COLUMNS], expected[MODE_COLUMNS], check_dtype=False, check_names=False
+    )
+
+
+def test_group_mode_ties_and_nan():
+    df = pd.DataFrame({
+        "client_id": [1, 1, 1, 1, 2, 2, 2],
+        "store_id": ["b", "a", "b", "a", None, None, "c"],
+    })
+    mode, count = UpliftFeatureExtractor().group_mode(df, "client_id", "store_id")
+
+    # при равенстве частот - наименьшее значение, NaN не учитывается
+    assert mode.to_dict() == {1: "a", 2: "c"}
+    assert count.to_dict() == {1: 2, 2: 1}
+    legacy = df.groupby("client_id")["store_id"].agg(lambda x: x.mode()[0])
+    assert mode.to_dict() == legacy.to_dict()
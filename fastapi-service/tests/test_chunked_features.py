@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.feature_extraction import UpliftFeatureExtractor, iter_client_chunks, read_purchases_chunks
+
+CHUNK_ROWS = 250  # клиент - в среднем ~110 строк: границы чанков режут клиентов, длинные - на несколько чанков
+
+
+def raw_chunks(df, size=CHUNK_ROWS):
+    return (df.iloc[start:start + size] for start in range(0, len(df), size))
+
+
+def in_memory(x5, purchases):
+    return UpliftFeatureExtractor().calculate_features(
+        x5["clients"], x5["train"], x5["treatment"], x5["target"], purchases
+    )
+
+
+def chunked(x5, chunks):
+    return UpliftFeatureExtractor().calculate_features_chunked(
+        x5["clients"], x5["train"], x5["treatment"], x5["target"], chunks
+    )
+
+
+def test_raw_chunks_split_clients(x5):
+    purchases = x5["purchases"]
+    first = purchases.iloc[:CHUNK_ROWS]
+    # последний клиент первого сырого чанка продолжается во втором
+    assert first["client_id"].iloc[-1] == purchases["client_id"].iloc[CHUNK_ROWS]
+
+
+def test_iter_client_chunks_keeps_clients_whole(x5):
+    purchases = x5["purchases"]
+    chunks = list(iter_client_chunks(raw_chunks(purchases)))
+
+    seen = [set(chunk["client_id"]) for chunk in chunks]
+    assert sum(len(s) for s in seen) == purchases["client_id"].nunique()
+    assert len(set().union(*seen)) == purchases["client_id"].nunique()
+    # перенос хвоста клиента в следующий чанк сбрасывает индекс
+    pd.testing.assert_frame_equal(pd.concat(chunks).reset_index(drop=True), purchases.reset_index(drop=True))
+
+
+def test_chunked_matches_in_memory(x5):
+    expected = in_memory(x5, x5["purchases"].copy())
+    result = chunked(x5, iter_client_chunks(raw_chunks(x5["purchases"])))
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".csv.gz", ".parquet"])
+def test_out_of_core_matches_in_memory(x5, tmp_path, suffix):
+    path = tmp_path / f"purchases{suffix}"
+    if suffix == ".parquet":
+        x5["purchases"].to_parquet(path, row_group_size=CHUNK_ROWS)
+        full = pd.read_parquet(path)
+    else:
+        x5["purchases"].to_csv(path, index=False)
+        full = pd.read_csv(path)
+
+    expected = in_memory(x5, full)
+    result = chunked(x5, read_purchases_chunks(path, chunksize=CHUNK_ROWS))
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_ungrouped_purchases_are_rejected(x5):
+    purchases = x5["purchases"]
+    shuffled = purchases.iloc[np.random.default_rng(0).permutation(len(purchases))]
+    with pytest.raises(ValueError, match="grouped by client_id"):
+        list(iter_client_chunks(raw_chunks(shuffled)))
@@ -0,0 +1,81 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from conftest import MODEL_ARTIFACT_DIR, MODEL_PICKLE_PATH, make_client, make_purchase
+from utils.client_state import init_client_state
+from utils.scoring_pool import _worker, ingest_in_worker, init_scoring_worker, score_state_in_worker
+
+
+def uplift_by_id(body):
+    return {r["client_id"]: r["uplift"] for r in body["uplift"]}
+
+
+def shifted(payload, offset):
+    """Тот же запрос с client_id + offset: у каждого теста свои клиенты в общем состоянии"""
+    return {
+        "client": [dict(c, client_id=c["client_id"] + offset) for c in payload["client"]],
+        "purchases": [dict(p, client_id=p["client_id"] + offset) for p in payload["purchases"]],
+    }
+
+
+def test_state_scoring_matches_forward(api, payload):
+    payload = shifted(payload, 10_000)
+    client_ids = [c["client_id"] for c in payload["client"]]
+
+    response = api.post("/clients/ingest", json=payload)
+    assert response.status_code == 200, response.text
+    assert response.json()["transactions_added"] == 5
+
+    from_state = api.post("/forward/clients", json={"client_ids": client_ids + [999_999]})
+    assert from_state.status_code == 200, from_state.text
+    assert from_state.json()["unknown_client_ids"] == [999_999]
+
+    direct = api.post("/forward", json=payload)
+    assert uplift_by_id(from_state.json()) == pytest.approx(uplift_by_id(direct.json()), abs=1e-6)
+
+
+def test_incremental_ingest_matches_full_history(api):
+    client_id = 20_000
+    purchases = [
+        make_purchase(client_id, 1, 540, day=1),
+        make_purchase(client_id, 2, 1200, day=5, store_id="b2c3d4e5f6", product_id="1b2c3d4e5f"),
+        make_purchase(client_id, 3, 80, day=9, store_id="b2c3d4e5f6"),
+    ]
+    client = make_client(client_id, age=44, first_redeem_date="2022-02-01")
+
+    api.post("/clients/ingest", json={"client": [client], "purchases": purchases[:2]})
+    # повторная отправка уже учтённой транзакции пропускается
+    second = api.post("/clients/ingest", json={"purchases": purchases[1:]}).json()
+    assert (second["transactions_added"], second["transactions_skipped"]) == (1, 1)
+
+    from_state = api.post("/forward/clients", json={"client_ids": [client_id]}).json()
+    direct = api.post("/forward", json={"client": [client], "purchases": purchases}).json()
+    assert uplift_by_id(from_state) == pytest.approx(uplift_by_id(direct), abs=1e-6)
+
+
+def test_ingest_goes_through_scoring_pool(api, service, monkeypatch):
+    pool = service.scoring_pool
+    monkeypatch.setattr(pool, "_pending", pool.max_workers + pool.max_queue)
+
+    response = api.post("/clients/ingest", json={"client": [make_client(30_000)]})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_process_worker_ingest_and_score(tmp_path, payload):
+    db_file = str(tmp_path / "state.db")
+    conn = sqlite3.connect(db_file)
+    init_client_state(conn)
+    conn.close()
+
+    init_scoring_worker(MODEL_ARTIFACT_DIR, MODEL_PICKLE_PATH)
+    try:
+        summary = ingest_in_worker(db_file, pd.DataFrame(payload["client"]), pd.DataFrame(payload["purchases"]))
+        results, unknown = score_state_in_worker(db_file, [7, 9, 123, 555])
+    finally:
+        _worker.clear()
+
+    assert summary["profiles"] == 4 and summary["transactions_added"] == 5
+    assert [r["client_id"] for r in results] == [7, 9, 123, 555] and unknown == []
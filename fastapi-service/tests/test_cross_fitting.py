@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+from catboost import CatBoostClassifier
+from sklearn.model_selection import StratifiedKFold
+
+from utils.cross_fitting import cross_fit
+from utils.model_extraction import build_t_learner_logreg
+
+N_FOLDS = 3
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    """Синтетика: числовые признаки, строковый с пропусками, category; эффект - от x1"""
+    rng = np.random.default_rng(0)
+    n = 600
+    X = pd.DataFrame({
+        "x1": rng.normal(size=n),
+        "x2": rng.integers(0, 10, size=n),
+        "quarter": rng.choice(["2018Q1", "2018Q2", np.nan], size=n).astype(object),
+        "store": pd.Categorical(rng.choice(["a", "b", "c"], size=n)),
+    }, index=pd.RangeIndex(1000, 1000 + n))
+    treatment = rng.integers(0, 2, size=n)
+    p = 1 / (1 + np.exp(-(0.3 * X["x1"] + 0.8 * treatment * (X["x1"] > 0))))
+    y = (rng.random(n) < p.to_numpy()).astype(int)
+    return X, y, treatment
+
+
+@pytest.fixture(scope="module")
+def cross_fitted(dataset):
+    X, y, treatment = dataset
+    learners = {
+        "t_logreg": build_t_learner_logreg(num_cols=["x1", "x2"], cat_cols=["quarter"]),
+        "s_catboost": CatBoostClassifier(
+            iterations=20, depth=3, verbose=0, allow_writing_files=False, cat_features=[2, 3],
+        ),
+    }
+    return cross_fit(learners, X, y, treatment, n_folds=N_FOLDS, n_jobs=2)
+
+
+def test_oof_covers_every_row_once(dataset, cross_fitted):
+    X, _, _ = dataset
+    oof, metrics = cross_fitted
+
+    assert oof.index.equals(X.index) and list(oof.columns) == ["t_logreg", "s_catboost"]
+    assert not oof.isna().any().any()
+    for _, rows in metrics.groupby("learner"):
+        # каждая строка X - ровно в одном тестовом фолде
+        assert sorted(rows["fold"]) == list(range(N_FOLDS))
+        assert rows["n_test"].sum() == len(X)
+
+
+def test_metrics_per_learner_and_fold(cross_fitted):
+    _, metrics = cross_fitted
+
+    assert len(metrics) == 2 * N_FOLDS
+    assert metrics.groupby("learner").size().to_dict() == {"s_catboost": N_FOLDS, "t_logreg": N_FOLDS}
+    assert metrics[["uplift_at_k", "qini_auc", "auuc"]].notna().all().all()
+
+
+def test_oof_matches_in_process_fit(dataset, cross_fitted):
+    """Матрица из shared memory воркера даёт те же предсказания, что исходный X"""
+    X, y, treatment = dataset
+    oof, _ = cross_fitted
+    splitter = StratifiedKFold(n_splits=N_FOLDS, shuffle=True, random_state=0)
+    train_idx, test_idx = next(splitter.split(np.zeros(len(y)), treatment * 2 + y))
+
+    learner = build_t_learner_logreg(num_cols=["x1", "x2"], cat_cols=["quarter"])
+    learner.fit(X.iloc[train_idx], y[train_idx], treatment[train_idx])
+    expected = learner.predict(X.iloc[test_idx])
+
+    np.testing.assert_allclose(oof["t_logreg"].iloc[test_idx], expected, atol=1e-9)
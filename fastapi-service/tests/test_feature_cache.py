@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+from conftest import make_client, make_purchase
+from utils.client_feature_cache import ClientFeatureCache, client_content_keys
+from utils.inference_feature_extractor import UpliftFeatureExtractorInference
+from utils.scoring import batch_features, score_clients_batch
+
+
+def frames(payload):
+    return pd.DataFrame(payload["client"]), pd.DataFrame(payload["purchases"])
+
+
+@pytest.fixture
+def fe():
+    return UpliftFeatureExtractorInference(drop_redundant=True)
+
+
+def test_cache_hit_and_miss_match_uncached(model, fe, payload):
+    model, _, _ = model
+    cache = ClientFeatureCache()
+    client_df, purchases_df = frames(payload)
+    expected = score_clients_batch(fe, model, client_df, purchases_df)
+
+    assert score_clients_batch(fe, model, client_df, purchases_df, cache) == expected
+    assert (cache.hits, cache.misses) == (0, 4)
+    assert score_clients_batch(fe, model, client_df, purchases_df, cache) == expected
+    assert (cache.hits, cache.misses) == (4, 4)
+
+
+def test_partial_hit_and_changed_history(model, fe, payload):
+    model, _, _ = model
+    cache = ClientFeatureCache()
+    client_df, purchases_df = frames(payload)
+    score_clients_batch(fe, model, client_df, purchases_df, cache)
+
+    # 123 с новой покупкой и новый клиент 42 - промахи, остальные - из кэша
+    payload["client"].append(make_client(42, age=28))
+    payload["purchases"] += [make_purchase(123, 10, 700, day=6), make_purchase(42, 11, 150)]
+    client_df, purchases_df = frames(payload)
+
+    cached = score_clients_batch(fe, model, client_df, purchases_df, cache)
+    assert (cache.hits, cache.misses) == (3, 6)
+    assert cached == score_clients_batch(fe, model, client_df, purchases_df)
+
+
+def test_invalidate_and_eviction(fe, payload):
+    cache = ClientFeatureCache(max_entries=3)
+    client_df, purchases_df = frames(payload)
+
+    batch_features(fe, client_df, purchases_df, cache)
+    # вытесняется самый давний - первый клиент запроса
+    assert cache.stats()["entries"] == 3 and cache.evictions["lru"] == 1
+    assert set(cache.get_many(client_content_keys(client_df, purchases_df))) == {555, 7, 9}
+
+    assert cache.invalidate([9, 999]) == 1
+    assert cache.invalidate() == 2 and cache.stats()["bytes"] == 0
+
+
+def test_ttl_expiry(fe, payload):
+    cache = ClientFeatureCache(ttl_seconds=-1)
+    client_df, purchases_df = frames(payload)
+    batch_features(fe, client_df, purchases_df, cache)
+
+    assert cache.stats()["entries"] == 0 and cache.evictions["ttl"] == 4
+
+
+def test_delete_cache_endpoint(api, service, admin_headers, monkeypatch, payload):
+    monkeypatch.setattr(service, "feature_cache", ClientFeatureCache())
+    monkeypatch.setattr(service, "micro_batcher", None)
+    api.post("/forward", json=payload)
+    assert service.feature_cache.stats()["entries"] == 4
+
+    response = api.delete("/cache", params={"client_id": [7, 9]}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["removed"] == 2 and service.feature_cache.stats()["entries"] == 2
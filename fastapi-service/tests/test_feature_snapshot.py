@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from utils import feature_snapshot
+from utils.feature_extraction import UpliftFeatureExtractor
+from utils.feature_snapshot import FeatureSnapshotCache, compact_dtypes
+
+
+def compute(extractor, x5):
+    return extractor.calculate_features(x5["clients"], x5["train"], x5["treatment"], x5["target"], x5["purchases"])
+
+
+def frame_inputs(x5):
+    return {"clients": x5["clients"], "train": x5["train"], "purchases": x5["purchases"]}
+
+
+@pytest.fixture(scope="module")
+def features(x5_data):
+    """Признаки X5 и экстрактор, которым они посчитаны"""
+    extractor = UpliftFeatureExtractor()
+    df = compute(extractor, {name: frame.copy() for name, frame in x5_data.items()})
+    return df, extractor
+
+
+def test_key_depends_on_inputs(tmp_path, x5):
+    cache = FeatureSnapshotCache(tmp_path)
+    extractor = UpliftFeatureExtractor()
+    key = cache.key(extractor, frame_inputs(x5))
+    assert key == cache.key(extractor, {name: frame.copy() for name, frame in frame_inputs(x5).items()})
+
+    changed = frame_inputs(x5)
+    changed["purchases"] = changed["purchases"].copy()
+    changed["purchases"].loc[changed["purchases"].index[0], "purchase_sum"] += 1
+    assert cache.key(extractor, changed) != key
+
+    # файлы хэшируются по байтам, отсутствующий файл - ключа нет
+    path = tmp_path / "clients.csv"
+    path.write_text("client_id\n1\n")
+    file_key = cache.key(extractor, {"clients": str(path)})
+    path.write_text("client_id\n2\n")
+    assert cache.key(extractor, {"clients": str(path)}) != file_key
+    assert cache.key(extractor, {"clients": str(tmp_path / "missing.csv")}) is None
+
+
+def test_key_depends_on_extractor_config(tmp_path, x5, monkeypatch):
+    cache = FeatureSnapshotCache(tmp_path)
+    inputs = frame_inputs(x5)
+    key = cache.key(UpliftFeatureExtractor(), inputs)
+
+    assert cache.key(UpliftFeatureExtractor(drop_redundant=False), inputs) != key
+    assert cache.key(UpliftFeatureExtractor(low_memory=True), inputs) != key
+    # n_jobs на результат не влияет
+    assert cache.key(UpliftFeatureExtractor(n_jobs=2), inputs) == key
+
+    # код модуля признаков изменился
+    digest = feature_snapshot.file_digest
+    monkeypatch.setattr(feature_snapshot, "file_digest", lambda path: digest(path) + "-edited")
+    assert cache.key(UpliftFeatureExtractor(), inputs) != key
+
+
+def test_compact_dtypes_keeps_values():
+    df = pd.DataFrame({
+        "exact": [0.5, 1.25, np.nan, -3.0],
+        "inexact": [0.1, 1e-12, 2.0, 1e300],
+        "small_int": np.array([0, 5, -7, 100], dtype=np.int64),
+        "big_int": np.array([0, 2 ** 40, 1, 2], dtype=np.int64),
+        "cat": pd.Categorical(["a", "b", "a", "b"]),
+    }, index=[10, 11, 12, 13])
+    compact = compact_dtypes(df)
+
+    assert compact.dtypes.to_dict() == {
+        "exact": np.float32, "inexact": np.float64, "small_int": np.int8, "big_int": np.int64,
+        "cat": df["cat"].dtype,
+    }
+    pd.testing.assert_frame_equal(compact.astype(df.dtypes.to_dict()), df)
+
+
+def test_hit_restores_features_and_extractor_state(tmp_path, x5, features):
+    df, extractor = features
+    extractor.preprocessing = {"age": {"median": 38.5, "q1": 18.0, "q99": 77.25}}
+    cache = FeatureSnapshotCache(tmp_path)
+    key = cache.key(extractor, frame_inputs(x5))
+    cache.save(key, df, extractor)
+
+    fresh = UpliftFeatureExtractor()
+    loaded = cache.cached_features(fresh, frame_inputs(x5), lambda: pytest.fail("snapshot miss"))
+
+    assert fresh.feature_names == extractor.feature_names
+    assert fresh.preprocessing == extractor.preprocessing
+    # компактные типы на диске, значения - без потерь
+    assert any(dtype == np.float32 for dtype in loaded.dtypes)
+    pd.testing.assert_frame_equal(loaded.astype(df.dtypes.to_dict()), df)
+
+
+def test_miss_computes_and_saves(tmp_path, x5, features):
+    df, _ = features
+    cache = FeatureSnapshotCache(tmp_path / "snapshots")
+    extractor = UpliftFeatureExtractor()
+    calls = []
+
+    def compute_once():
+        calls.append(1)
+        return compute(extractor, x5)
+
+    first = cache.cached_features(extractor, frame_inputs(x5), compute_once)
+    second = cache.cached_features(UpliftFeatureExtractor(), frame_inputs(x5), compute_once)
+
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(first, df)
+    assert os.listdir(tmp_path / "snapshots") == [cache.key(extractor, frame_inputs(x5)) + ".parquet"]
+    pd.testing.assert_frame_equal(second.astype(df.dtypes.to_dict()), df)
+
+
+def test_failed_write_leaves_no_file(tmp_path, features, monkeypatch):
+    df, extractor = features
+    cache = FeatureSnapshotCache(tmp_path)
+    _, pq = feature_snapshot._pyarrow()
+    write_table = pq.write_table
+
+    def failing_write(table, where, **kwargs):
+        write_table(table.slice(0, 10), where, **kwargs)  # часть данных уже на диске
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pq, "write_table", failing_write)
+    with pytest.raises(OSError, match="disk full"):
+        cache.save("k", df, extractor)
+
+    assert os.listdir(tmp_path) == []
+    assert cache.load("k") is None
@@ -0,0 +1,120 @@
+import json
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+START = datetime(2024, 2, 1, 12, 0, 0)
+
+
+def stored_ts(i):
+    """Каждая третья строка - с дробными секундами, остальные - как isoformat() без микросекунд"""
+    return START + timedelta(minutes=10 * i, microseconds=250_000 if i % 3 == 1 else 0)
+
+
+@pytest.fixture
+def history(service, monkeypatch, tmp_path):
+    """Своя БД для /history: 25 строк, статус 403 у каждой четвёртой. Возвращает [(id, ts, status)]"""
+    monkeypatch.setattr(service, "DB_FILE", str(tmp_path / "history-api.db"))
+    service.init_db()
+
+    rows = [(stored_ts(i), 403 if i % 4 == 0 else 200) for i in range(25)]
+    conn = sqlite3.connect(service.DB_FILE)
+    with conn:
+        for i, (ts, status) in enumerate(rows):
+            conn.execute(
+                "INSERT INTO history (ts, processing_time, input_size, input_tokens, status_code, "
+                "input_data, output_data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (ts.isoformat(), 0.01, 10, 2, status, json.dumps({"n": i}), json.dumps({"uplift": []})),
+            )
+    conn.close()
+    return [(i + 1, ts, status) for i, (ts, status) in enumerate(rows)]
+
+
+def fetch_pages(api, headers, **params):
+    """Все страницы по X-Next-Before-Id: список (ids страницы, курсор)"""
+    pages = []
+    while True:
+        response = api.get("/history", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        cursor = response.headers.get("X-Next-Before-Id")
+        pages.append(([item["id"] for item in response.json()], cursor))
+        if cursor is None:
+            return pages
+        params["before_id"] = int(cursor)
+
+
+def test_requires_admin(api, history):
+    assert api.get("/history").status_code in (401, 403)
+
+
+def test_keyset_pages(api, admin_headers, history):
+    pages = fetch_pages(api, admin_headers, limit=10)
+
+    assert [len(ids) for ids, _ in pages] == [10, 10, 5]
+    assert [cursor for _, cursor in pages] == ["16", "6", None]
+    all_ids = [i for ids, _ in pages for i in ids]
+    assert all_ids == sorted((row[0] for row in history), reverse=True)
+
+
+def test_full_last_page_is_followed_by_empty_page(api, admin_headers, history):
+    pages = fetch_pages(api, admin_headers, limit=5)
+
+    assert [len(ids) for ids, _ in pages] == [5, 5, 5, 5, 5, 0]
+    assert pages[-2][1] == "1" and pages[-1] == ([], None)
+
+
+def test_combined_filters(api, admin_headers, history):
+    ts_from, ts_to = stored_ts(3), stored_ts(20)
+    pages = fetch_pages(
+        api, admin_headers, limit=3, status_code=200,
+        ts_from=ts_from.isoformat(), ts_to=ts_to.isoformat(),
+    )
+
+    expected = [row_id for row_id, ts, status in reversed(history) if ts_from <= ts < ts_to and status == 200]
+    assert [i for ids, _ in pages for i in ids] == expected
+    assert all(len(ids) == 3 for ids, _ in pages[:-1])
+
+
+def test_include_payload(api, admin_headers, history):
+    full = api.get("/history", params={"limit": 1}, headers=admin_headers).json()[0]
+    light = api.get("/history", params={"limit": 1, "include_payload": False}, headers=admin_headers).json()[0]
+
+    assert full["input"] == {"n": 24} and full["output"] == {"uplift": []}
+    assert "input" not in light and "output" not in light
+    assert {k: v for k, v in full.items() if k not in ("input", "output")} == light
+
+
+@pytest.mark.parametrize("bound", [
+    stored_ts(4),                                   # ровно строка без дробной части
+    stored_ts(4) + timedelta(microseconds=1),       # сразу после неё
+    stored_ts(7),                                   # ровно строка с .250000
+    stored_ts(7).replace(microsecond=0),            # та же секунда без дробной части
+    stored_ts(7) + timedelta(microseconds=1),
+    stored_ts(7) - timedelta(microseconds=1),
+], ids=["whole", "whole+1us", "fraction", "fraction-second", "fraction+1us", "fraction-1us"])
+def test_ts_bounds_compare_as_datetimes(api, admin_headers, history, bound):
+    """Строковое сравнение в SQLite даёт то же, что сравнение datetime, с дробными секундами и без"""
+    for param, keep in (("ts_from", lambda ts: ts >= bound), ("ts_to", lambda ts: ts < bound)):
+        response = api.get("/history", params={param: bound.isoformat(), "limit": 100}, headers=admin_headers)
+        expected = [row_id for row_id, ts, _ in reversed(history) if keep(ts)]
+        assert [item["id"] for item in response.json()] == expected, param
+
+
+def test_ts_bound_formats(api, admin_headers, history, service):
+    bound = stored_ts(7)
+    local = bound.astimezone()  # тот же момент с таймзоной сервера
+    expected = [item["id"] for item in api.get(
+        "/history", params={"ts_from": bound.isoformat()}, headers=admin_headers
+    ).json()]
+
+    for value in (
+        bound.isoformat(sep=" "),
+        local.astimezone(timezone.utc).isoformat(),
+        local.astimezone(timezone(timedelta(hours=-5))).isoformat(),
+    ):
+        response = api.get("/history", params={"ts_from": value}, headers=admin_headers)
+        assert [item["id"] for item in response.json()] == expected, value
+
+    assert service._to_db_ts(START) == "2024-02-01T12:00:00"
+    assert service._to_db_ts(stored_ts(1)) == "2024-02-01T12:10:00.250000"
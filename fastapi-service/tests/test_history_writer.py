@@ -0,0 +1,130 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from utils.history_writer import HistoryWriter
+
+
+def put(writer, n):
+    writer.put({"n": n}, {"uplift": []}, 200, 0.01, 10, 2)
+
+
+def written(db_file):
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute("SELECT input_data FROM history ORDER BY id").fetchall()
+    conn.close()
+    return [json.loads(row[0])["n"] for row in rows]
+
+
+@pytest.fixture
+def stalled(history_db):
+    """
+    Писатель с очередью на 2 строки, который застрял на записи строки 0:
+    on_write ждёт gate. Возвращает (фабрика писателя, gate)
+    """
+    gate = threading.Event()
+    writers = []
+
+    def make(overflow, **kwargs):
+        entered = threading.Event()
+
+        def on_write(conn, rows):
+            entered.set()
+            gate.wait(5)
+
+        writer = HistoryWriter(
+            history_db, batch_size=1, flush_interval=0, max_queue_size=2, overflow=overflow,
+            on_write=on_write, **kwargs,
+        )
+        writers.append(writer)
+        put(writer, 0)
+        assert entered.wait(5)
+        put(writer, 1)
+        put(writer, 2)
+        return writer
+
+    yield make, gate
+    gate.set()
+    for writer in writers:
+        writer.close()
+
+
+@pytest.mark.parametrize("overflow, expected", [("drop_new", [0, 1, 2]), ("drop_oldest", [0, 2, 3])])
+def test_drop_policies(history_db, stalled, overflow, expected):
+    make, gate = stalled
+    writer = make(overflow)
+    put(writer, 3)
+    assert writer.dropped == 1
+
+    gate.set()
+    writer.close()
+    assert written(history_db) == expected
+    assert writer.written == 3
+
+
+def test_block_policy_waits_for_space(history_db, stalled):
+    make, gate = stalled
+    writer = make("block", block_timeout=5)
+    blocked = threading.Thread(target=put, args=(writer, 3))
+    blocked.start()
+    blocked.join(0.05)
+    assert blocked.is_alive()
+
+    gate.set()
+    blocked.join(5)
+    writer.close()
+    assert written(history_db) == [0, 1, 2, 3] and writer.dropped == 0
+
+
+def test_block_policy_drops_after_timeout(history_db, stalled):
+    make, gate = stalled
+    writer = make("block", block_timeout=0.05)
+    put(writer, 3)
+    assert writer.dropped == 1
+
+    gate.set()
+    writer.close()
+    assert written(history_db) == [0, 1, 2]
+
+
+def test_concurrent_drops_are_counted(history_db, stalled):
+    make, gate = stalled
+    writer = make("drop_new")
+    threads = [
+        threading.Thread(target=lambda: [put(writer, 100) for _ in range(200)]) for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert writer.dropped == 8 * 200
+
+
+def test_flush_writes_everything_queued_before_it_in_order(history_db):
+    writer = HistoryWriter(history_db, batch_size=7, flush_interval=60)
+    try:
+        for n in range(30):
+            put(writer, n)
+        assert writer.flush(5)
+        assert written(history_db) == list(range(30))
+    finally:
+        writer.close()
+
+
+def test_close_drains_queue(history_db):
+    rows = []
+    writer = HistoryWriter(history_db, batch_size=1000, flush_interval=60,
+                           on_write=lambda conn, batch: rows.extend(batch))
+    for n in range(50):
+        put(writer, n)
+    writer.close()
+
+    assert written(history_db) == list(range(50))
+    assert len(rows) == 50 and writer.written == 50
+
+    # после остановки строки пишутся синхронно
+    put(writer, 50)
+    assert written(history_db)[-1] == 50 and writer.written == 51
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.feature_extraction import UpliftFeatureExtractor
+from utils.inference_feature_extractor import UpliftFeatureExtractorInference
+
+# признаки из сумм по purchases: в low_memory они считаются во float32 и такими и остаются
+FLOAT32_COLUMNS = {
+    "avg_transaction_amount",
+    "max_transaction_amount",
+    "min_transaction_amount",
+    "total_express_points_received",
+    "total_express_points_spent",
+    "avg_express_points_per_transaction",
+    "points_earned_to_spent_ratio",
+    "avg_product_quantity",
+    "points_balance_ratio",
+    "log_total_purchase_sum",
+}
+
+EXTRACTORS = pytest.mark.parametrize(
+    "extractor", [UpliftFeatureExtractor, UpliftFeatureExtractorInference], ids=["train", "inference"]
+)
+
+
+def legacy_sanitize(final_df, fill_nan=False):
+    """Исходная очистка - отдельным проходом по каждой числовой колонке (инференс заполняет NaN нулём)"""
+    for col in final_df.select_dtypes(include=[np.number]).columns:
+        s = final_df[col]
+        if fill_nan:
+            s = s.fillna(0.0)
+        s = s.replace([np.inf, -np.inf], 1e9)
+        s = np.clip(s, -1e9, 1e9)
+        final_df[col] = s.round(6)
+    return final_df
+
+
+def calculate(extractor, x5):
+    if isinstance(extractor, UpliftFeatureExtractorInference):
+        return extractor.calculate_features(x5["clients"], x5["purchases"])
+    return extractor.calculate_features(x5["clients"], x5["train"], x5["treatment"], x5["target"], x5["purchases"])
+
+
+@EXTRACTORS
+def test_sanitize_matches_legacy(extractor):
+    df = pd.DataFrame({
+        "ratio": [np.inf, -np.inf, 2e9, -3e9, 0.1234567891, np.nan],
+        "count": np.array([1, 2, 3, 4, 5, 6], dtype=np.int64),
+        "small": np.array([0.5, 1e-7, 3.0, np.inf, -1.0, 2.0], dtype=np.float32),
+        "gender": pd.Categorical(["F", "M", "U", "F", "M", "U"]),
+    })
+    expected = legacy_sanitize(df.copy(), fill_nan=extractor is UpliftFeatureExtractorInference)
+    result = extractor().sanitize_features(df.copy())
+
+    pd.testing.assert_frame_equal(result, expected)
+    assert result.dtypes.to_dict() == df.dtypes.to_dict()
+
+
+@EXTRACTORS
+def test_default_output_matches_legacy_sanitize(x5, monkeypatch, extractor):
+    result = calculate(extractor(), {name: frame.copy() for name, frame in x5.items()})
+    fill_nan = extractor is UpliftFeatureExtractorInference
+    monkeypatch.setattr(extractor, "sanitize_features", lambda self, df: legacy_sanitize(df, fill_nan))
+    pd.testing.assert_frame_equal(result, calculate(extractor(), x5))
+
+
+@EXTRACTORS
+def test_low_memory_matches_default(x5, extractor):
+    original = {name: frame.copy() for name, frame in x5.items()}
+    default = calculate(extractor(), {name: frame.copy() for name, frame in x5.items()})
+    low_memory = calculate(extractor(low_memory=True), x5)
+
+    # входные таблицы не меняются, хотя копий low_memory не делает
+    for name, frame in original.items():
+        if isinstance(frame, pd.DataFrame):
+            pd.testing.assert_frame_equal(x5[name], frame)
+
+    assert list(low_memory.columns) == list(default.columns)
+    float32 = {col for col, dtype in low_memory.dtypes.items() if dtype == np.float32}
+    assert float32 == FLOAT32_COLUMNS
+    assert all(default[col].dtype == np.float64 for col in FLOAT32_COLUMNS)
+
+    pd.testing.assert_frame_equal(
+        low_memory.astype({col: np.float64 for col in FLOAT32_COLUMNS}), default,
+        check_exact=False, rtol=1e-5,
+    )
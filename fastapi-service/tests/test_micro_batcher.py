@@ -0,0 +1,124 @@
+import asyncio
+import os
+
+import pandas as pd
+import pytest
+
+from utils.inference_feature_extractor import UpliftFeatureExtractorInference
+from utils.micro_batcher import MicroBatcher
+from utils.scoring import score_clients_batch
+from utils.scoring_pool import ScoringOverloaded
+
+
+def split_requests(payload):
+    """Запросы по клиентам payload: 7 и 555 - вместе, остальные - по одному"""
+    groups = [[7, 555], [123], [9]]
+    return [
+        (
+            pd.DataFrame([c for c in payload["client"] if c["client_id"] in ids]),
+            pd.DataFrame([p for p in payload["purchases"] if p["client_id"] in ids]),
+        )
+        for ids in groups
+    ]
+
+
+def test_micro_batched_matches_direct(model, payload):
+    model, _, _ = model
+    fe = UpliftFeatureExtractorInference(drop_redundant=True)
+    requests = split_requests(payload)
+    calls = []
+
+    async def run_batch(client_df, purchases_df):
+        calls.append(len(client_df))
+        return score_clients_batch(fe, model, client_df, purchases_df), 0.0
+
+    async def main():
+        batcher = MicroBatcher(run_batch, max_wait=0.05, max_clients=256)
+        outcomes = await asyncio.gather(*(batcher.submit(c, p) for c, p in requests))
+        await batcher.stop()
+        return batcher, outcomes
+
+    batcher, outcomes = asyncio.run(main())
+
+    assert calls == [4] and batcher.batches == 1
+    for (client_df, purchases_df), (results, queue_time) in zip(requests, outcomes):
+        assert results == score_clients_batch(fe, model, client_df, purchases_df)
+        assert queue_time >= 0
+
+
+def test_same_client_waits_for_next_batch():
+    calls = []
+
+    async def run_batch(client_df, purchases_df):
+        calls.append(sorted(client_df["client_id"]))
+        return [{"client_id": int(cid), "uplift": 0.0} for cid in sorted(client_df["client_id"])], 0.0
+
+    async def main():
+        batcher = MicroBatcher(run_batch, max_wait=0.01)
+        frame = lambda *ids: pd.DataFrame({"client_id": list(ids)})
+        purchases = pd.DataFrame({"client_id": []})
+        await asyncio.gather(
+            batcher.submit(frame(1, 2), purchases),
+            batcher.submit(frame(2), purchases),
+            batcher.submit(frame(3), purchases),
+        )
+        await batcher.stop()
+
+    asyncio.run(main())
+    assert calls == [[1, 2, 3], [2]]
+
+
+def test_queue_is_bounded_and_stop_drains_it():
+    release = None
+    scored = []
+
+    async def run_batch(client_df, purchases_df):
+        await release.wait()
+        scored.extend(client_df["client_id"])
+        return [{"client_id": int(cid), "uplift": 0.0} for cid in client_df["client_id"]], 0.0
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        # батч не соберётся до stop(): ждать попутные запросы можно долго
+        batcher = MicroBatcher(run_batch, max_wait=60, max_queue=2)
+        frame = lambda cid: pd.DataFrame({"client_id": [cid]})
+        purchases = pd.DataFrame({"client_id": []})
+
+        first = asyncio.ensure_future(batcher.submit(frame(1), purchases))
+        second = asyncio.ensure_future(batcher.submit(frame(2), purchases))
+        await asyncio.sleep(0.01)
+        with pytest.raises(ScoringOverloaded):
+            await batcher.submit(frame(3), purchases)
+        assert batcher.stats()["queued"] == 2 and batcher.rejected == 1
+
+        stopping = asyncio.ensure_future(batcher.stop())
+        await asyncio.sleep(0.01)
+        # батч в работе удерживается ссылкой, пока не завершится
+        assert len(batcher._tasks) == 1 and not stopping.done()
+        release.set()
+        await stopping
+        assert not batcher._tasks
+        return await first, await second
+
+    (first, _), (second, _) = asyncio.run(main())
+    assert sorted(scored) == [1, 2]
+    assert first == [{"client_id": 1, "uplift": 0.0}] and second == [{"client_id": 2, "uplift": 0.0}]
+
+
+def test_forward_through_micro_batcher_matches_direct(api, service, monkeypatch, payload):
+    monkeypatch.setattr(service, "feature_cache", None)
+    monkeypatch.setattr(service, "micro_batcher", None)
+    direct = api.post("/forward", json=payload).json()
+
+    monkeypatch.setattr(service, "micro_batcher", MicroBatcher(service.run_scoring, max_wait=0.001))
+    batched = api.post("/forward", json=payload)
+    assert batched.status_code == 200, batched.text
+    assert batched.json() == direct
+    assert service.micro_batcher.batches == 1
+
+
+@pytest.mark.skipif("MICRO_BATCH_MAX_WAIT_MS" in os.environ, reason="задан в окружении")
+def test_micro_batching_is_opt_in(service):
+    assert service.MICRO_BATCH_MAX_WAIT_MS == 0
+    assert service.micro_batcher is None
@@ -0,0 +1,83 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import MODEL_ARTIFACT_DIR, MODEL_PICKLE_PATH, make_client
+from utils.feature_extraction import UpliftFeatureExtractor
+from utils.inference_feature_extractor import UpliftFeatureExtractorInference
+from utils.model_artifact import export_t_learner_artifact, load_model
+from utils.scoring_pool import _worker, init_scoring_worker
+
+
+@pytest.fixture(scope="module")
+def fitted_age():
+    """Статистики fit_age_imputation на синтетических возрастах (с выбросами)"""
+    rng = np.random.default_rng(0)
+    age = pd.Series(np.concatenate([rng.integers(18, 90, size=1000), [3, 7, 150, 900, np.nan]]))
+    return UpliftFeatureExtractor.fit_age_imputation(age)
+
+
+@pytest.fixture(scope="module")
+def exported(tmp_path_factory, fitted_age):
+    """Модель сервиса, переэкспортированная с preprocessing: (каталог артефакта, pickle)"""
+    with open(MODEL_PICKLE_PATH, "rb") as f:
+        loaded = pickle.load(f)
+    path = tmp_path_factory.mktemp("model")
+    preprocessing = {"age": fitted_age}
+
+    with open(path / "model.pkl", "wb") as f:
+        pickle.dump(dict(loaded, preprocessing=preprocessing), f)
+    export_t_learner_artifact(loaded["model"], loaded["feature_names"], str(path / "artifact"), preprocessing)
+    return str(path / "artifact"), str(path / "model.pkl")
+
+
+@pytest.mark.parametrize("artifact_dir", [MODEL_ARTIFACT_DIR, "missing-artifact-dir"], ids=["artifact", "pickle"])
+def test_shipped_model_has_no_age_stats(artifact_dir):
+    # поставляемая модель обучена до появления preprocessing
+    _, _, preprocessing = load_model(artifact_dir, MODEL_PICKLE_PATH)
+    assert preprocessing == {}
+
+
+def test_service_startup_falls_back_without_age_stats(service):
+    service.get_model()
+    assert service.fe.age_params is None
+
+
+def test_process_worker_falls_back_without_age_stats():
+    init_scoring_worker(MODEL_ARTIFACT_DIR, MODEL_PICKLE_PATH)
+    try:
+        assert _worker["fe"].age_params is None
+    finally:
+        _worker.clear()
+
+
+def test_fallback_leaves_out_of_range_age_empty(payload):
+    fe = UpliftFeatureExtractorInference(drop_redundant=True)
+    fe.set_preprocessing({})
+    clients = pd.DataFrame(payload["client"])
+
+    processed = fe.preprocess_clients_inference(clients)
+    assert processed.loc[123, "age"] == 35
+    assert processed.loc[[7, 555], "age"].isna().all()
+
+    features = fe.calculate_features(clients, pd.DataFrame(payload["purchases"]))
+    assert features.loc[[7, 555], "age"].tolist() == [0, 0]
+
+
+@pytest.mark.parametrize("use_artifact", [True, False], ids=["artifact", "pickle"])
+def test_exported_age_stats_round_trip(exported, fitted_age, use_artifact):
+    artifact_dir, pickle_path = exported
+    _, _, preprocessing = load_model(artifact_dir if use_artifact else "missing-artifact-dir", pickle_path)
+    assert preprocessing == {"age": fitted_age}
+
+    init_scoring_worker(artifact_dir, pickle_path)
+    try:
+        fe = _worker["fe"]
+    finally:
+        _worker.clear()
+    processed = fe.preprocess_clients_inference(
+        pd.DataFrame([make_client(1, age=5), make_client(2, age=420), make_client(3, age=35)])
+    )
+    assert processed["age"].tolist() == [fitted_age["mean_q1"], fitted_age["mean"], 35]
@@ -0,0 +1,118 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import MODEL_PICKLE_PATH
+from utils.fused_scorer import FusedTLearnerScorer, build_fused_scorer, validate_scorer, validation_sample
+from utils.model_artifact import TLearnerArtifact
+from utils.inference_feature_extractor import UpliftFeatureExtractorInference
+
+
+@pytest.fixture(scope="module")
+def sklearn_model():
+    with open(MODEL_PICKLE_PATH, "rb") as f:
+        return pickle.load(f)["model"]
+
+
+@pytest.fixture
+def features(model, payload):
+    """Признаки payload плюс строки с неизвестной категорией и NaN в категориях"""
+    _, feature_names, _ = model
+    fe = UpliftFeatureExtractorInference(drop_redundant=True)
+    X = fe.calculate_features(pd.DataFrame(payload["client"]), pd.DataFrame(payload["purchases"]))
+    X = X.reindex(columns=feature_names)
+    extra = X.iloc[:2].copy()
+    for col in extra.columns[extra.dtypes == object]:
+        extra[col] = ["never-seen-category", None]
+    return pd.concat([X, extra], ignore_index=True)
+
+
+def test_artifact_matches_sklearn_predict(model, sklearn_model, features):
+    artifact, _, _ = model
+    np.testing.assert_allclose(artifact.predict(features), sklearn_model.predict(features), atol=1e-9)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_fused_scorer_matches_sklearn_predict(model, sklearn_model, features, dtype):
+    artifact, feature_names, _ = model
+    for scorer in (
+        FusedTLearnerScorer.from_artifact(artifact, dtype=dtype),
+        FusedTLearnerScorer.from_model(sklearn_model, feature_names, dtype=dtype),
+    ):
+        assert validate_scorer(scorer, sklearn_model, features, atol=1e-5) <= 1e-5
+
+
+def test_validate_scorer_rejects_mismatch(model, sklearn_model, features):
+    scorer = FusedTLearnerScorer.from_artifact(model[0])
+    scorer.bias = scorer.bias + np.array([0.5, 0.0], dtype=scorer.dtype)
+    with pytest.raises(ValueError):
+        validate_scorer(scorer, sklearn_model, features)
+
+
+@pytest.fixture
+def stale_scorer(monkeypatch):
+    """from_artifact/from_model отдают скорер со сдвинутым свободным членом treatment-ветки"""
+    for name in ("from_artifact", "from_model"):
+        build = getattr(FusedTLearnerScorer, name).__func__
+
+        def shifted(cls, *args, _build=build, **kwargs):
+            scorer = _build(cls, *args, **kwargs)
+            scorer.bias = scorer.bias + np.array([0.5, 0.0], dtype=scorer.dtype)
+            return scorer
+
+        monkeypatch.setattr(FusedTLearnerScorer, name, classmethod(shifted))
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_validation_sample_matches_model(model, sklearn_model, dtype):
+    artifact, feature_names, _ = model
+    scorer = FusedTLearnerScorer.from_artifact(artifact, dtype=dtype)
+    X = validation_sample(scorer)
+
+    assert list(X.columns) == feature_names
+    assert X[scorer.cat_cols].isna().any().all()
+    # признаки вокруг средних обучения: uplift не вырождается в 0, точность float32 - с запасом
+    assert np.std(sklearn_model.predict(X)) > 0.01
+    assert validate_scorer(scorer, sklearn_model, X, atol=1e-6) <= 1e-6
+
+
+def test_build_fused_scorer_validates(model, sklearn_model):
+    artifact, feature_names, _ = model
+    assert isinstance(build_fused_scorer(artifact, feature_names), FusedTLearnerScorer)
+    assert isinstance(build_fused_scorer(sklearn_model, feature_names), FusedTLearnerScorer)
+
+
+def test_build_fused_scorer_falls_back_on_mismatch(model, sklearn_model, stale_scorer, capsys):
+    artifact, feature_names, _ = model
+    assert build_fused_scorer(artifact, feature_names) is artifact
+    assert build_fused_scorer(sklearn_model, feature_names) is sklearn_model
+    assert "model.predict" in capsys.readouterr().out
+    # без проверки скорер подменил бы модель
+    assert isinstance(build_fused_scorer(artifact, feature_names, validate=False), FusedTLearnerScorer)
+
+
+def test_build_fused_scorer_falls_back_on_broken_artifact(model, monkeypatch, capsys):
+    artifact, feature_names, _ = model
+
+    def broken(cls, artifact, dtype=np.float32):
+        raise KeyError("arms")
+
+    monkeypatch.setattr(FusedTLearnerScorer, "from_artifact", classmethod(broken))
+    assert build_fused_scorer(artifact, feature_names) is artifact
+    assert "model.predict" in capsys.readouterr().out
+
+
+def test_service_serves_model_when_scorer_is_stale(api, service, payload, stale_scorer, monkeypatch):
+    expected = api.post("/forward", json=payload).json()["uplift"]
+    monkeypatch.setattr(service, "FUSED_SCORER", True)
+    monkeypatch.setattr(service, "model", None)
+    monkeypatch.setattr(service, "feature_cache", None)
+
+    assert isinstance(service.get_model(), TLearnerArtifact)
+    response = api.post("/forward", json=payload)
+    assert response.status_code == 200
+    for got, want in zip(response.json()["uplift"], expected):
+        assert got["client_id"] == want["client_id"]
+        assert got["uplift"] == pytest.approx(want["uplift"], abs=1e-5)
@@ -0,0 +1,73 @@
+import filecmp
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from utils import feature_extraction
+from utils.feature_extraction import UpliftFeatureExtractor, generate_behavioral_features_parallel
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class FailingExtractor(UpliftFeatureExtractor):
+    def generate_behavioral_features(self, purchases_df):
+        raise RuntimeError("worker failed")
+
+
+@pytest.fixture
+def created_segments(monkeypatch):
+    """Имена блоков shared memory, созданных generate_behavioral_features_parallel"""
+    names = []
+
+    class RecordingSharedMemory(shared_memory.SharedMemory):
+        def __init__(self, name=None, create=False, size=0):
+            super().__init__(name=name, create=create, size=size)
+            if create:
+                names.append(self.name)
+
+    monkeypatch.setattr(feature_extraction.shared_memory, "SharedMemory", RecordingSharedMemory)
+    return names
+
+
+def assert_unlinked(names):
+    assert names
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+
+def features(x5, n_jobs):
+    return UpliftFeatureExtractor(n_jobs=n_jobs).calculate_features(
+        x5["clients"], x5["train"], x5["treatment"], x5["target"], x5["purchases"]
+    )
+
+
+def test_parallel_matches_calculate_features(x5_data):
+    copy = lambda: {name: frame.copy() for name, frame in x5_data.items()}
+    pd.testing.assert_frame_equal(features(copy(), n_jobs=2), features(copy(), n_jobs=1))
+
+
+def test_segments_unlinked_after_success(x5, created_segments):
+    extractor = UpliftFeatureExtractor()
+    purchases = extractor.preprocess_purchases(x5["purchases"])
+
+    parallel = generate_behavioral_features_parallel(extractor, purchases, n_jobs=2)
+    pd.testing.assert_frame_equal(parallel, extractor.generate_behavioral_features(purchases))
+    assert_unlinked(created_segments)
+
+
+def test_segments_unlinked_after_worker_error(x5, created_segments):
+    extractor = FailingExtractor()
+    purchases = extractor.preprocess_purchases(x5["purchases"])
+
+    with pytest.raises(RuntimeError, match="worker failed"):
+        generate_behavioral_features_parallel(extractor, purchases, n_jobs=2)
+    assert_unlinked(created_segments)
+
+
+@pytest.mark.parametrize("name", ["feature_extraction.py", "model_extraction.py", "feature_snapshot.py"])
+def test_basic_models_copies_are_identical(name):
+    # basic_models/ держит копии модулей сервиса для ноутбуков - тесты выше покрывают и их
+    assert filecmp.cmp(ROOT / "utils" / name, ROOT.parent / "basic_models" / name, shallow=False)
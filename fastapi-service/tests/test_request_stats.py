@@ -0,0 +1,155 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from utils.request_stats import DDSketch, RequestStats
+
+START = datetime(2024, 2, 1, 12, 0, 0)
+
+
+def sketch_of(values, relative_accuracy=0.01):
+    sketch = DDSketch(relative_accuracy)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def copy_of(sketch):
+    return DDSketch.from_dict(sketch.to_dict())
+
+
+def history_rows(n, seed, status=200):
+    """Строки в формате HistoryWriter: (ts, processing_time, input_size, input_tokens, status)"""
+    rng = np.random.default_rng(seed)
+    return [
+        (
+            (START + timedelta(minutes=int(minute))).isoformat(),
+            float(t),
+            int(size),
+            int(size) // 4,
+            status,
+        )
+        for minute, t, size in zip(
+            rng.integers(0, 180, n), rng.lognormal(-3, 1, n), rng.integers(100, 5000, n)
+        )
+    ]
+
+
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.05])
+def test_quantiles_within_relative_accuracy(relative_accuracy):
+    values = np.random.default_rng(0).lognormal(-3, 1.5, 20_000)
+    sketch = sketch_of(values, relative_accuracy)
+
+    for q in (0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 1.0):
+        # скетч отдаёт элемент ранга floor(q * (n - 1))
+        exact = np.quantile(values, q, method="lower")
+        assert abs(sketch.quantile(q) - exact) <= relative_accuracy * exact
+
+
+def test_zero_and_empty_sketch():
+    assert DDSketch().quantile(0.5) is None
+
+    sketch = sketch_of([0.0, 0.0, 0.0, 2.0])
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(2.0, rel=0.01)
+
+
+def test_merge_is_associative_and_lossless():
+    rng = np.random.default_rng(1)
+    parts = [rng.lognormal(-2, 1, 1000) for _ in range(3)]
+    a, b, c = (sketch_of(p) for p in parts)
+
+    left = copy_of(a)
+    left.merge(b)
+    left.merge(c)
+    bc = copy_of(b)
+    bc.merge(c)
+    right = copy_of(a)
+    right.merge(bc)
+    whole = sketch_of(np.concatenate(parts))
+
+    for sketch in (left, right):
+        assert sketch.bins == whole.bins
+        assert (sketch.count, sketch.zero_count) == (whole.count, whole.zero_count)
+
+
+def test_persist_restart_load_round_trip(history_db):
+    rows = history_rows(500, seed=2) + history_rows(50, seed=3, status=403)
+    conn = sqlite3.connect(history_db)
+    stats = RequestStats(persist_interval=3600)
+    with conn:
+        stats.record_rows(conn, rows)
+        stats.persist(conn)
+    conn.close()
+
+    # перезапуск: новый объект поднимает снапшот из request_stats
+    restarted = RequestStats(persist_interval=3600)
+    conn = sqlite3.connect(history_db)
+    restarted.load(conn)
+    conn.close()
+
+    assert restarted.summary() == stats.summary()
+    summary = restarted.summary()
+    assert summary["processing_time"]["count"] == 550
+    assert set(summary["by_status"]) == {"200", "403"}
+    assert len(summary["windows"]) == 3
+
+
+def test_load_without_snapshot_rebuilds_from_history(history_db):
+    rows = history_rows(100, seed=4)
+    conn = sqlite3.connect(history_db)
+    with conn:
+        conn.executemany(
+            "INSERT INTO history (ts, processing_time, input_size, input_tokens, status_code) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+    stats = RequestStats()
+    stats.load(conn)
+
+    expected = RequestStats(persist_interval=3600)
+    expected.record_rows(conn, rows)
+    assert stats.summary() == expected.summary()
+    assert conn.execute("SELECT COUNT(*) FROM request_stats").fetchone()[0] == 1
+    conn.close()
+
+
+def test_workers_merge_into_one_snapshot(history_db):
+    conn = sqlite3.connect(history_db)
+    first, second = RequestStats(persist_interval=3600), RequestStats(persist_interval=3600)
+    for stats, seed in ((first, 5), (second, 6)):
+        stats.load(conn)
+        with conn:
+            stats.record_rows(conn, history_rows(200, seed))
+            stats.persist(conn)
+
+    merged = RequestStats()
+    merged.load(conn)
+    conn.close()
+    assert merged.summary()["processing_time"]["count"] == 400
+
+
+def test_failed_persist_keeps_pending_delta(history_db, monkeypatch):
+    conn = sqlite3.connect(history_db)
+    stats = RequestStats(persist_interval=3600)
+    stats.record_rows(conn, history_rows(100, seed=7))
+
+    def failing_write(conn, state):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(stats, "_write_snapshot", failing_write)
+    with pytest.raises(sqlite3.OperationalError):
+        with conn:
+            stats.persist(conn)
+    # строки, пришедшие после неудачной записи, складываются с возвращённой дельтой
+    stats.record_rows(conn, history_rows(20, seed=8))
+    assert stats.summary()["processing_time"]["count"] == 120
+
+    monkeypatch.undo()
+    with conn:
+        stats.persist(conn)
+    restarted = RequestStats()
+    restarted.load(conn)
+    conn.close()
+    assert restarted.summary()["processing_time"]["count"] == 120
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from conftest import make_client, make_purchase
+from utils.inference_feature_extractor import UpliftFeatureExtractorInference
+from utils.scoring import score_clients_batch, score_clients_per_client
+
+AGE_PARAMS = {"age": {"mean_q1": 25.0, "mean_q4": 70.0, "mean": 45.0}}
+
+
+def frames(payload):
+    return pd.DataFrame(payload["client"]), pd.DataFrame(payload["purchases"])
+
+
+def by_id(results):
+    return {r["client_id"]: r["uplift"] for r in results}
+
+
+def forward(api, service, monkeypatch, payload, mode):
+    monkeypatch.setattr(service, "SCORING_MODE", mode)
+    monkeypatch.setattr(service, "feature_cache", None)
+    monkeypatch.setattr(service, "micro_batcher", None)
+    response = api.post("/forward", json=payload)
+    assert response.status_code == 200, response.text
+    return response.json()["uplift"]
+
+
+def test_forward_batch_matches_per_client(api, service, monkeypatch, payload):
+    batch = forward(api, service, monkeypatch, payload, "batch")
+    per_client = forward(api, service, monkeypatch, payload, "per_client")
+
+    assert [r["client_id"] for r in batch] == [7, 9, 123, 555]
+    assert by_id(batch) == pytest.approx(by_id(per_client), abs=1e-9)
+
+
+@pytest.mark.parametrize("preprocessing", [None, AGE_PARAMS], ids=["no_age_stats", "fitted_age_stats"])
+def test_batch_matches_per_client(model, payload, preprocessing):
+    model, _, _ = model
+    fe = UpliftFeatureExtractorInference(drop_redundant=True)
+    fe.set_preprocessing(preprocessing)
+    client_df, purchases_df = frames(payload)
+
+    batch = score_clients_batch(fe, model, client_df, purchases_df)
+    per_client = score_clients_per_client(fe, model, client_df, purchases_df)
+    assert by_id(batch) == pytest.approx(by_id(per_client), abs=1e-9)
+
+
+@pytest.mark.parametrize("preprocessing", [None, AGE_PARAMS], ids=["no_age_stats", "fitted_age_stats"])
+def test_uplift_does_not_depend_on_other_clients(model, payload, preprocessing):
+    model, _, _ = model
+    fe = UpliftFeatureExtractorInference(drop_redundant=True)
+    fe.set_preprocessing(preprocessing)
+    client_df, purchases_df = frames(payload)
+    full = by_id(score_clients_batch(fe, model, client_df, purchases_df))
+
+    for client_id in (7, 555):
+        alone = {
+            "client": [c for c in payload["client"] if c["client_id"] == client_id],
+            "purchases": [p for p in payload["purchases"] if p["client_id"] == client_id],
+        }
+        extra = {
+            "client": alone["client"] + [make_client(1000 + i, age=18 + 20 * i) for i in range(3)],
+            "purchases": alone["purchases"] + [make_purchase(1000 + i, 100 + i, 300 * (i + 1)) for i in range(3)],
+        }
+        for request in (alone, extra):
+            result = by_id(score_clients_batch(fe, model, *frames(request)))
+            assert result[client_id] == pytest.approx(full[client_id], abs=1e-9)
+
+
+def test_fitted_age_stats_replace_out_of_range_age():
+    fe = UpliftFeatureExtractorInference()
+    age = pd.Series([5.0, 35.0, 150.0, 420.0, None])
+
+    assert fe.impute_age(age).iloc[1] == 35.0
+    assert fe.impute_age(age).drop(1).isna().all()
+
+    fe.set_preprocessing(AGE_PARAMS)
+    assert fe.impute_age(age).tolist() == [25.0, 35.0, 70.0, 45.0, 45.0]
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+
+import pandas as pd
+import pytest
+
+from conftest import MODEL_ARTIFACT_DIR, MODEL_PICKLE_PATH
+from utils.fused_scorer import build_fused_scorer
+from utils.inference_feature_extractor import UpliftFeatureExtractorInference
+from utils.scoring import score_clients_batch
+from utils.scoring_pool import (
+    ScoringOverloaded, ScoringPool, ScoringQueueTimeout, init_scoring_worker, score_in_worker,
+)
+
+
+def blocking_pool(**kwargs):
+    """Пул с одним воркером и задачей, которая ждёт release"""
+    pool = ScoringPool("thread", max_workers=1, **kwargs)
+    release = threading.Event()
+    return pool, release
+
+
+def test_pool_rejects_when_queue_is_full():
+    pool, release = blocking_pool(max_queue=1)
+
+    async def main():
+        running = asyncio.ensure_future(pool.run(release.wait))
+        queued = asyncio.ensure_future(pool.run(lambda: "queued"))
+        await asyncio.sleep(0.01)
+        assert pool.pending == 2
+
+        with pytest.raises(ScoringOverloaded):
+            await pool.run(lambda: "rejected")
+        # часть уже принятого запроса очередь не проверяет
+        extra = asyncio.ensure_future(pool.run(lambda: "extra", admit=False))
+        await asyncio.sleep(0.01)
+
+        release.set()
+        return await running, await queued, await extra
+
+    try:
+        running, queued, extra = asyncio.run(main())
+    finally:
+        pool.shutdown()
+
+    assert (running[0], queued[0], extra[0]) == (True, "queued", "extra")
+    assert queued[1] > 0  # ждал в очереди, пока работала первая задача
+    assert pool.stats()["rejected"] == 1 and pool.pending == 0
+
+
+def test_pool_queue_timeout():
+    pool, release = blocking_pool(max_queue=4, queue_timeout=0.05)
+
+    async def main():
+        running = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.01)
+        with pytest.raises(ScoringQueueTimeout):
+            await pool.run(lambda: "late")
+        release.set()
+        await running
+
+    try:
+        asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert pool.stats()["timed_out"] == 1 and pool.pending == 0
+
+
+def test_process_pool_matches_in_process_scoring(model, payload):
+    model, feature_names, preprocessing = model
+    client_df, purchases_df = pd.DataFrame(payload["client"]), pd.DataFrame(payload["purchases"])
+    fe = UpliftFeatureExtractorInference(drop_redundant=True)
+    fe.set_preprocessing(preprocessing)
+    expected = score_clients_batch(fe, build_fused_scorer(model, feature_names), client_df, purchases_df)
+
+    pool = ScoringPool(
+        "process", max_workers=1, initializer=init_scoring_worker,
+        initargs=(MODEL_ARTIFACT_DIR, MODEL_PICKLE_PATH),
+    )
+    try:
+        (results, stages), _, _ = asyncio.run(
+            pool.run(score_in_worker, "batch", client_df, purchases_df, True)
+        )
+    finally:
+        pool.shutdown()
+
+    assert results == expected
+    assert set(stages) == {"features", "predict"}
+
+
+@pytest.mark.parametrize("error, status", [(ScoringOverloaded, 429), (ScoringQueueTimeout, 503)])
+def test_forward_reports_overload(api, service, monkeypatch, payload, error, status):
+    async def overloaded(*args, **kwargs):
+        raise error("busy")
+
+    monkeypatch.setattr(service, "micro_batcher", None)
+    monkeypatch.setattr(service.scoring_pool, "run", overloaded)
+
+    response = api.post("/forward", json=payload)
+    assert response.status_code == status
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_forward_rejects_when_pool_is_full(api, service, monkeypatch, payload):
+    pool = service.scoring_pool
+    monkeypatch.setattr(service, "micro_batcher", None)
+    monkeypatch.setattr(pool, "_pending", pool.max_workers + pool.max_queue)
+    rejected = pool.rejected
+
+    assert api.post("/forward", json=payload).status_code == 429
+    assert pool.rejected == rejected + 1
@@ -0,0 +1,130 @@
+import json
+import re
+import sqlite3
+
+import pytest
+
+from conftest import make_client, make_purchase
+from utils.stage_timing import NULL_TIMER, StageMetrics, StageTimer
+
+SAMPLE = re.compile(r'^(?P<name>[a-z_]+)(?:\{(?P<labels>[^}]*)\})? (?P<value>\S+)$')
+FORWARD_STAGES = {"parse", "dataframe", "queue", "features", "predict", "serialize", "log"}
+
+
+def parse_metrics(text):
+    """Текст Prometheus -> {(имя, frozenset(метки)): значение}; строки # HELP/# TYPE пропускаются"""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        labels = frozenset(re.findall(r'(\w+)="([^"]*)"', match["labels"] or ""))
+        samples[(match["name"], labels)] = float(match["value"])
+    return samples
+
+
+def stage_histogram(samples, stage, endpoint="/forward"):
+    """(корзины по возрастанию границы, sum, count) гистограммы этапа"""
+    buckets = []
+    for (name, labels), value in samples.items():
+        labels = dict(labels)
+        if name == "uplift_request_stage_seconds_bucket" and labels["stage"] == stage and labels["endpoint"] == endpoint:
+            buckets.append((float(labels["le"]), value))
+    key = frozenset({("endpoint", endpoint), ("stage", stage)})
+    return sorted(buckets), samples[("uplift_request_stage_seconds_sum", key)], \
+        samples[("uplift_request_stage_seconds_count", key)]
+
+
+def single_client(client_id):
+    return {"client": [make_client(client_id)], "purchases": [make_purchase(client_id, client_id, 700)]}
+
+
+def history_stage_timings(service, client_id):
+    service.history_writer.flush(5)
+    conn = sqlite3.connect(service.history_writer.db_file)
+    rows = conn.execute(
+        "SELECT stage_timings FROM history WHERE input_data LIKE ?", (f'%"client_id": {client_id}%',)
+    ).fetchall()
+    conn.close()
+    assert len(rows) == 1
+    return rows[0][0]
+
+
+def test_stage_timer_sums_repeated_stages():
+    timer = StageTimer()
+    with timer.stage("features"):
+        pass
+    with timer.stage("features"):
+        pass
+    timer.add("queue", 0.25)
+    timer.add("queue", None)
+    timer.update({"predict": 0.5, "queue": 0.25})
+
+    assert set(timer.stages) == {"features", "queue", "predict"}
+    assert timer.stages["queue"] == 0.5 and timer.stages["features"] >= 0
+
+    with NULL_TIMER.stage("features"):
+        NULL_TIMER.add("queue", 1.0)
+    assert NULL_TIMER.stages == {}
+
+
+def test_stage_metrics_render():
+    metrics = StageMetrics(buckets=(0.01, 0.1, 1.0))
+    metrics.observe("/forward", 200, {"predict": 0.005, "features": 0.05})
+    metrics.observe("/forward", 200, {"predict": 0.5})
+    metrics.observe("/forward", 429, {})
+    samples = parse_metrics(metrics.render(gauges={"queue_size": 3}, counters={"dropped_total": 2}))
+
+    assert samples[("uplift_requests_total", frozenset({("endpoint", "/forward"), ("status", "200")}))] == 2
+    assert samples[("uplift_requests_total", frozenset({("endpoint", "/forward"), ("status", "429")}))] == 1
+    buckets, total, count = stage_histogram(samples, "predict")
+    assert buckets == [(0.01, 1), (0.1, 1), (1.0, 2), (float("inf"), 2)]
+    assert total == pytest.approx(0.505) and count == 2
+    assert samples[("uplift_queue_size", frozenset())] == 3
+    assert samples[("uplift_dropped_total", frozenset())] == 2
+
+
+def test_metrics_endpoint_after_forward(api, service, monkeypatch):
+    monkeypatch.setattr(service, "STAGE_TIMINGS", True)
+    monkeypatch.setattr(service, "micro_batcher", None)
+    ok = frozenset({("endpoint", "/forward"), ("status", "200")})
+    before = parse_metrics(api.get("/metrics").text)
+
+    assert api.post("/forward", json=single_client(41_001)).status_code == 200
+    response = api.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE uplift_request_stage_seconds histogram" in response.text
+    after = parse_metrics(response.text)
+
+    assert after[("uplift_requests_total", ok)] == before.get(("uplift_requests_total", ok), 0) + 1
+    for stage in FORWARD_STAGES:
+        buckets, _, count = stage_histogram(after, stage)
+        counts = [value for _, value in buckets]
+        assert counts == sorted(counts) and buckets[-1] == (float("inf"), count)
+        previous = stage_histogram(before, stage)[2] if any(
+            dict(labels).get("stage") == stage for _, labels in before
+        ) else 0
+        assert count == previous + 1
+    assert ("uplift_scoring_pool_pending", frozenset()) in after
+
+    timings = json.loads(history_stage_timings(service, 41_001))
+    # этап log замеряется уже после постановки строки в очередь истории
+    assert set(timings) == FORWARD_STAGES - {"log"}
+
+
+def test_stage_timings_disabled(api, service, monkeypatch):
+    monkeypatch.setattr(service, "STAGE_TIMINGS", False)
+    monkeypatch.setattr(service, "micro_batcher", None)
+    ok = frozenset({("endpoint", "/forward"), ("status", "200")})
+    before = parse_metrics(api.get("/metrics").text)
+
+    assert api.post("/forward", json=single_client(41_002)).status_code == 200
+    after = parse_metrics(api.get("/metrics").text)
+
+    assert history_stage_timings(service, 41_002) is None
+    # без замеров учитывается только счётчик запросов
+    assert after[("uplift_requests_total", ok)] == before.get(("uplift_requests_total", ok), 0) + 1
+    hist = {k: v for k, v in after.items() if k[0].startswith("uplift_request_stage_seconds")}
+    assert hist == {k: v for k, v in before.items() if k[0].startswith("uplift_request_stage_seconds")}
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+
+from utils.streaming import iter_ndjson_batches
+
+
+def to_ndjson(payload):
+    """Строка на клиента: {"client": ..., "purchases": [...]}"""
+    lines = []
+    for client in payload["client"]:
+        purchases = [p for p in payload["purchases"] if p["client_id"] == client["client_id"]]
+        lines.append(json.dumps({"client": client, "purchases": purchases}))
+    return "\n".join(lines) + "\n"
+
+
+def read_lines(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def assert_not_in_event_loop():
+    with pytest.raises(RuntimeError):
+        asyncio.get_running_loop()
+
+
+@pytest.mark.parametrize("batch_size", [1, 3, 1000])
+def test_stream_matches_forward(api, service, monkeypatch, payload, batch_size):
+    monkeypatch.setattr(service, "STREAM_BATCH_SIZE", batch_size)
+    body = to_ndjson(payload).replace("\n", "\n{broken json\n", 1)
+
+    response = api.post("/forward/stream", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200, response.text
+    lines = read_lines(response)
+
+    errors = [line for line in lines if "error" in line]
+    assert [e["line"] for e in errors] == [2]
+    streamed = [line for line in lines if "error" not in line]
+    # порядок клиентов - как во входном потоке
+    assert [r["client_id"] for r in streamed] == [c["client_id"] for c in payload["client"]]
+
+    direct = api.post("/forward", json=payload).json()["uplift"]
+    assert {r["client_id"]: r["uplift"] for r in streamed} == pytest.approx(
+        {r["client_id"]: r["uplift"] for r in direct}, abs=1e-9
+    )
+
+
+def test_stream_parses_and_loads_model_off_event_loop(api, service, monkeypatch, payload):
+    calls = []
+    get_model, iter_batches = service.get_model, service.iter_ndjson_batches
+
+    def checked_get_model():
+        assert_not_in_event_loop()
+        calls.append("get_model")
+        return get_model()
+
+    def checked_batches(*args):
+        for batch in iter_batches(*args):
+            assert_not_in_event_loop()
+            calls.append("batch")
+            yield batch
+
+    monkeypatch.setattr(service, "get_model", checked_get_model)
+    monkeypatch.setattr(service, "iter_ndjson_batches", checked_batches)
+    monkeypatch.setattr(service, "STREAM_BATCH_SIZE", 2)
+
+    response = api.post("/forward/stream", content=to_ndjson(payload))
+    assert response.status_code == 200
+    assert len(read_lines(response)) == 4
+    assert calls == ["get_model", "batch", "batch"]
+
+
+def test_iter_ndjson_batches_rejects_foreign_purchases():
+    lines = [
+        json.dumps({"client": {"client_id": 1}, "purchases": [{"transaction_id": 1}]}),
+        "",
+        json.dumps({"client": {"client_id": 2}, "purchases": [{"client_id": 3, "transaction_id": 2}]}),
+    ]
+    (clients, purchases, errors), = iter_ndjson_batches(lines, batch_size=10)
+
+    assert clients == [{"client_id": 1}]
+    assert purchases == [{"client_id": 1, "transaction_id": 1}]
+    assert len(errors) == 1 and json.loads(errors[0])["line"] == 3
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+from sklift import metrics as sklift_metrics
+
+from utils import uplift_metrics as um
+
+
+def generate(n, seed, decimals=None):
+    """Скор с шумом, отклик зависит от скора в treatment; decimals - округление (повторы скора)"""
+    rng = np.random.default_rng(seed)
+    effect = rng.normal(0.0, 0.1, n)
+    treatment = rng.integers(0, 2, n)
+    y = (rng.random(n) < np.clip(0.3 + treatment * effect, 0, 1)).astype(int)
+    uplift = effect + rng.normal(0.0, 0.05, n)
+    if decimals is not None:
+        uplift = np.round(uplift, decimals)
+    return y, uplift, treatment
+
+
+@pytest.fixture(params=[None, 2], ids=["distinct", "ties"])
+def data(request):
+    return generate(3000, seed=0, decimals=request.param)
+
+
+@pytest.mark.parametrize("name", ["uplift_curve", "qini_curve"])
+def test_curves_match_sklift(data, name):
+    x, values = getattr(um, name)(*data)
+    x_expected, values_expected = getattr(sklift_metrics, name)(*data)
+
+    np.testing.assert_allclose(x, x_expected)
+    np.testing.assert_allclose(values, values_expected, atol=1e-9)
+
+
+def test_auc_scores_match_sklift(data):
+    assert um.uplift_auc_score(*data) == pytest.approx(sklift_metrics.uplift_auc_score(*data), abs=1e-12)
+    for negative_effect in (True, False):
+        assert um.qini_auc_score(*data, negative_effect=negative_effect) == pytest.approx(
+            sklift_metrics.qini_auc_score(*data, negative_effect=negative_effect), abs=1e-12
+        )
+
+
+@pytest.mark.parametrize("strategy", ["overall", "by_group"])
+@pytest.mark.parametrize("k", [0.1, 0.3, 0.75, 200])
+def test_uplift_at_k_matches_sklift(data, strategy, k):
+    expected = sklift_metrics.uplift_at_k(*data, strategy=strategy, k=k)
+    assert um.uplift_at_k(*data, strategy=strategy, k=k) == pytest.approx(expected, abs=1e-12)
+
+
+def test_uplift_metrics_match_single_metrics(data):
+    assert um.uplift_metrics(*data, k=0.2) == pytest.approx({
+        "uplift_at_k": um.uplift_at_k(*data, k=0.2),
+        "qini_auc": um.qini_auc_score(*data),
+        "auuc": um.uplift_auc_score(*data),
+    }, abs=1e-12)
+
+
+@pytest.mark.parametrize("kwargs", [{"k": 0}, {"k": 1.5}, {"k": 5000}, {"k": "0.3"}, {"strategy": "top"}])
+def test_uplift_at_k_rejects_invalid_arguments(kwargs):
+    with pytest.raises(ValueError):
+        um.uplift_at_k(*generate(100, seed=1), **kwargs)
+
+
+def test_bootstrap_is_deterministic():
+    data = generate(500, seed=2)
+    first = um.bootstrap_metrics(*data, n_bootstrap=50, random_state=7)
+    again = um.bootstrap_metrics(*data, n_bootstrap=50, random_state=7, batch_size=8)
+    other = um.bootstrap_metrics(*data, n_bootstrap=50, random_state=8)
+
+    for name, values in first.items():
+        assert values.shape == (50,)
+        # пачки берут веса из одного генератора подряд - размер пачки не влияет
+        np.testing.assert_array_equal(values, again[name])
+        assert not np.array_equal(values, other[name])
+
+    assert um.bootstrap_ci(*data, n_bootstrap=50, random_state=7) == um.bootstrap_ci(
+        *data, n_bootstrap=50, random_state=7
+    )
+
+
+def test_bootstrap_weights_match_resampled_data():
+    """Выборка, заданная весами, даёт те же метрики, что явно собранная из повторов строк"""
+    y, uplift, treatment = generate(400, seed=3)
+    n_bootstrap, seed = 5, 11
+    samples = um.bootstrap_metrics(y, uplift, treatment, n_bootstrap=n_bootstrap, random_state=seed)
+
+    rng = np.random.default_rng(seed)
+    weights = rng.multinomial(len(y), np.full(len(y), 1.0 / len(y)), size=n_bootstrap)
+    # веса - по строкам в порядке убывания скора (как в _Sorted)
+    order = np.argsort(uplift, kind="mergesort")[::-1]
+    for i, w in enumerate(weights):
+        idx = np.repeat(order, w)
+        expected = um.uplift_metrics(y[idx], uplift[idx], treatment[idx])
+        assert {name: values[i] for name, values in samples.items()} == pytest.approx(expected, abs=1e-9)
+
+
+def test_histogram_is_close_to_exact_metrics():
+    y, uplift, treatment = generate(200_000, seed=4)
+    exact = um.uplift_metrics(y, uplift, treatment, k=0.3)
+
+    histogram = um.UpliftHistogram(bins=1000)
+    for part in np.array_split(np.arange(len(y)), 4):
+        histogram.update(y[part], uplift[part], treatment[part])
+    approx = histogram.metrics(k=0.3)
+
+    # корзины приближают кривые: расхождение - не больше третьего знака
+    assert approx["auuc"] == pytest.approx(exact["auuc"], abs=1e-3)
+    assert approx["qini_auc"] == pytest.approx(exact["qini_auc"], abs=1e-3)
+    assert approx["uplift_at_k"] == pytest.approx(exact["uplift_at_k"], abs=1e-3)
+    # без negative_effect нормировка другая и значение порядка десятков
+    assert histogram.qini_auc_score(negative_effect=False) == pytest.approx(
+        um.qini_auc_score(y, uplift, treatment, negative_effect=False), rel=1e-3
+    )
+
+
+def test_histogram_merge():
+    y, uplift, treatment = generate(1000, seed=5)
+    whole = um.UpliftHistogram(bins=50).update(y, uplift, treatment)
+    merged = um.UpliftHistogram(bins=50).update(y[:300], uplift[:300], treatment[:300])
+    merged.merge(um.UpliftHistogram(bins=50).update(y[300:], uplift[300:], treatment[300:]))
+
+    np.testing.assert_allclose(merged.counts, whole.counts)
+    with pytest.raises(ValueError):
+        merged.merge(um.UpliftHistogram(bins=20))
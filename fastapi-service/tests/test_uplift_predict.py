@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from catboost import Pool
+
+from benchmarks.bench_uplift_predict import TREATMENT_COL, legacy_s_predict, legacy_x_predict
+from utils.feature_extraction import UpliftFeatureExtractor
+from utils.model_extraction import build_s_learner_catboost, build_x_learner_catboost, predict_uplift_s_learner
+
+
+@pytest.fixture(scope="module")
+def fitted(x5_data):
+    """(X, X-learner, S-learner) - небольшие модели на признаках синтетических X5"""
+    extractor = UpliftFeatureExtractor()
+    df = extractor.calculate_features(
+        *(x5_data[name].copy() for name in ("clients", "train", "treatment", "target", "purchases"))
+    )
+    X = df[extractor.feature_names]
+    y = df["target"].to_numpy()
+    t = df[TREATMENT_COL].to_numpy()
+    cat_cols = X.select_dtypes(include=["object", "category"]).columns.tolist()
+
+    x_learner = build_x_learner_catboost(cat_cols)
+    for est in (x_learner.outcome_learner, x_learner.effect_learner, x_learner.propensity_learner):
+        est.set_params(iterations=20, verbose=0)
+    x_learner.fit(X, y, t)
+
+    X_s = X.assign(**{TREATMENT_COL: t})
+    s_learner = build_s_learner_catboost([X_s.columns.get_loc(col) for col in cat_cols])
+    s_learner.set_params(iterations=20, use_best_model=False, verbose=0)
+    s_learner.fit(X_s, y)
+    return X_s, x_learner, s_learner
+
+
+def test_x_learner_predict_matches_legacy(fitted):
+    X_s, x_learner, _ = fitted
+    X = X_s.drop(columns=TREATMENT_COL)
+    expected = legacy_x_predict(x_learner, X)
+
+    np.testing.assert_allclose(x_learner.predict(X), expected, rtol=0, atol=1e-12)
+    # готовый Pool передаётся как есть
+    pool = Pool(X, cat_features=x_learner.model_propensity.get_cat_feature_indices())
+    np.testing.assert_allclose(x_learner.predict(pool), expected, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("batch_size", [1, 16, 10_000])
+def test_s_learner_uplift_matches_legacy(fitted, batch_size):
+    X_s, _, s_learner = fitted
+    # 16 не делит число клиентов: последний батч неполный
+    assert len(X_s) % 16
+    before = X_s.copy()
+
+    uplift = predict_uplift_s_learner(s_learner, X_s, TREATMENT_COL, batch_size=batch_size)
+
+    np.testing.assert_allclose(uplift, legacy_s_predict(s_learner, X_s, TREATMENT_COL), rtol=0, atol=1e-12)
+    # treatment_col во входной таблице не переписывается
+    assert X_s.equals(before)
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from catboost import CatBoostClassifier
+from sklearn.linear_model import LogisticRegression, Ridge
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from utils.feature_extraction import UpliftFeatureExtractor
+from utils.model_extraction import MyXLearner, _clone_learner, build_x_learner_catboost, set_thread_budget
+
+
+@pytest.fixture(scope="module")
+def training(x5_data):
+    """(X, y, treatment, категориальные колонки) на признаках синтетических X5"""
+    extractor = UpliftFeatureExtractor()
+    df = extractor.calculate_features(
+        *(x5_data[name].copy() for name in ("clients", "train", "treatment", "target", "purchases"))
+    )
+    X = df[extractor.feature_names]
+    cat_cols = X.select_dtypes(include=["object", "category"]).columns.tolist()
+    return X, df["target"].to_numpy(), df["treatment_flg"].to_numpy(), cat_cols
+
+
+def small_x_learner(cat_cols, **kwargs):
+    learner = build_x_learner_catboost(cat_cols, **kwargs)
+    for est in (learner.outcome_learner, learner.effect_learner, learner.propensity_learner):
+        est.set_params(iterations=20, verbose=0)
+    return learner
+
+
+def test_clone_learner_catboost_with_cat_features(training):
+    X, y, _, cat_cols = training
+    assert cat_cols
+    template = CatBoostClassifier(iterations=10, cat_features=cat_cols, random_seed=0, verbose=0)
+
+    copy = _clone_learner(template)
+    assert copy is not template and copy.get_params() == template.get_params()
+    set_thread_budget(copy, 2)
+    copy.fit(X, y)
+    # шаблон не обучен и не получил бюджет потоков копии
+    assert not template.is_fitted()
+    assert "thread_count" not in template.get_params()
+
+    logreg = LogisticRegression(n_jobs=-1)
+    logreg_copy = _clone_learner(logreg)
+    set_thread_budget(logreg_copy, 3)
+    assert logreg_copy.n_jobs == 3 and logreg.n_jobs == -1
+
+
+@pytest.mark.parametrize("n_jobs, backend", [(2, "thread"), (3, "process")])
+def test_parallel_fit_matches_sequential(training, n_jobs, backend):
+    X, y, t, cat_cols = training
+    sequential = small_x_learner(cat_cols).fit(X, y, t)
+    parallel = small_x_learner(cat_cols, n_jobs=n_jobs, backend=backend).fit(X, y, t)
+
+    np.testing.assert_array_equal(parallel.predict(X), sequential.predict(X))
+    assert set(parallel.fit_times_) == {"mu_0", "mu_1", "propensity", "tau_0", "tau_1"}
+    assert set(parallel.stage_times_) == {"outcome", "pseudo_effects", "effect"}
+    # шаблоны моделей не меняются
+    assert parallel.outcome_learner.get_params() == sequential.outcome_learner.get_params()
+
+
+def test_unknown_backend(training):
+    X, y, t, cat_cols = training
+    with pytest.raises(ValueError, match="Unknown backend"):
+        small_x_learner(cat_cols, n_jobs=2, backend="dask").fit(X, y, t)
+
+
+def test_sklearn_learners_in_process_pool(training):
+    X, y, t, cat_cols = training
+    X = X.drop(columns=cat_cols).fillna(0.0)
+    make = lambda **kwargs: MyXLearner(
+        make_pipeline(StandardScaler(), LogisticRegression()), Ridge(),
+        make_pipeline(StandardScaler(), LogisticRegression()), **kwargs
+    )
+    np.testing.assert_allclose(
+        make(n_jobs=2, backend="process").fit(X, y, t).predict(X), make().fit(X, y, t).predict(X), atol=1e-12
+    )
+
@@ -0,0 +1,61 @@
+"""
+Бинарный формат запросов /forward: Arrow IPC stream.
+
+Тело запроса - два IPC-потока подряд: сначала таблица client, затем purchases
+(колонки те же, что и в JSON-формате). Content-Type: application/vnd.apache.arrow.stream.
+Ответ в том же формате (Accept: application/vnd.apache.arrow.stream) - один поток
+с колонками client_id, uplift.
+
+pyarrow импортируется лениво: без него сервис работает только с JSON.
+"""
+import io
+
+import pandas as pd
+
+ARROW_STREAM_MIME = "application/vnd.apache.arrow.stream"
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError("Arrow request format requires pyarrow (pip install pyarrow)") from e
+    return pa
+
+
+def read_arrow_frames(body, n_frames=2):
+    """
+    Прочитать n_frames подряд идущих IPC-потоков из body (bytes) в DataFrame'ы.
+    Буферы чисел без пропусков не копируются (split_blocks), строки становятся object
+    """
+    pa = _pyarrow()
+    source = pa.BufferReader(pa.py_buffer(body))
+    frames = []
+    for _ in range(n_frames):
+        table = pa.ipc.open_stream(source).read_all()
+        frames.append(table.to_pandas(split_blocks=True))
+    if source.tell() != source.size():
+        raise ValueError("Unexpected trailing data after Arrow IPC streams")
+    return frames
+
+
+def write_arrow_frames(*frames):
+    """DataFrame'ы -> bytes из IPC-потоков подряд (формат тела запроса /forward)"""
+    pa = _pyarrow()
+    sink = io.BytesIO()
+    for df in frames:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue()
+
+
+def results_to_arrow(results):
+    """Результаты скоринга [{"client_id", "uplift"}] -> IPC-поток"""
+    df = pd.DataFrame(
+        {
+            "client_id": pd.Series([r["client_id"] for r in results], dtype="int64"),
+            "uplift": pd.Series([r["uplift"] for r in results], dtype="float64"),
+        }
+    )
+    return write_arrow_frames(df)
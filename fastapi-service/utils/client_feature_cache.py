@@ -0,0 +1,178 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# оценка накладных расходов OrderedDict и ключа на одну запись
+_ENTRY_OVERHEAD = 200
+
+
+def client_content_keys(clients_df, purchases_df):
+    """
+    Ключи кэша для клиентов батча: (client_id, хэш строки клиента, хэш покупок, число покупок).
+    Хэш покупок - сумма по модулю 2**64 хэшей пар (строка, её номер у клиента).
+    clients_df - по одной строке на клиента. Возвращает dict client_id -> ключ
+    """
+    client_cols = sorted(col for col in clients_df.columns if col != "client_id")
+    client_hash = pd.util.hash_pandas_object(clients_df[client_cols], index=False).to_numpy()
+
+    purchase_cols = sorted(col for col in purchases_df.columns if col != "client_id")
+    purchase_sum = np.zeros(len(clients_df), dtype=np.uint64)
+    purchase_cnt = np.zeros(len(clients_df), dtype=np.int64)
+    if len(purchases_df):
+        row_hash = pd.util.hash_pandas_object(purchases_df[purchase_cols], index=False).to_numpy()
+        # дедупликация транзакций берёт первую строку, поэтому важен порядок строк
+        # внутри клиента (но не чередование с другими клиентами)
+        rank = purchases_df.groupby("client_id", sort=False).cumcount().to_numpy()
+        row_hash = pd.util.hash_pandas_object(
+            pd.DataFrame({"row": row_hash, "rank": rank}), index=False
+        ).to_numpy()
+        pos = pd.Index(clients_df["client_id"]).get_indexer(purchases_df["client_id"])
+        known = pos >= 0
+        np.add.at(purchase_sum, pos[known], row_hash[known])
+        np.add.at(purchase_cnt, pos[known], 1)
+    # состав колонок тоже часть ключа (кэш живёт в одном процессе, hash() здесь достаточно)
+    columns_hash = hash((tuple(client_cols), tuple(purchase_cols))) & 0xFFFFFFFFFFFFFFFF
+
+    return {
+        cid: (cid, int(ch) ^ columns_hash, int(ps), int(pc))
+        for cid, ch, ps, pc in zip(
+            clients_df["client_id"].tolist(), client_hash, purchase_sum, purchase_cnt
+        )
+    }
+
+
+class ClientFeatureCache:
+    """
+    Кэш строк признаков по клиентам с вытеснением LRU + TTL и ограничением памяти.
+
+    Ключ включает хэш содержимого клиента и его покупок (client_content_keys),
+    поэтому изменившаяся история просто не находится в кэше, а устаревшая
+    запись со временем вытесняется. Память оценивается по размеру хранимых значений.
+    """
+
+    def __init__(self, max_entries=100_000, ttl_seconds=3600.0, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self.columns = None
+        self.dtypes = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"lru": 0, "ttl": 0, "memory": 0}
+
+        # ключ -> (истекает, значения строки, оценка байт); порядок - от давно использованных
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pop(self, key, reason=None):
+        _, _, nbytes = self._entries.pop(key)
+        self.bytes -= nbytes
+        if reason is not None:
+            self.evictions[reason] += 1
+
+    def get_many(self, keys):
+        """keys: dict client_id -> ключ. Возвращает dict client_id -> значения для попаданий"""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for cid, key in keys.items():
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] < now:
+                    self._pop(key, "ttl")
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                found[cid] = entry[1]
+        return found
+
+    def put_frame(self, keys, frame):
+        """Сохранить строки frame (индекс - client_id) под ключами keys"""
+        columns = tuple(frame.columns)
+        dtypes = {
+            col: "category" if isinstance(dtype, pd.CategoricalDtype) else dtype
+            for col, dtype in frame.dtypes.items()
+        }
+        rows = zip(frame.index.tolist(), frame.itertuples(index=False, name=None))
+        expires = time.monotonic() + self.ttl_seconds
+
+        with self._lock:
+            if columns != self.columns:
+                # набор признаков поменялся - старые строки несовместимы
+                self._entries.clear()
+                self.bytes = 0
+                self.columns = columns
+            self.dtypes = dtypes
+
+            for cid, values in rows:
+                key = keys.get(cid)
+                if key is None:
+                    continue
+                if key in self._entries:
+                    self._pop(key)
+                nbytes = sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values) + _ENTRY_OVERHEAD
+                self._entries[key] = (expires, values, nbytes)
+                self.bytes += nbytes
+
+            self._evict()
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._entries:
+            key, (expires, _, _) = next(iter(self._entries.items()))
+            if expires < now:
+                self._pop(key, "ttl")
+            elif len(self._entries) > self.max_entries:
+                self._pop(key, "lru")
+            elif self.bytes > self.max_bytes:
+                self._pop(key, "memory")
+            else:
+                break
+
+    def to_frame(self, found):
+        """DataFrame признаков из результата get_many (индекс - client_id)"""
+        with self._lock:
+            columns, dtypes = self.columns, self.dtypes
+        frame = pd.DataFrame.from_records(
+            list(found.values()), columns=list(columns), index=pd.Index(list(found), name="client_id")
+        )
+        return frame.astype(dtypes)
+
+    def invalidate(self, client_ids=None):
+        """Удалить записи клиентов client_ids (None - весь кэш). Возвращает число удалённых"""
+        with self._lock:
+            if client_ids is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self.bytes = 0
+                return removed
+
+            client_ids = set(client_ids)
+            keys = [key for key in self._entries if key[0] in client_ids]
+            for key in keys:
+                self._pop(key)
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+                "evictions": dict(self.evictions),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,329 @@
+"""
+Инкрементальное состояние клиентов для скоринга по client_id.
+
+Поведенческие признаки, которые остаются в модели, складываются из аддитивных
+агрегатов (суммы, количества, min/max, первая/последняя дата) и множеств
+магазинов/товаров. Они хранятся в SQLite рядом с history и обновляются только
+новыми транзакциями: POST /clients/ingest не требует присылать историю целиком.
+
+Транзакция учитывается один раз (таблица client_transactions): повторная отправка
+той же транзакции пропускается, поэтому все строки транзакции должны прийти
+в одном запросе.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+CLIENT_STATE_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS client_profiles (
+        client_id INTEGER PRIMARY KEY,
+        age REAL,
+        gender TEXT,
+        first_issue_date TEXT,
+        first_redeem_date TEXT,
+        updated_ts TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS client_aggregates (
+        client_id INTEGER PRIMARY KEY,
+        n_transactions INTEGER,
+        purchase_sum_total REAL,
+        purchase_sum_count INTEGER,
+        purchase_sum_min REAL,
+        purchase_sum_max REAL,
+        regular_points_received_total REAL,
+        regular_points_received_count INTEGER,
+        express_points_received_total REAL,
+        express_points_received_count INTEGER,
+        regular_points_spent_total REAL,
+        express_points_spent_total REAL,
+        product_quantity_total REAL,
+        product_quantity_count INTEGER,
+        trn_sum_from_iss_total REAL,
+        trn_sum_from_red_total REAL,
+        first_transaction_ts TEXT,
+        last_transaction_ts TEXT,
+        updated_ts TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS client_transactions (
+        client_id INTEGER NOT NULL,
+        transaction_id TEXT NOT NULL,
+        PRIMARY KEY (client_id, transaction_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS client_stores (
+        client_id INTEGER NOT NULL,
+        store_id TEXT NOT NULL,
+        n_transactions INTEGER,
+        PRIMARY KEY (client_id, store_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS client_products (
+        client_id INTEGER NOT NULL,
+        product_id TEXT NOT NULL,
+        PRIMARY KEY (client_id, product_id)
+    ) WITHOUT ROWID
+    """,
+]
+
+PROFILE_COLUMNS = ["age", "gender", "first_issue_date", "first_redeem_date"]
+
+# колонки client_aggregates: (имя, как сливать с уже накопленным значением)
+AGGREGATE_COLUMNS = [
+    ("n_transactions", "sum"),
+    ("purchase_sum_total", "sum"),
+    ("purchase_sum_count", "sum"),
+    ("purchase_sum_min", "min"),
+    ("purchase_sum_max", "max"),
+    ("regular_points_received_total", "sum"),
+    ("regular_points_received_count", "sum"),
+    ("express_points_received_total", "sum"),
+    ("express_points_received_count", "sum"),
+    ("regular_points_spent_total", "sum"),
+    ("express_points_spent_total", "sum"),
+    ("product_quantity_total", "sum"),
+    ("product_quantity_count", "sum"),
+    ("trn_sum_from_iss_total", "sum"),
+    ("trn_sum_from_red_total", "sum"),
+    ("first_transaction_ts", "min"),
+    ("last_transaction_ts", "max"),
+]
+
+_MERGE_SQL = {
+    "sum": "{col} = {col} + excluded.{col}",
+    # min()/max() в SQLite возвращают NULL, если один из аргументов NULL
+    "min": "{col} = min(coalesce({col}, excluded.{col}), coalesce(excluded.{col}, {col}))",
+    "max": "{col} = max(coalesce({col}, excluded.{col}), coalesce(excluded.{col}, {col}))",
+}
+
+
+def init_client_state(conn):
+    """Таблицы состояния (те же, что создаёт миграция alembic)"""
+    for sql in CLIENT_STATE_TABLES_SQL:
+        conn.execute(sql)
+
+
+def _py(value):
+    """Значение для sqlite3: без numpy-типов, NaN -> NULL"""
+    if value is None or value is pd.NaT or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return _py(value.item())
+    return value
+
+
+def _rows(df, columns):
+    return [tuple(_py(v) for v in row) for row in df[columns].itertuples(index=False, name=None)]
+
+
+def transaction_aggregates(fe, purchases_df):
+    """
+    Агрегаты по новым покупкам: (client_aggregates-часть, счётчики по магазинам, пары клиент-товар).
+    Отбор и дедупликация - как в generate_behavioral_features
+    """
+    purchases = fe.preprocess_purchases(purchases_df)
+    unique_trans = purchases.drop_duplicates(['client_id', 'transaction_id'])
+    unique_trans = unique_trans.assign(
+        transaction_datetime=pd.to_datetime(unique_trans['transaction_datetime'])
+    )
+
+    trans = unique_trans.groupby('client_id')
+    products = purchases.groupby('client_id')
+    agg = pd.DataFrame({
+        'n_transactions': trans.size(),
+        'purchase_sum_total': trans['purchase_sum'].sum(),
+        'purchase_sum_count': trans['purchase_sum'].count(),
+        'purchase_sum_min': trans['purchase_sum'].min(),
+        'purchase_sum_max': trans['purchase_sum'].max(),
+        'regular_points_received_total': trans['regular_points_received'].sum(),
+        'regular_points_received_count': trans['regular_points_received'].count(),
+        'express_points_received_total': trans['express_points_received'].sum(),
+        'express_points_received_count': trans['express_points_received'].count(),
+        'regular_points_spent_total': trans['regular_points_spent'].sum(),
+        'express_points_spent_total': trans['express_points_spent'].sum(),
+        'product_quantity_total': products['product_quantity'].sum(),
+        'product_quantity_count': products['product_quantity'].count(),
+        'trn_sum_from_iss_total': products['trn_sum_from_iss'].sum(),
+        'trn_sum_from_red_total': products['trn_sum_from_red'].sum(),
+        'first_transaction_ts': trans['transaction_datetime'].min(),
+        'last_transaction_ts': trans['transaction_datetime'].max(),
+    })
+
+    stores = unique_trans.groupby(['client_id', 'store_id']).size().rename('n_transactions').reset_index()
+    client_products = purchases[['client_id', 'product_id']].dropna().drop_duplicates()
+    return agg.reset_index(), stores, client_products
+
+
+def ingest(conn, fe, clients_df, purchases_df):
+    """
+    Добавить в состояние профили клиентов (upsert) и новые транзакции.
+    Уже учтённые транзакции пропускаются. Возвращает сводку
+    """
+    now = datetime.now().isoformat()
+    summary = {"profiles": 0, "transactions_added": 0, "transactions_skipped": 0, "clients_updated": 0}
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if clients_df is not None and len(clients_df):
+            profiles = clients_df.drop_duplicates('client_id', keep='first').reindex(
+                columns=['client_id'] + PROFILE_COLUMNS
+            )
+            conn.executemany(
+                """
+                INSERT INTO client_profiles (client_id, age, gender, first_issue_date, first_redeem_date, updated_ts)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (client_id) DO UPDATE SET
+                    age = excluded.age, gender = excluded.gender,
+                    first_issue_date = excluded.first_issue_date,
+                    first_redeem_date = excluded.first_redeem_date,
+                    updated_ts = excluded.updated_ts
+                """,
+                [row + (now,) for row in _rows(profiles, ['client_id'] + PROFILE_COLUMNS)],
+            )
+            summary["profiles"] = len(profiles)
+
+        if purchases_df is not None and len(purchases_df):
+            keys = purchases_df[['client_id', 'transaction_id']].drop_duplicates()
+            key_rows = [(_py(cid), str(_py(tid))) for cid, tid in keys.itertuples(index=False, name=None)]
+
+            # какие транзакции уже учтены
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming_transactions (client_id INTEGER, transaction_id TEXT)")
+            conn.execute("DELETE FROM incoming_transactions")
+            conn.executemany("INSERT INTO incoming_transactions VALUES (?, ?)", key_rows)
+            known = set(conn.execute(
+                """
+                SELECT i.client_id, i.transaction_id FROM incoming_transactions i
+                JOIN client_transactions t
+                  ON t.client_id = i.client_id AND t.transaction_id = i.transaction_id
+                """
+            ).fetchall())
+            conn.execute("DELETE FROM incoming_transactions")
+
+            is_new = [key not in known for key in key_rows]
+            new_keys = keys[is_new]
+            summary["transactions_skipped"] = len(key_rows) - len(new_keys)
+
+            if len(new_keys):
+                new_purchases = purchases_df.merge(new_keys, on=['client_id', 'transaction_id'], how='inner')
+                agg, stores, products = transaction_aggregates(fe, new_purchases)
+
+                columns = ['client_id'] + [col for col, _ in AGGREGATE_COLUMNS]
+                updates = ",\n".join(_MERGE_SQL[how].format(col=col) for col, how in AGGREGATE_COLUMNS)
+                conn.executemany(
+                    f"""
+                    INSERT INTO client_aggregates ({", ".join(columns)}, updated_ts)
+                    VALUES ({", ".join("?" * len(columns))}, ?)
+                    ON CONFLICT (client_id) DO UPDATE SET
+                    {updates},
+                    updated_ts = excluded.updated_ts
+                    """,
+                    [row + (now,) for row in _rows(agg, columns)],
+                )
+                conn.executemany(
+                    """
+                    INSERT INTO client_stores (client_id, store_id, n_transactions) VALUES (?, ?, ?)
+                    ON CONFLICT (client_id, store_id) DO UPDATE SET
+                        n_transactions = n_transactions + excluded.n_transactions
+                    """,
+                    [(cid, str(store), cnt) for cid, store, cnt in _rows(stores, ['client_id', 'store_id', 'n_transactions'])],
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO client_products (client_id, product_id) VALUES (?, ?)",
+                    [(cid, str(product)) for cid, product in _rows(products, ['client_id', 'product_id'])],
+                )
+                conn.executemany(
+                    "INSERT INTO client_transactions (client_id, transaction_id) VALUES (?, ?)",
+                    [key for key, new in zip(key_rows, is_new) if new],
+                )
+                summary["transactions_added"] = len(new_keys)
+                summary["clients_updated"] = len(agg)
+
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    return summary
+
+
+def load_state(conn, client_ids):
+    """
+    Профили и агрегаты клиентов из состояния.
+    Возвращает (clients_df, agg_df); клиенты без профиля в clients_df не попадают,
+    клиенты без транзакций - в agg_df
+    """
+    client_ids = [_py(cid) for cid in client_ids]
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS requested_clients (client_id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM requested_clients")
+    conn.executemany("INSERT OR IGNORE INTO requested_clients VALUES (?)", [(cid,) for cid in client_ids])
+
+    clients_df = pd.read_sql_query(
+        f"""
+        SELECT p.client_id, {", ".join("p." + col for col in PROFILE_COLUMNS)}
+        FROM client_profiles p JOIN requested_clients r ON r.client_id = p.client_id
+        """,
+        conn,
+    )
+
+    agg_columns = ", ".join("a." + col for col, _ in AGGREGATE_COLUMNS)
+    agg_df = pd.read_sql_query(
+        f"""
+        SELECT a.client_id, {agg_columns},
+               coalesce(s.unique_stores_count, 0) AS unique_stores_count,
+               coalesce(s.top_store_transactions, 0) AS top_store_transactions,
+               coalesce(pr.unique_products_count, 0) AS unique_products_count
+        FROM client_aggregates a
+        JOIN requested_clients r ON r.client_id = a.client_id
+        LEFT JOIN (
+            SELECT client_id, COUNT(*) AS unique_stores_count, MAX(n_transactions) AS top_store_transactions
+            FROM client_stores WHERE client_id IN (SELECT client_id FROM requested_clients)
+            GROUP BY client_id
+        ) s ON s.client_id = a.client_id
+        LEFT JOIN (
+            SELECT client_id, COUNT(*) AS unique_products_count
+            FROM client_products WHERE client_id IN (SELECT client_id FROM requested_clients)
+            GROUP BY client_id
+        ) pr ON pr.client_id = a.client_id
+        """,
+        conn,
+    ).set_index('client_id')
+    conn.execute("DELETE FROM requested_clients")
+
+    return clients_df, agg_df
+
+
+def score_clients_from_state(conn, fe, model, client_ids, feature_names):
+    """
+    Скоринг клиентов по client_id из накопленного состояния.
+    Возвращает (результаты, неизвестные client_id без профиля)
+    """
+    if not fe.drop_redundant:
+        raise ValueError("Scoring from client state requires drop_redundant=True")
+
+    clients_df, agg_df = load_state(conn, client_ids)
+    known = set(clients_df['client_id'].tolist())
+    unknown = sorted({cid for cid in client_ids if cid not in known})
+    if clients_df.empty:
+        return [], unknown
+
+    processed_clients = fe.preprocess_clients_inference(clients_df)
+    behavioral_features = fe.behavioral_features_from_aggregates(agg_df)
+    df_feat = fe.assemble_features(processed_clients, behavioral_features)
+
+    ids = np.sort(clients_df['client_id'].unique())
+    uplift = np.asarray(model.predict(df_feat.loc[ids, feature_names]), dtype=float)
+    results = [
+        {"client_id": int(cid), "uplift": float(u)}
+        for cid, u in zip(ids, uplift)
+    ]
+    return results, unknown
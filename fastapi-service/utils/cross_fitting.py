@@ -0,0 +1,217 @@
+"""
+Cross-fitting мета-лёрнеров: out-of-fold предсказания uplift и метрики по фолдам.
+
+Все пары (лёрнер, фолд) обучаются в одном пуле процессов. Матрица признаков
+кладётся в shared memory один раз: числовые колонки - одним блоком float64,
+категориальные и строковые - целочисленными кодами. Воркеры собирают из них
+DataFrame без копирования числового блока, а в задачи пула передаются только
+индексы фолда и шаблон модели.
+
+Лёрнеры - необученные шаблоны из utils/model_extraction.py:
+    TwoModels (build_t_learner_logreg), MyXLearner (build_x_learner_catboost) -
+        fit(X, y, treatment) / predict(X);
+    CatBoostClassifier (build_s_learner_catboost) - S-learner: treatment
+        добавляется последней колонкой TREATMENT_COL, uplift - predict_uplift_s_learner.
+
+    oof, metrics = cross_fit({"t_logreg": t, "x_catboost": x}, X, y, treatment, n_folds=5)
+    metrics.groupby("learner")[["uplift_at_k", "qini_auc", "auuc"]].agg(["mean", "std"])
+
+Сравнение на X5 (признаки - из снапшота utils/feature_snapshot.py):
+
+    python -m utils.cross_fitting
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from catboost import CatBoostClassifier
+from sklearn.model_selection import StratifiedKFold
+
+from utils.model_extraction import predict_uplift_s_learner, set_thread_budget
+from utils.uplift_metrics import uplift_metrics
+
+TREATMENT_COL = "treatment_flg"
+
+_shared = {}
+
+
+def _share(array, blocks):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    blocks.append(shm)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm.name, array.dtype.str, array.shape
+
+
+def _attach(name, dtype, shape):
+    shm = shared_memory.SharedMemory(name=name)
+    _shared.setdefault("blocks", []).append(shm)
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _attach_matrix(spec):
+    """Инициализатор воркера: X, y, treatment из shared memory"""
+    X = pd.DataFrame(_attach(*spec["numeric"]), columns=spec["numeric_columns"], copy=False)
+    for col, (position, block, categories) in spec["categorical"].items():
+        codes = _attach(*block)
+        if isinstance(categories, pd.CategoricalDtype):
+            values = pd.Categorical.from_codes(codes, dtype=categories)
+        else:
+            values = np.asarray(categories, dtype=object).take(np.where(codes >= 0, codes, 0))
+            values[codes < 0] = np.nan
+        X.insert(position, col, values)
+
+    _shared["X"] = X
+    _shared["y"] = _attach(*spec["y"])
+    _shared["treatment"] = _attach(*spec["treatment"])
+
+
+def _fit_fold(name, learner, fold, test_idx, threads, k):
+    """Обучение learner на всех строках, кроме test_idx, и uplift на test_idx"""
+    X, y, t = _shared["X"], _shared["y"], _shared["treatment"]
+    train_mask = np.ones(len(X), dtype=bool)
+    train_mask[test_idx] = False
+    set_thread_budget(learner, threads)
+
+    start = time.perf_counter()
+    X_train = X[train_mask]
+    if isinstance(learner, CatBoostClassifier):
+        learner.fit(X_train.assign(**{TREATMENT_COL: t[train_mask]}), y[train_mask])
+    else:
+        learner.fit(X_train, y[train_mask], t[train_mask])
+    del X_train
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    X_test = X.iloc[test_idx]
+    if isinstance(learner, CatBoostClassifier):
+        uplift = predict_uplift_s_learner(learner, X_test, TREATMENT_COL)
+    else:
+        uplift = np.asarray(learner.predict(X_test), dtype=np.float64).ravel()
+    predict_seconds = time.perf_counter() - start
+
+    metrics = {
+        "learner": name,
+        "fold": fold,
+        "n_test": len(test_idx),
+        **uplift_metrics(y[test_idx], uplift, t[test_idx], k),
+        "fit_seconds": fit_seconds,
+        "predict_seconds": predict_seconds,
+    }
+    return uplift, metrics
+
+
+def cross_fit(learners, X, y, treatment, n_folds=5, n_jobs=-1, k=0.3, random_state=0):
+    """
+    learners - {имя: необученный шаблон}. Фолды стратифицированы по (treatment, y).
+    n_jobs - процессов (-1 - все ядра); ядра делятся между ними через thread_count /
+    n_jobs моделей. Числовые колонки X передаются воркерам как float64.
+
+    Возвращает (oof, metrics): oof - DataFrame с индексом X и out-of-fold uplift
+    по колонке на лёрнер; metrics - строка на (learner, fold): uplift_at_k, qini_auc,
+    auuc, время обучения и предсказания
+    """
+    y = np.asarray(y)
+    t = np.asarray(treatment)
+    n_cpu = os.cpu_count() or 1
+    n_jobs = n_cpu if n_jobs == -1 else max(1, n_jobs)
+    n_jobs = min(n_jobs, len(learners) * n_folds)
+    threads = max(1, n_cpu // n_jobs)
+
+    splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+    folds = [test_idx for _, test_idx in splitter.split(np.zeros(len(y)), t * 2 + y)]
+
+    numeric_columns = [col for col in X.columns if pd.api.types.is_numeric_dtype(X[col])]
+
+    blocks = []
+    try:
+        spec = {
+            "numeric": _share(X[numeric_columns].to_numpy(dtype=np.float64), blocks),
+            "numeric_columns": numeric_columns,
+            "categorical": {},
+            "y": _share(y, blocks),
+            "treatment": _share(t, blocks),
+        }
+        for position, col in enumerate(X.columns):
+            if col in numeric_columns:
+                continue
+            if isinstance(X[col].dtype, pd.CategoricalDtype):
+                codes, categories = X[col].cat.codes.to_numpy(), X[col].dtype
+            else:
+                codes, uniques = pd.factorize(X[col])
+                categories = list(uniques)
+            spec["categorical"][col] = (position, _share(codes, blocks), categories)
+
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_attach_matrix, initargs=(spec,)) as pool:
+            futures = {
+                (name, fold): pool.submit(_fit_fold, name, learner, fold, test_idx, threads, k)
+                for name, learner in learners.items()
+                for fold, test_idx in enumerate(folds)
+            }
+            results = {key: future.result() for key, future in futures.items()}
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    oof = pd.DataFrame(index=X.index, columns=list(learners), dtype=np.float64)
+    rows = []
+    for (name, fold), (uplift, metrics) in results.items():
+        oof.iloc[folds[fold], oof.columns.get_loc(name)] = uplift
+        rows.append(metrics)
+
+    return oof, pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    from utils.feature_extraction import UpliftFeatureExtractor
+    from utils.feature_snapshot import FeatureSnapshotCache, x5_files
+    from utils.model_extraction import (
+        build_s_learner_catboost,
+        build_t_learner_logreg,
+        build_x_learner_catboost,
+    )
+
+    n_folds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    extractor = UpliftFeatureExtractor(drop_redundant=True)
+
+    def compute():
+        from sklift.datasets import fetch_x5
+        dataset = fetch_x5()
+        return extractor.calculate_features(
+            clients_df=dataset.data.clients,
+            train_df=dataset.data.train,
+            treatment_df=dataset.treatment,
+            target_df=dataset.target,
+            purchases_df=dataset.data.purchases,
+        )
+
+    snapshot = FeatureSnapshotCache(os.getenv("FEATURES_SNAPSHOT_DIR", "data/feature_snapshots"))
+    df = snapshot.cached_features(extractor, x5_files(), compute)
+    X = df[extractor.feature_names]
+    num_cols = X.select_dtypes(include=["number"]).columns.tolist()
+    cat_cols = X.select_dtypes(include=["object"]).columns.tolist()
+    catboost_cat_cols = X.select_dtypes(include=["object", "category"]).columns.tolist()
+
+    s_learner = build_s_learner_catboost([X.columns.get_loc(col) for col in catboost_cat_cols])
+    # без отложенной выборки внутри фолда лучшая итерация не выбирается
+    s_learner.set_params(use_best_model=False, verbose=0)
+    x_learner = build_x_learner_catboost(catboost_cat_cols)
+    for learner in (x_learner.outcome_learner, x_learner.effect_learner):
+        learner.set_params(verbose=0)
+
+    start = time.perf_counter()
+    oof, metrics = cross_fit(
+        {
+            "t_logreg": build_t_learner_logreg(num_cols=num_cols, cat_cols=cat_cols),
+            "x_catboost": x_learner,
+            "s_catboost": s_learner,
+        },
+        X, df["target"], df[TREATMENT_COL], n_folds=n_folds,
+    )
+    print(metrics.to_string(index=False))
+    print(metrics.groupby("learner")[["uplift_at_k", "qini_auc", "auuc"]].agg(["mean", "std"]))
+    print(f"{n_folds} фолдов за {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,178 @@
+"""
+Кэш рассчитанных признаков для обучения: снапшот датафрейма в Parquet.
+
+Ключ - хэш содержимого входных таблиц (датафреймы хэшируются построчно,
+файлы - по байтам) и конфигурации экстрактора: класс, drop_redundant,
+low_memory и хэш исходного кода его модуля. Изменились данные, параметры
+или код признаков - ключ другой, и признаки считаются заново.
+
+Снапшот - <cache_dir>/<key>.parquet. Колонки хранятся в компактных типах
+без потерь: float64 -> float32 и целые с понижением разрядности только если
+значения не меняются. В метаданных схемы - feature_names и preprocessing
+экстрактора, они восстанавливаются при загрузке. Файл читается через mmap.
+
+    snapshot = FeatureSnapshotCache("data/feature_snapshots")
+    df = snapshot.cached_features(extractor, x5_files(), lambda: extractor.calculate_features(...))
+
+pyarrow импортируется лениво.
+"""
+import hashlib
+import inspect
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_VERSION = 1
+METADATA_KEY = b"uplift_feature_snapshot"
+
+X5_FILES = {
+    "train": "uplift_train.csv.gz",
+    "clients": "clients.csv.gz",
+    "purchases": "purchases.csv.gz",
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Feature snapshots require pyarrow (pip install pyarrow)") from e
+    return pa, pq
+
+
+def x5_files(data_dir=None):
+    """Пути к файлам X5 в каталоге sklift (fetch_x5 скачивает их туда)"""
+    if data_dir is None:
+        from sklift.datasets import get_data_dir
+        data_dir = get_data_dir()
+    return {name: os.path.join(data_dir, filename) for name, filename in X5_FILES.items()}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def frame_digest(obj):
+    """Хэш содержимого DataFrame/Series: значения, индекс, имена колонок и типы"""
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(obj, pd.Series):
+        obj = obj.to_frame()
+    h.update(repr([(str(col), str(dtype)) for col, dtype in obj.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def extractor_config(extractor):
+    """Параметры экстрактора, влияющие на результат, и версия его кода"""
+    source = inspect.getsourcefile(type(extractor))
+    return {
+        "class": type(extractor).__name__,
+        "drop_redundant": extractor.drop_redundant,
+        "low_memory": getattr(extractor, "low_memory", False),
+        "code": file_digest(source),
+    }
+
+
+def compact_dtypes(df):
+    """Понижение разрядности колонок там, где значения не меняются"""
+    columns = {}
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == np.float64:
+            values = s.to_numpy()
+            compact = values.astype(np.float32)
+            if np.array_equal(compact.astype(np.float64), values, equal_nan=True):
+                s = pd.Series(compact, index=s.index, name=col)
+        elif pd.api.types.is_integer_dtype(s) and not isinstance(s.dtype, pd.CategoricalDtype):
+            s = pd.to_numeric(s, downcast="integer")
+        columns[col] = s
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+class FeatureSnapshotCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".parquet")
+
+    def key(self, extractor, inputs):
+        """
+        Ключ снапшота. inputs - {имя: DataFrame | Series | путь к файлу}.
+        None, если какого-то файла ещё нет (например, X5 не скачан)
+        """
+        parts = {"version": SNAPSHOT_VERSION, "extractor": extractor_config(extractor), "inputs": {}}
+        for name, value in sorted(inputs.items()):
+            if isinstance(value, (pd.DataFrame, pd.Series)):
+                parts["inputs"][name] = frame_digest(value)
+            elif os.path.exists(value):
+                parts["inputs"][name] = file_digest(value)
+            else:
+                return None
+        return hashlib.blake2b(json.dumps(parts, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+    def load(self, key, extractor=None):
+        """Датафрейм признаков или None; в extractor восстанавливаются feature_names и preprocessing"""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+
+        _, pq = _pyarrow()
+        table = pq.read_table(path, memory_map=True)
+        meta = json.loads(table.schema.metadata[METADATA_KEY])
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
+        if extractor is not None:
+            extractor.feature_names = meta["feature_names"]
+            extractor.preprocessing = meta["preprocessing"]
+        return df
+
+    def save(self, key, df, extractor):
+        pa, pq = _pyarrow()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        table = pa.Table.from_pandas(compact_dtypes(df), preserve_index=True)
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "extractor": extractor_config(extractor),
+            "feature_names": list(extractor.feature_names),
+            "preprocessing": getattr(extractor, "preprocessing", {}),
+            "created": pd.Timestamp.now(tz="UTC").isoformat(),
+        }
+        table = table.replace_schema_metadata({**table.schema.metadata, METADATA_KEY: json.dumps(meta).encode()})
+
+        # запись во временный файл и переименование: недописанный снапшот не прочитается
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            pq.write_table(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def cached_features(self, extractor, inputs, compute):
+        """
+        Признаки из снапшота, а при промахе - compute() с сохранением результата.
+        Ключ пересчитывается после compute, если до него входных файлов ещё не было
+        """
+        key = self.key(extractor, inputs)
+        if key is not None:
+            df = self.load(key, extractor)
+            if df is not None:
+                return df
+
+        df = compute()
+        if key is None:
+            key = self.key(extractor, inputs)
+        if key is not None:
+            self.save(key, df, extractor)
+        return df
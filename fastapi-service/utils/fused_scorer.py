@@ -0,0 +1,194 @@
+"""
+Скомпилированный скорер для T-learner на логистических регрессиях.
+
+StandardScaler сворачивается в коэффициенты (w / scale), а из числовых признаков
+вычитаются их средние на обучении: сдвиг mean * w / scale в свободный член не переносится,
+иначе во float32 логит - разность больших чисел (год-квартал ~8000 * w) и теряет точность.
+one-hot заменяется таблицами весов по категориям, а обе ветки (treatment и control)
+считаются одним матричным произведением X_num @ W, где W имеет форму (n_num, 2).
+Никаких ColumnTransformer/Pipeline на пути предсказания.
+"""
+import numpy as np
+import pandas as pd
+
+from utils.model_artifact import ARMS, TLearnerArtifact, _split_pipeline
+
+
+class FusedTLearnerScorer:
+    """
+    Скорер uplift = sigmoid(z_trmnt) - sigmoid(z_ctrl).
+    Столбцы весов: 0 - treatment, 1 - control
+    """
+
+    def __init__(self, feature_names, num_cols, cat_cols, weights, bias, cat_tables, dtype=np.float32,
+                 num_mean=None, num_scale=None):
+        self.feature_names = list(feature_names)
+        self.num_cols = list(num_cols)
+        self.cat_cols = list(cat_cols)
+        self.dtype = np.dtype(dtype)
+        self.weights = np.ascontiguousarray(weights, dtype=self.dtype)
+        self.bias = np.asarray(bias, dtype=self.dtype)
+        # (categories, table, has_nan): table[i] - веса категории i для обеих веток,
+        # table[n] - веса NaN, table[n + 1] - нули для неизвестной категории
+        # (handle_unknown="ignore")
+        self.cat_tables = [
+            (pd.Index(categories), np.ascontiguousarray(table, dtype=self.dtype), has_nan)
+            for categories, table, has_nan in cat_tables
+        ]
+        # средние (вычитаются из признаков) и масштабы числовых признаков на обучении
+        self.num_mean = np.zeros(len(self.num_cols)) if num_mean is None else np.asarray(num_mean, dtype=np.float64)
+        self.num_scale = np.ones(len(self.num_cols)) if num_scale is None else np.asarray(num_scale, dtype=np.float64)
+
+    @classmethod
+    def _from_arms(cls, feature_names, num_cols, cat_cols, arms, dtype):
+        weights = np.zeros((len(num_cols), len(ARMS)), dtype=np.float64)
+        bias = np.zeros(len(ARMS), dtype=np.float64)
+        # центр числовых признаков - среднее scaler'ов веток (они обучались на разных строках)
+        num_mean = np.mean([np.asarray(arms[arm]["scaler_mean"], dtype=np.float64) for arm in ARMS], axis=0)
+        num_scale = np.mean([np.asarray(arms[arm]["scaler_scale"], dtype=np.float64) for arm in ARMS], axis=0)
+
+        for j, arm in enumerate(ARMS):
+            params = arms[arm]
+            folded = np.asarray(params["coef_num"], dtype=np.float64) / np.asarray(params["scaler_scale"], dtype=np.float64)
+            weights[:, j] = folded
+            bias[j] = params["intercept"] - float(np.dot(np.asarray(params["scaler_mean"], dtype=np.float64) - num_mean, folded))
+
+        cat_tables = []
+        for i in range(len(cat_cols)):
+            # словари веток обучались отдельно и могут не совпадать - объединяем
+            categories = []
+            for arm in ARMS:
+                for value in arms[arm]["categories"][i]["values"]:
+                    if value not in categories:
+                        categories.append(value)
+            has_nan = any(arms[arm]["categories"][i]["has_nan"] for arm in ARMS)
+
+            n = len(categories)
+            table = np.zeros((n + 2, len(ARMS)), dtype=np.float64)  # n категорий, NaN, неизвестная
+            for j, arm in enumerate(ARMS):
+                cat = arms[arm]["categories"][i]
+                coef = np.asarray(cat["coef"], dtype=np.float64)
+                for k, value in enumerate(cat["values"]):
+                    table[categories.index(value), j] = coef[k]
+                if cat["has_nan"]:
+                    table[n, j] = coef[len(cat["values"])]
+            cat_tables.append(([str(v) for v in categories], table, has_nan))
+
+        return cls(feature_names, num_cols, cat_cols, weights, bias, cat_tables, dtype=dtype,
+                   num_mean=num_mean, num_scale=num_scale)
+
+    @classmethod
+    def from_artifact(cls, artifact, dtype=np.float32):
+        """Из загруженного TLearnerArtifact (или пути к каталогу артефакта)"""
+        if not isinstance(artifact, TLearnerArtifact):
+            artifact = TLearnerArtifact(artifact)
+        return cls._from_arms(
+            artifact.feature_names, artifact.num_cols, artifact.cat_cols, artifact.arms, dtype
+        )
+
+    @classmethod
+    def from_model(cls, model, feature_names, dtype=np.float32):
+        """Из обученного sklift TwoModels (build_t_learner_logreg)"""
+        arms = {}
+        num_cols, cat_cols = None, None
+        for arm in ARMS:
+            scaler, encoder, clf, num_cols, cat_cols = _split_pipeline(getattr(model, f"estimator_{arm}"))
+            coef = clf.coef_.ravel()
+            categories, offset = [], len(num_cols)
+            for cats in (encoder.categories_ if encoder is not None else []):
+                cats = list(cats)
+                has_nan = len(cats) > 0 and isinstance(cats[-1], float) and np.isnan(cats[-1])
+                values = [str(v) for v in (cats[:-1] if has_nan else cats)]
+                categories.append({"values": values, "coef": coef[offset:offset + len(cats)], "has_nan": has_nan})
+                offset += len(cats)
+            arms[arm] = {
+                "intercept": float(clf.intercept_[0]),
+                "coef_num": coef[:len(num_cols)],
+                "scaler_mean": scaler.mean_ if scaler is not None else np.zeros(0),
+                "scaler_scale": scaler.scale_ if scaler is not None else np.ones(0),
+                "categories": categories,
+            }
+        return cls._from_arms(feature_names, num_cols, cat_cols, arms, dtype)
+
+    def numeric_matrix(self, X):
+        # по столбцам в заранее выделенный массив: X[cols].to_numpy() строит
+        # промежуточный DataFrame и на малых батчах в разы медленнее
+        X_num = np.empty((len(X), len(self.num_cols)), dtype=self.dtype)
+        for j, col in enumerate(self.num_cols):
+            X_num[:, j] = X[col].to_numpy() - self.num_mean[j]
+        return X_num
+
+    def decision_function(self, X):
+        """Логиты обеих веток, массив (n, 2)"""
+        z = self.numeric_matrix(X) @ self.weights
+        z += self.bias
+
+        for col, (categories, table, has_nan) in zip(self.cat_cols, self.cat_tables):
+            values = X[col]
+            codes = categories.get_indexer(values.astype(object))
+            codes[codes < 0] = len(categories) + 1
+            if has_nan:
+                codes[pd.isna(values).to_numpy()] = len(categories)
+            z += table[codes]
+
+        return z
+
+    def predict_proba_arms(self, X):
+        z = self.decision_function(X)
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def predict(self, X):
+        p = self.predict_proba_arms(X)
+        return (p[:, 0] - p[:, 1]).astype(np.float64)
+
+
+def validate_scorer(scorer, model, X, atol=1e-5):
+    """
+    Сверка скорера с исходной моделью на X.
+    Возвращает максимальное абсолютное расхождение, ValueError если оно больше atol
+    """
+    expected = np.asarray(model.predict(X), dtype=np.float64)
+    actual = scorer.predict(X)
+    max_diff = float(np.max(np.abs(actual - expected))) if len(expected) else 0.0
+    if max_diff > atol:
+        raise ValueError(f"Fused scorer differs from model.predict by {max_diff:.3g} (atol={atol})")
+    return max_diff
+
+
+def validation_sample(scorer, n_rows=256, seed=0):
+    """
+    Синтетическая выборка для сверки скорера с моделью: числовые признаки ~ N(среднее,
+    масштаб) StandardScaler на обучении, в категориях - известные значения, NaN
+    и неизвестное значение. Остальные колонки feature_names - нули
+    """
+    rng = np.random.default_rng(seed)
+    columns = {col: np.zeros(n_rows) for col in scorer.feature_names}
+    for j, col in enumerate(scorer.num_cols):
+        columns[col] = rng.normal(scorer.num_mean[j], scorer.num_scale[j], n_rows)
+    for col, (categories, _, _) in zip(scorer.cat_cols, scorer.cat_tables):
+        values = np.array(list(categories) + [None, "never-seen-category"], dtype=object)
+        columns[col] = values[rng.integers(0, len(values), n_rows)]
+    return pd.DataFrame(columns)
+
+
+def build_fused_scorer(model, feature_names, dtype=np.float32, validate=True, atol=1e-5):
+    """
+    Скорер для модели сервиса: артефакт или TwoModels с поддерживаемыми пайплайнами.
+    Для остальных моделей возвращает саму модель. validate=True - скорер сверяется
+    с model.predict на validation_sample; при расхождении больше atol (битый артефакт,
+    устаревший манифест) остаётся исходная модель
+    """
+    if not isinstance(model, TLearnerArtifact):
+        try:
+            scorer = FusedTLearnerScorer.from_model(model, feature_names, dtype=dtype)
+        except (AttributeError, KeyError, ValueError):
+            return model
+    try:
+        if isinstance(model, TLearnerArtifact):
+            scorer = FusedTLearnerScorer.from_artifact(model, dtype=dtype)
+        if validate:
+            validate_scorer(scorer, model, validation_sample(scorer), atol=atol)
+    except Exception as e:
+        print(f"Fused scorer отключён, предсказания - model.predict: {e}")
+        return model
+    return scorer
@@ -0,0 +1,227 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+
+INSERT_HISTORY_SQL = """
+    INSERT INTO history (ts, processing_time, input_size, input_tokens, status_code, input_data, output_data,
+                         queue_time, compute_time, stage_timings)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+OVERFLOW_POLICIES = ("block", "drop_new", "drop_oldest")
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """
+    Фоновая запись истории запросов в SQLite.
+    Строки складываются в ограниченную очередь, отдельный поток забирает их
+    и пишет пачками (executemany в одной транзакции) по размеру или по таймеру.
+
+    Политика переполнения очереди:
+      block       - ждать освобождения места (не дольше block_timeout, потом строка теряется)
+      drop_new    - выбрасывать новую строку
+      drop_oldest - выбрасывать самую старую строку из очереди
+    """
+
+    def __init__(self, db_file, batch_size=200, flush_interval=0.5,
+                 max_queue_size=10000, overflow="drop_oldest", block_timeout=1.0,
+                 on_write=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        # on_write(conn, rows) вызывается в той же транзакции, что и вставка строк
+        self.on_write = on_write
+
+        self.written = 0
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Запуск фонового потока (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self._thread.start()
+
+    def put(self, input_data, output_data, status, processing_time, input_size, input_tokens,
+            queue_time=None, compute_time=None, stage_timings=None):
+        """Поставить строку истории в очередь на запись. stage_timings - {этап: секунды}"""
+        row = (
+            datetime.now().isoformat(),
+            processing_time,
+            input_size,
+            input_tokens,
+            status,
+            input_data,
+            output_data,
+            queue_time,
+            compute_time,
+            stage_timings,
+        )
+
+        if self._closed:
+            # после остановки пишем синхронно, чтобы не терять строки
+            self._write_rows([row])
+            return
+
+        if self._thread is None:
+            self.start()
+
+        try:
+            if self.overflow == "block":
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+            return
+        except queue.Full:
+            pass
+
+        if self.overflow == "drop_oldest":
+            try:
+                oldest = self._queue.get_nowait()
+                if isinstance(oldest, threading.Event):
+                    # маркер flush не теряем молча, а отпускаем ожидающего
+                    oldest.set()
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                pass
+        # put вызывается из потоков обработчиков одновременно
+        with self._lock:
+            self.dropped += 1
+
+    def flush(self, timeout=None):
+        """Дождаться записи всего, что было поставлено в очередь до вызова"""
+        if self._thread is None or self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=10.0):
+        """Сбросить очередь на диск и остановить поток"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    @property
+    def queue_size(self):
+        return self._queue.qsize()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write_rows(self, rows, conn=None):
+        if not rows:
+            return
+        own_conn = conn is None
+        try:
+            if own_conn:
+                conn = self._connect()
+            params = [
+                row[:5] + (
+                    json.dumps(row[5], ensure_ascii=False),
+                    json.dumps(row[6], ensure_ascii=False),
+                ) + row[7:9] + (
+                    json.dumps(row[9]) if row[9] else None,
+                )
+                for row in rows
+            ]
+            with conn:
+                conn.executemany(INSERT_HISTORY_SQL, params)
+                if self.on_write is not None:
+                    self.on_write(conn, rows)
+            # после close() пишут и потоки обработчиков
+            with self._lock:
+                self.written += len(rows)
+        except Exception as e:
+            print(f"Ошибка логирования: {e}")
+        finally:
+            if own_conn and conn is not None:
+                conn.close()
+
+    def _run(self):
+        conn = self._connect()
+        batch = []
+        waiters = []
+        deadline = None
+        stop = False
+
+        try:
+            while not stop:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif item is not None:
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+
+                # забираем то, что уже лежит в очереди, не дожидаясь таймера
+                while len(batch) < self.batch_size and not stop:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        batch.append(item)
+
+                if stop:
+                    # при остановке дописываем всё, что успело попасть в очередь
+                    while True:
+                        try:
+                            item = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if isinstance(item, threading.Event):
+                            waiters.append(item)
+                        elif item is not _STOP:
+                            batch.append(item)
+
+                due = deadline is not None and time.monotonic() >= deadline
+                if stop or waiters or due or len(batch) >= self.batch_size:
+                    self._write_rows(batch, conn)
+                    batch = []
+                    deadline = None
+                    for w in waiters:
+                        w.set()
+                    waiters = []
+        finally:
+            conn.close()
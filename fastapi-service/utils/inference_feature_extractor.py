@@ -1,14 +1,32 @@
 import numpy as np
 import pandas as pd
 
+PURCHASES_COLUMNS = [
+    'client_id', 'transaction_id', 'transaction_datetime',
+    'regular_points_received', 'express_points_received',
+    'regular_points_spent', 'express_points_spent', 'purchase_sum', 'store_id',
+    'product_id', 'product_quantity', 'trn_sum_from_iss', 'trn_sum_from_red',
+]
+
+# допустимый возраст; до AGE_OUTLIER_MAX - выброс сверху, дальше - явный мусор
+AGE_MIN, AGE_MAX, AGE_OUTLIER_MAX = 15, 100, 200
+# без обученных статистик: у одного клиента нет других допустимых возрастов, статистик тоже
+NO_AGE_PARAMS = {'mean_q1': np.nan, 'mean_q4': np.nan, 'mean': np.nan}
+
 class UpliftFeatureExtractorInference:
     """
     Feature extractor для uplift-моделирования на основе данных X5
     Включает все этапы предобработки и генерации признаков из EDA
     """
-    def __init__(self, drop_redundant=True):
+    def __init__(self, drop_redundant=True, low_memory=False):
         self.feature_names = []
         self.drop_redundant = drop_redundant
+        # low_memory=True: без полных копий датафреймов, purchases в компактных типах
+        # (float32/int32, store_id/product_id - category); суммы во float32 могут
+        # отличаться от обычного режима в последних знаках
+        self.low_memory = low_memory
+        # статистики возраста с обучения (set_preprocessing); None - у старых моделей
+        self.age_params = None
 
 
     def safe_div(self, a, b):
@@ -19,38 +37,69 @@ class UpliftFeatureExtractorInference:
         return pd.Series(result)
     
 
+    def set_preprocessing(self, preprocessing):
+        """Константы предобработки, сохранённые с моделью при обучении (None/{} - нет)"""
+        self.age_params = (preprocessing or {}).get('age')
+
+
+    def impute_age(self, age):
+        """
+        Замена возраста вне [AGE_MIN, AGE_MAX]: < AGE_MIN - mean_q1,
+        (AGE_MAX, AGE_OUTLIER_MAX] - mean_q4, остальное (и пропуски) - mean.
+        Статистики - обученные (age_params). Для старых моделей без них каждый клиент
+        обрабатывается сам по себе, как при поштучном скоринге: возраст вне диапазона
+        становится NaN (в признаках - 0), и uplift не зависит от остальных клиентов запроса
+        """
+        params = self.age_params if self.age_params is not None else NO_AGE_PARAMS
+
+        values = age.to_numpy(dtype=np.float64, na_value=np.nan)
+        imputed = np.select(
+            [(values >= AGE_MIN) & (values <= AGE_MAX), values < AGE_MIN, values <= AGE_OUTLIER_MAX],
+            [values, params['mean_q1'], params['mean_q4']],
+            default=params['mean'],
+        )
+        return pd.Series(imputed, index=age.index, name=age.name)
+    
+
     def preprocess_clients_inference(self, clients_df):
         """Inference: предобработка клиентов"""
-        df_clients = clients_df.copy()
-        
-        # Обработка возраста (тот же код)
-        valid_mask = (df_clients['age'] >= 15) & (df_clients['age'] <= 100)
-        valid_ages = df_clients.loc[valid_mask, 'age']
-        
-        q1, q3 = valid_ages.quantile([0.25, 0.75])
-        mean_q1 = valid_ages[(valid_ages >= 15) & (valid_ages <= q1)].mean()
-        mean_q4 = valid_ages[(valid_ages > q3) & (valid_ages <= 100)].mean()
-        
-        def replace_age_with_quartile_mean(age):
-            if 15 <= age <= 100:
-                return age
-            if age < 15:
-                return mean_q1
-            elif 100 < age <= 200:
-                return mean_q4
-            else:
-                return valid_ages.mean()
-        
-        df_clients['age'] = df_clients['age'].apply(replace_age_with_quartile_mean)
+        if self.low_memory:
+            df_clients = pd.DataFrame({col: clients_df[col] for col in clients_df.columns}, copy=False)
+        else:
+            df_clients = clients_df.copy()
+        
+        df_clients['age'] = self.impute_age(df_clients['age'])
         df_clients['gender'] = df_clients['gender'].astype('category')
         df_clients['is_activated'] = np.where(df_clients['first_redeem_date'].notna(), 1, 0)
         
         return df_clients.set_index('client_id')
     
 
+    def compact_purchases(self, purchases_df):
+        """
+        Проекция purchases на нужные колонки без копирования неизменяемых данных
+        и перевод в компактные типы (для low_memory)
+        """
+        cols = [col for col in PURCHASES_COLUMNS if col in purchases_df.columns]
+        purchases = pd.DataFrame({col: purchases_df[col] for col in cols}, copy=False)
+        
+        for col in cols:
+            s = purchases[col]
+            if col in ('store_id', 'product_id'):
+                purchases[col] = s.astype('category')
+            elif col in ('client_id', 'transaction_id', 'transaction_datetime'):
+                continue
+            elif pd.api.types.is_float_dtype(s) and s.dtype != np.float32:
+                purchases[col] = s.astype(np.float32)
+            elif pd.api.types.is_integer_dtype(s):
+                purchases[col] = pd.to_numeric(s, downcast='integer')
+        
+        return purchases
+    
+
     def preprocess_purchases(self, purchases_df):
         """Предобработка транзакционных данных"""
-        purchases = purchases_df.copy()
+        purchases = self.compact_purchases(purchases_df) if self.low_memory else purchases_df.copy()
         
         # Заполнение пропусков
         purchases['trn_sum_from_red'] = purchases['trn_sum_from_red'].fillna(purchases['trn_sum_from_iss'])
@@ -62,21 +111,62 @@ class UpliftFeatureExtractorInference:
         return purchases
     
 
+    def group_mode(self, df, key, col):
+        """
+        Мода col внутри групп key без Python-лямбд: подсчёт пар (key, col) и idxmax.
+        Как и Series.mode()[0], при равенстве частот берётся наименьшее значение, NaN не учитываются.
+        Возвращает (мода, её частота), индексированные по key
+        """
+        counts = df.groupby([key, col], sort=True, observed=True).size().rename('cnt').reset_index()
+        # внутри группы строки отсортированы по col, idxmax берёт первую - наименьшее значение
+        top = counts.loc[counts.groupby(key, sort=False)['cnt'].idxmax()].set_index(key)
+        mode = top[col]
+        if isinstance(mode.dtype, pd.CategoricalDtype):
+            mode = mode.astype(mode.cat.categories.dtype)
+        return mode, top['cnt']
+    
+
+    def transaction_date_features(self, first_date, last_date):
+        """Признаки по датам первой и последней транзакции клиента"""
+        features = {}
+        features['first_transaction_date'] = first_date
+        features['last_transaction_date'] = last_date
+        features['transaction_period_days'] = (last_date - first_date).dt.days
+        
+        # Квартал первой транзакции
+        first_date_df = first_date.to_frame(name='first_date_tmp')
+        first_date_df['first_transaction_quarter'] = (
+            first_date_df['first_date_tmp'].dt.year.astype(str) + 
+            'Q' + (((first_date_df['first_date_tmp'].dt.month - 1) // 3) + 1).astype(str)
+        )
+        first_date_df['first_transaction_year_quarter_idx'] = (
+            first_date_df['first_date_tmp'].dt.year * 4 + 
+            ((first_date_df['first_date_tmp'].dt.month - 1) // 3 + 1)
+        )
+        
+        features['first_transaction_quarter'] = first_date_df['first_transaction_quarter']
+        features['first_transaction_year_quarter_idx'] = first_date_df['first_transaction_year_quarter_idx']
+        return features
+    
+
     def generate_behavioral_features(self, purchases_df):
         """Генерация поведенческих признаков"""
-        df = purchases_df.copy()
+        df = purchases_df if self.low_memory else purchases_df.copy()
         
         # Уникальные транзакции
         trans_cols = ['client_id', 'transaction_id', 'transaction_datetime', 
                      'regular_points_received', 'express_points_received',
                      'regular_points_spent', 'express_points_spent', 
                      'purchase_sum', 'store_id']
-        unique_trans = df[trans_cols].drop_duplicates('transaction_id')
+        # transaction_id уникален только в рамках клиента (в батче у разных
+        # клиентов могут совпадать номера транзакций)
+        # копируются только строки уникальных транзакций, а не вся проекция
+        unique_trans = df.loc[~df.duplicated(['client_id', 'transaction_id']), trans_cols]
         
         # Продуктовые данные
         product_cols = ['client_id', 'transaction_id', 'product_id', 
                        'product_quantity', 'trn_sum_from_iss', 'trn_sum_from_red']
-        product_data = df[product_cols]
+        product_data = pd.DataFrame({col: df[col] for col in product_cols}, copy=False)
         
         features = {}
         
@@ -123,35 +213,17 @@ class UpliftFeatureExtractorInference:
         
         first_date = client_trans_time['transaction_datetime'].min()
         last_date = client_trans_time['transaction_datetime'].max()
-        
-        features['first_transaction_date'] = first_date
-        features['last_transaction_date'] = last_date
-        features['transaction_period_days'] = (last_date - first_date).dt.days
-        
-        # Квартал первой транзакции
-        first_date_df = first_date.to_frame(name='first_date_tmp')
-        first_date_df['first_transaction_quarter'] = (
-            first_date_df['first_date_tmp'].dt.year.astype(str) + 
-            'Q' + (((first_date_df['first_date_tmp'].dt.month - 1) // 3) + 1).astype(str)
-        )
-        first_date_df['first_transaction_year_quarter_idx'] = (
-            first_date_df['first_date_tmp'].dt.year * 4 + 
-            ((first_date_df['first_date_tmp'].dt.month - 1) // 3 + 1)
-        )
-        
-        features['first_transaction_quarter'] = first_date_df['first_transaction_quarter']
-        features['first_transaction_year_quarter_idx'] = first_date_df['first_transaction_year_quarter_idx']
+        features.update(self.transaction_date_features(first_date, last_date))
         
         # День недели и время суток
         unique_trans['transaction_weekday'] = unique_trans['transaction_datetime'].dt.dayofweek
         unique_trans['transaction_hour'] = unique_trans['transaction_datetime'].dt.hour
         
-        features['most_frequent_weekday'] = unique_trans.groupby('client_id')['transaction_weekday'].agg(
-            lambda x: x.mode()[0] if len(x.mode()) > 0 else -1
-        )
-        features['most_frequent_hour'] = unique_trans.groupby('client_id')['transaction_hour'].agg(
-            lambda x: x.mode()[0] if len(x.mode()) > 0 else -1
-        )
+        clients_index = features['total_transactions'].index
+        weekday_mode, _ = self.group_mode(unique_trans, 'client_id', 'transaction_weekday')
+        hour_mode, _ = self.group_mode(unique_trans, 'client_id', 'transaction_hour')
+        features['most_frequent_weekday'] = weekday_mode.reindex(clients_index, fill_value=-1)
+        features['most_frequent_hour'] = hour_mode.reindex(clients_index, fill_value=-1)
         
         # Частота транзакций
         features['transactions_per_day'] = (
@@ -160,19 +232,76 @@ class UpliftFeatureExtractorInference:
         
         # Фичи по магазинам
         features['unique_stores_visited'] = client_trans['store_id'].nunique()
-        features['most_frequent_store'] = client_trans['store_id'].agg(
-            lambda x: x.mode()[0] if len(x.mode()) > 0 else -1
-        )
-        features['store_loyalty_ratio'] = client_trans['store_id'].agg(
-            lambda x: x.value_counts().iloc[0] / len(x) if len(x) > 0 else 0
+        store_mode, store_mode_count = self.group_mode(unique_trans, 'client_id', 'store_id')
+        features['most_frequent_store'] = store_mode.reindex(clients_index, fill_value=-1)
+        features['store_loyalty_ratio'] = (
+            store_mode_count.reindex(clients_index, fill_value=0) / client_trans.size()
         )
         
         return pd.DataFrame(features)
     
 
+    def behavioral_features_from_aggregates(self, agg):
+        """
+        Поведенческие признаки из накопленных агрегатов клиента (utils/client_state.py):
+        те же колонки и формулы, что и в generate_behavioral_features.
+        Квантили, std и моды по дням/часам/магазинам не агрегируются инкрементально -
+        они NaN (при drop_redundant=True эти признаки всё равно удаляются)
+        """
+        features = {}
+        n_trans = agg['n_transactions']
+        
+        def mean(total, count):
+            return (agg[total] / agg[count]).where(agg[count] > 0)
+        
+        features['total_transactions'] = n_trans
+        features['total_purchase_sum'] = agg['purchase_sum_total']
+        features['avg_transaction_amount'] = mean('purchase_sum_total', 'purchase_sum_count')
+        features['std_transaction_amount'] = np.nan
+        features['max_transaction_amount'] = agg['purchase_sum_max']
+        features['min_transaction_amount'] = agg['purchase_sum_min']
+        for q in [0.25, 0.5, 0.75]:
+            features[f'transaction_amount_q{q}'] = np.nan
+        
+        features['total_regular_points_received'] = agg['regular_points_received_total']
+        features['total_express_points_received'] = agg['express_points_received_total']
+        features['total_regular_points_spent'] = agg['regular_points_spent_total']
+        features['total_express_points_spent'] = agg['express_points_spent_total']
+        features['avg_regular_points_per_transaction'] = mean(
+            'regular_points_received_total', 'regular_points_received_count'
+        )
+        features['avg_express_points_per_transaction'] = mean(
+            'express_points_received_total', 'express_points_received_count'
+        )
+        features['points_earned_to_spent_ratio'] = (
+            (agg['regular_points_received_total'] + agg['express_points_received_total']) /
+            (agg['regular_points_spent_total'] + agg['express_points_spent_total'] + 1)
+        )
+        
+        features['total_products_purchased'] = agg['product_quantity_total']
+        features['unique_products_count'] = agg['unique_products_count']
+        features['total_trn_sum_from_iss'] = agg['trn_sum_from_iss_total']
+        features['total_trn_sum_from_red'] = agg['trn_sum_from_red_total']
+        features['avg_product_quantity'] = mean('product_quantity_total', 'product_quantity_count')
+        
+        first_date = pd.to_datetime(agg['first_transaction_ts'])
+        last_date = pd.to_datetime(agg['last_transaction_ts'])
+        features.update(self.transaction_date_features(first_date, last_date))
+        
+        features['most_frequent_weekday'] = np.nan
+        features['most_frequent_hour'] = np.nan
+        features['transactions_per_day'] = n_trans / (features['transaction_period_days'] + 1)
+        
+        features['unique_stores_visited'] = agg['unique_stores_count']
+        features['most_frequent_store'] = np.nan
+        features['store_loyalty_ratio'] = agg['top_store_transactions'] / n_trans
+        
+        return pd.DataFrame(features, index=agg.index)
+    
+
     def generate_static_features(self, clients_df):
         """Генерация статических признаков"""
-        df = clients_df.copy()
+        df = clients_df if self.low_memory else clients_df.copy()
         features = pd.DataFrame(index=df.index)
         
         first_issue = pd.to_datetime(df['first_issue_date'], errors='coerce')
@@ -293,6 +422,26 @@ class UpliftFeatureExtractorInference:
         return df.drop(columns=[col for col in cols_to_drop if col in df.columns], errors='ignore')
     
 
+    def sanitize_features(self, final_df):
+        """
+        NaN -> 0 (inference), inf/-inf -> 1e9, clip в [-1e9, 1e9], round(6) -
+        одной операцией над float-матрицей всех числовых колонок; типы колонок сохраняются
+        """
+        num_cols = final_df.select_dtypes(include=[np.number]).columns
+        if len(num_cols) == 0:
+            return final_df
+        
+        dtypes = final_df[num_cols].dtypes
+        values = final_df[num_cols].to_numpy(dtype=np.float64)
+        values[np.isnan(values)] = 0.0
+        values[np.isinf(values)] = 1e9
+        np.clip(values, -1e9, 1e9, out=values)
+        np.round(values, 6, out=values)
+        
+        final_df[num_cols] = values
+        return final_df.astype(dtypes.to_dict())
+    
+
     def calculate_features(self, clients_df, purchases_df):
         """
         INFERENCE: только clients_df + purchases_df
@@ -303,6 +452,11 @@ class UpliftFeatureExtractorInference:
 
         # Генерация признаков
         behavioral_features = self.generate_behavioral_features(processed_purchases)
+        return self.assemble_features(processed_clients, behavioral_features)
+    
+
+    def assemble_features(self, processed_clients, behavioral_features):
+        """Статические и бизнес-признаки, демография, очистка - всё после поведенческих признаков"""
         static_features = self.generate_static_features(processed_clients)
         
         # Объединение и бизнес-признаки
@@ -317,12 +471,7 @@ class UpliftFeatureExtractorInference:
             final_df = self.remove_redundant_features(final_df)
         
         # Обработка NaN/inf
-        for col in final_df.select_dtypes(include=[np.number]).columns:
-            s = final_df[col]
-            s = s.fillna(0.0)  # inference: заполняем 0
-            s = s.replace([np.inf, -np.inf], 1e9)
-            s = np.clip(s, -1e9, 1e9)
-            final_df[col] = s.round(6)
+        final_df = self.sanitize_features(final_df)
         
         self.feature_names = final_df.columns.tolist()
         return final_df
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""
+Динамический микробатчинг конкурентных запросов /forward.
+
+Запросы, пришедшие в течение max_wait секунд после первого, склеиваются в один
+батч (не больше max_clients клиентов) и скорятся одним вызовом - один
+calculate_features и один model.predict на всех. Результаты раздаются обратно
+каждому запросу в том же виде, что дал бы score_clients_batch на нём одном:
+- покупки запроса берутся только для его клиентов;
+- запрос с client_id, который уже есть в собираемом батче, ждёт следующего батча.
+Если склеенный батч упал (кроме отказа пула), запросы перескориваются
+по отдельности, чтобы ошибка одного не отдавалась остальным.
+Очередь ожидания ограничена max_queue запросами, дальше - ScoringOverloaded (HTTP 429).
+"""
+import asyncio
+import contextlib
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from utils.scoring_pool import ScoringOverloaded, ScoringQueueTimeout
+
+# границы корзин гистограмм размера батча (последняя корзина - всё, что больше)
+HISTOGRAM_BOUNDS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class _Histogram:
+    def __init__(self, bounds=HISTOGRAM_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.n = 0
+
+    def add(self, value):
+        self.counts[int(np.searchsorted(self.bounds, value))] += 1
+        self.total += value
+        self.n += 1
+
+    def summary(self):
+        labels = [f"<={b}" for b in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "mean": self.total / self.n if self.n else 0.0,
+            "buckets": {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+
+class _Pending:
+    __slots__ = ("client_df", "purchases_df", "client_ids", "future", "enqueued")
+
+    def __init__(self, client_df, purchases_df, future):
+        self.client_df = client_df
+        self.purchases_df = purchases_df
+        self.client_ids = set(client_df["client_id"].tolist())
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    run_batch(client_df, purchases_df) - корутина скоринга склеенного
+    батча, возвращает (результаты, queue_time, ...) - как ScoringPool.run, хвост
+    кортежа (compute_time, этапы и т.п.) передаётся каждому запросу как есть
+    """
+
+    def __init__(self, run_batch, max_wait=0.005, max_clients=256, max_queue=1024):
+        self.run_batch = run_batch
+        self.max_wait = max_wait
+        self.max_clients = max_clients
+        self.max_queue = max_queue
+
+        self._queue = deque()
+        self._wakeup = None
+        self._task = None
+        # батчи в работе: event loop держит на задачи только слабые ссылки
+        self._tasks = set()
+
+        self.batches = 0
+        self.fallbacks = 0
+        self.rejected = 0
+        self.requests_hist = _Histogram()
+        self.clients_hist = _Histogram()
+
+    async def submit(self, client_df, purchases_df):
+        """Поставить запрос в батч. Возвращает кортеж run_batch с результатами этого запроса"""
+        if len(self._queue) >= self.max_queue:
+            self.rejected += 1
+            raise ScoringOverloaded(f"Micro-batch queue is full ({len(self._queue)} requests)")
+
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._collect())
+
+        pending = _Pending(client_df, purchases_df, loop.create_future())
+        self._queue.append(pending)
+        self._wakeup.set()
+        return await pending.future
+
+    def _queued_clients(self):
+        return sum(len(p.client_ids) for p in self._queue)
+
+    async def _collect(self):
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # ждём до max_wait от первого запроса в очереди или до заполнения батча
+            deadline = self._queue[0].enqueued + self.max_wait
+            while self._queued_clients() < self.max_clients:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            # батч скорится в фоне, следующий собирается параллельно (параллелизм ограничивает пул)
+            self._schedule(self._take_batch())
+
+    def _schedule(self, batch):
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._execute(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """Остановить сборку батчей: оставшиеся в очереди запросы скорятся, батчи в работе дожидаются"""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        while self._queue:
+            self._schedule(self._take_batch())
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _take_batch(self):
+        batch, seen, n_clients, deferred = [], set(), 0, deque()
+        while self._queue:
+            pending = self._queue.popleft()
+            if pending.future.done():
+                # вызывающий уже отменён
+                continue
+            if batch and (n_clients + len(pending.client_ids) > self.max_clients
+                          or not seen.isdisjoint(pending.client_ids)):
+                deferred.append(pending)
+                continue
+            batch.append(pending)
+            seen |= pending.client_ids
+            n_clients += len(pending.client_ids)
+        # отложенные запросы остаются первыми в очереди
+        deferred.extend(self._queue)
+        self._queue = deferred
+        return batch
+
+    async def _execute(self, batch):
+        self.batches += 1
+        self.requests_hist.add(len(batch))
+        self.clients_hist.add(sum(len(p.client_ids) for p in batch))
+        started = time.perf_counter()
+
+        try:
+            if len(batch) == 1:
+                pending = batch[0]
+                outcome = await self.run_batch(pending.client_df, pending.purchases_df)
+                self._resolve(pending, outcome, started)
+                return
+
+            client_df, purchases_df = self._combine(batch)
+            try:
+                results, *rest = await self.run_batch(client_df, purchases_df)
+            except (ScoringOverloaded, ScoringQueueTimeout):
+                raise
+            except Exception:
+                self.fallbacks += 1
+                await asyncio.gather(*(self._execute_single(p, started) for p in batch))
+                return
+
+            by_id = {r["client_id"]: r for r in results}
+            for pending in batch:
+                own = [by_id[int(cid)] for cid in sorted(pending.client_ids) if int(cid) in by_id]
+                self._resolve(pending, (own, *rest), started)
+        except Exception as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+
+    async def _execute_single(self, pending, started):
+        try:
+            outcome = await self.run_batch(pending.client_df, pending.purchases_df)
+        except Exception as e:
+            if not pending.future.done():
+                pending.future.set_exception(e)
+            return
+        self._resolve(pending, outcome, started)
+
+    @staticmethod
+    def _combine(batch):
+        """Склейка запросов: покупки каждого запроса - только его клиентов"""
+        purchases = []
+        for pending in batch:
+            own = pending.purchases_df["client_id"].isin(pending.client_ids)
+            purchases.append(pending.purchases_df[own])
+        client_df = pd.concat([p.client_df for p in batch], ignore_index=True)
+        purchases_df = pd.concat(purchases, ignore_index=True)
+        return client_df, purchases_df
+
+    @staticmethod
+    def _resolve(pending, outcome, started):
+        if pending.future.done():
+            return
+        results, queue_time, *rest = outcome
+        # ожидание сборки батча тоже входит в queue_time
+        pending.future.set_result((results, queue_time + (started - pending.enqueued), *rest))
+
+    def stats(self):
+        return {
+            "max_wait_ms": self.max_wait * 1000,
+            "max_clients": self.max_clients,
+            "max_queue": self.max_queue,
+            "queued": len(self._queue),
+            "in_flight": len(self._tasks),
+            "batches": self.batches,
+            "fallbacks": self.fallbacks,
+            "rejected": self.rejected,
+            "requests_per_batch": self.requests_hist.summary(),
+            "clients_per_batch": self.clients_hist.summary(),
+        }
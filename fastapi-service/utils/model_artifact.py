@@ -0,0 +1,219 @@
+"""
+Компактный версионированный формат модели для сервиса.
+
+T-learner из build_t_learner_logreg (sklift TwoModels с двумя пайплайнами
+StandardScaler + OneHotEncoder + LogisticRegression) сохраняется как каталог
+с manifest.json и набором .npy массивов: средние и масштабы скейлера,
+словари one-hot, коэффициенты и порядок признаков.
+
+Массивы открываются через np.load(mmap_mode="r"): страницы файла лежат в page cache
+и общие для всех воркеров uvicorn, а загрузка не требует импорта sklearn/sklift
+и распаковки pickle.
+
+Экспорт из существующего pickle:
+
+    python -m utils.model_artifact data/model.pkl data/model_artifact
+"""
+import json
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+
+ARTIFACT_FORMAT = "uplift-t-learner-logreg"
+ARTIFACT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+ARMS = ("trmnt", "ctrl")
+
+
+def _split_pipeline(pipeline):
+    """Достаёт из Pipeline(preprocess, clf) скейлер, энкодер и логрег"""
+    pre = pipeline.named_steps["preprocess"]
+    clf = pipeline.named_steps["clf"]
+
+    scaler, encoder = None, None
+    num_cols, cat_cols = [], []
+    for name, transformer, cols in pre.transformers_:
+        if name == "num":
+            scaler, num_cols = transformer, list(cols)
+        elif name == "cat":
+            encoder, cat_cols = transformer, list(cols)
+        elif transformer != "drop":
+            raise ValueError(f"Unsupported transformer in artifact export: {name}")
+
+    if len(clf.classes_) != 2:
+        raise ValueError("Only binary LogisticRegression is supported")
+    if encoder is not None and (encoder.drop is not None or encoder.handle_unknown != "ignore"):
+        raise ValueError("Only OneHotEncoder(drop=None, handle_unknown='ignore') is supported")
+
+    return scaler, encoder, clf, num_cols, cat_cols
+
+
+def export_t_learner_artifact(model, feature_names, path, preprocessing=None):
+    """
+    Сохранить обученный T-learner (TwoModels) в каталог path.
+    preprocessing - константы предобработки признаков с обучения (UpliftFeatureExtractor.preprocessing)
+    """
+    os.makedirs(path, exist_ok=True)
+
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "version": ARTIFACT_VERSION,
+        "feature_names": list(feature_names),
+        "preprocessing": preprocessing or {},
+        "arms": {},
+    }
+
+    def save(name, array):
+        np.save(os.path.join(path, name + ".npy"), np.ascontiguousarray(array), allow_pickle=False)
+        return name + ".npy"
+
+    for arm in ARMS:
+        pipeline = getattr(model, f"estimator_{arm}")
+        scaler, encoder, clf, num_cols, cat_cols = _split_pipeline(pipeline)
+
+        if "num_cols" in manifest:
+            if manifest["num_cols"] != num_cols or manifest["cat_cols"] != cat_cols:
+                raise ValueError("Treatment and control pipelines use different columns")
+        manifest["num_cols"] = num_cols
+        manifest["cat_cols"] = cat_cols
+
+        n_num = len(num_cols)
+        coef = clf.coef_.ravel().astype(np.float64)
+
+        arm_info = {
+            "intercept": float(clf.intercept_[0]),
+            "coef_num": save(f"{arm}_coef_num", coef[:n_num]),
+            "scaler_mean": save(f"{arm}_scaler_mean", scaler.mean_ if scaler is not None else np.zeros(0)),
+            "scaler_scale": save(f"{arm}_scaler_scale", scaler.scale_ if scaler is not None else np.ones(0)),
+            "categories": [],
+        }
+
+        offset = n_num
+        for i, cats in enumerate(encoder.categories_ if encoder is not None else []):
+            cats = list(cats)
+            # NaN (если он был при обучении) - всегда последний в categories_
+            has_nan = len(cats) > 0 and isinstance(cats[-1], float) and np.isnan(cats[-1])
+            values = cats[:-1] if has_nan else cats
+            arm_info["categories"].append({
+                "values": save(f"{arm}_cat{i}_values", np.array([str(v) for v in values], dtype=str)),
+                "coef": save(f"{arm}_cat{i}_coef", coef[offset:offset + len(cats)]),
+                "has_nan": bool(has_nan),
+            })
+            offset += len(cats)
+
+        manifest["arms"][arm] = arm_info
+
+    with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    return manifest
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+class TLearnerArtifact:
+    """
+    Модель, загруженная из артефакта. predict(X) повторяет TwoModels.predict
+    для method="vanilla": P(y=1 | treatment) - P(y=1 | control)
+    """
+
+    def __init__(self, path, mmap_mode="r"):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+
+        if manifest.get("format") != ARTIFACT_FORMAT:
+            raise ValueError(f"Unknown model artifact format: {manifest.get('format')}")
+        if manifest.get("version") != ARTIFACT_VERSION:
+            raise ValueError(f"Unsupported model artifact version: {manifest.get('version')}")
+
+        self.manifest = manifest
+        self.feature_names = manifest["feature_names"]
+        self.preprocessing = manifest.get("preprocessing", {})
+        self.num_cols = manifest["num_cols"]
+        self.cat_cols = manifest["cat_cols"]
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode=mmap_mode, allow_pickle=False)
+
+        self.arms = {}
+        for arm in ARMS:
+            info = manifest["arms"][arm]
+            self.arms[arm] = {
+                "intercept": info["intercept"],
+                "coef_num": load(info["coef_num"]),
+                "scaler_mean": load(info["scaler_mean"]),
+                "scaler_scale": load(info["scaler_scale"]),
+                "categories": [
+                    {
+                        "values": load(c["values"]),
+                        "coef": load(c["coef"]),
+                        "has_nan": c["has_nan"],
+                    }
+                    for c in info["categories"]
+                ],
+            }
+
+    @staticmethod
+    def category_codes(column, values, has_nan):
+        """Индекс категории для каждого значения; -1 - неизвестная (нулевой one-hot)"""
+        codes = pd.Categorical(column.astype(object), categories=list(values)).codes.astype(np.int64)
+        if has_nan:
+            codes[pd.isna(column).to_numpy()] = len(values)
+        return codes
+
+    def predict_arm(self, X, arm):
+        params = self.arms[arm]
+        X_num = X[self.num_cols].to_numpy(dtype=np.float64)
+        z = ((X_num - params["scaler_mean"]) / params["scaler_scale"]) @ params["coef_num"]
+        z = z + params["intercept"]
+
+        for col, cat in zip(self.cat_cols, params["categories"]):
+            codes = self.category_codes(X[col], cat["values"], cat["has_nan"])
+            known = codes >= 0
+            z[known] += np.asarray(cat["coef"])[codes[known]]
+
+        return _sigmoid(z)
+
+    def predict(self, X):
+        return self.predict_arm(X, "trmnt") - self.predict_arm(X, "ctrl")
+
+
+def load_model_artifact(path, mmap_mode="r"):
+    return TLearnerArtifact(path, mmap_mode=mmap_mode)
+
+
+def load_model(artifact_dir, pickle_path):
+    """
+    Загрузка модели сервиса: артефакт, если он есть, иначе pickle.
+    Возвращает (model, feature_names, preprocessing); (None, [], {}) если нет ни того, ни другого.
+    У моделей, сохранённых до появления preprocessing, он пустой
+    """
+    if os.path.exists(os.path.join(artifact_dir, MANIFEST_FILE)):
+        artifact = load_model_artifact(artifact_dir)
+        return artifact, artifact.feature_names, artifact.preprocessing
+
+    try:
+        with open(pickle_path, "rb") as f:
+            loaded = pickle.load(f)
+        return loaded["model"], loaded["feature_names"], loaded.get("preprocessing", {})
+    except FileNotFoundError:
+        return None, [], {}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Использование: python -m utils.model_artifact <model.pkl> <artifact_dir>")
+        sys.exit(1)
+
+    with open(sys.argv[1], "rb") as f:
+        loaded = pickle.load(f)
+    export_t_learner_artifact(
+        loaded["model"], loaded["feature_names"], sys.argv[2], loaded.get("preprocessing")
+    )
+    print(f"Артефакт сохранён в {sys.argv[2]}")
@@ -0,0 +1,339 @@
+import json
+import math
+import threading
+import time
+from datetime import datetime
+
+
+class DDSketch:
+    """
+    Квантильный скетч DDSketch с относительной точностью relative_accuracy.
+    Значения раскладываются по логарифмическим корзинам, поэтому скетч
+    занимает O(log(max/min)) памяти, а два скетча складываются (merge) без потерь.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, weight=1):
+        if value <= 0:
+            self.zero_count += weight
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + weight
+        self.count += weight
+
+    def merge(self, other):
+        for key, cnt in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + cnt
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                # середина корзины в смысле относительной ошибки
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "zero_count": self.zero_count,
+            "bins": {str(k): v for k, v in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"])
+        sketch.zero_count = data["zero_count"]
+        sketch.bins = {int(k): v for k, v in data["bins"].items()}
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
+
+
+class RequestAggregate:
+    """Счётчики и суммы по группе запросов + скетч времени обработки"""
+
+    def __init__(self, relative_accuracy=0.01):
+        self.time_count = 0
+        self.time_total = 0.0
+        self.time_sketch = DDSketch(relative_accuracy)
+        self.size_count = 0
+        self.size_total = 0.0
+        self.tokens_count = 0
+        self.tokens_total = 0.0
+
+    def add(self, processing_time, input_size, input_tokens):
+        # те же правила отбора, что и в исходном SQL-запросе /stats:
+        # учитываются строки с processing_time > 0, размеры - только ненулевые
+        if processing_time is None or processing_time <= 0:
+            return
+        self.time_count += 1
+        self.time_total += processing_time
+        self.time_sketch.add(processing_time)
+        if input_size:
+            self.size_count += 1
+            self.size_total += input_size
+        if input_tokens:
+            self.tokens_count += 1
+            self.tokens_total += input_tokens
+
+    def merge(self, other):
+        self.time_count += other.time_count
+        self.time_total += other.time_total
+        self.time_sketch.merge(other.time_sketch)
+        self.size_count += other.size_count
+        self.size_total += other.size_total
+        self.tokens_count += other.tokens_count
+        self.tokens_total += other.tokens_total
+
+    def processing_time_summary(self):
+        return {
+            "mean": self.time_total / self.time_count if self.time_count else 0.0,
+            "p50": self.time_sketch.quantile(0.50),
+            "p95": self.time_sketch.quantile(0.95),
+            "p99": self.time_sketch.quantile(0.99),
+            "count": self.time_count,
+            "total": self.time_total,
+        }
+
+    def input_summary(self):
+        return {
+            "input_size_bytes": {
+                "mean": self.size_total / self.size_count if self.size_count else 0.0,
+                "total": self.size_total,
+                "count": self.size_count,
+            },
+            "input_tokens": {
+                "mean": self.tokens_total / self.tokens_count if self.tokens_count else 0.0,
+                "total": self.tokens_total,
+                "count": self.tokens_count,
+            },
+        }
+
+    def to_dict(self):
+        return {
+            "time_count": self.time_count,
+            "time_total": self.time_total,
+            "time_sketch": self.time_sketch.to_dict(),
+            "size_count": self.size_count,
+            "size_total": self.size_total,
+            "tokens_count": self.tokens_count,
+            "tokens_total": self.tokens_total,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        agg = cls()
+        agg.time_count = data["time_count"]
+        agg.time_total = data["time_total"]
+        agg.time_sketch = DDSketch.from_dict(data["time_sketch"])
+        agg.size_count = data["size_count"]
+        agg.size_total = data["size_total"]
+        agg.tokens_count = data["tokens_count"]
+        agg.tokens_total = data["tokens_total"]
+        return agg
+
+
+class StatsState:
+    """Агрегаты целиком: общий, по статусам и по временным окнам"""
+
+    def __init__(self, window_seconds=3600, max_windows=48):
+        self.window_seconds = window_seconds
+        self.max_windows = max_windows
+        self.total = RequestAggregate()
+        self.by_status = {}
+        self.windows = {}
+
+    def add(self, ts, status, processing_time, input_size, input_tokens):
+        self.total.add(processing_time, input_size, input_tokens)
+        self.by_status.setdefault(int(status), RequestAggregate()).add(
+            processing_time, input_size, input_tokens
+        )
+        epoch = datetime.fromisoformat(ts).timestamp()
+        window = int(epoch // self.window_seconds) * self.window_seconds
+        self.windows.setdefault(window, RequestAggregate()).add(
+            processing_time, input_size, input_tokens
+        )
+
+    def merge(self, other):
+        self.total.merge(other.total)
+        for status, agg in other.by_status.items():
+            self.by_status.setdefault(status, RequestAggregate()).merge(agg)
+        for window, agg in other.windows.items():
+            self.windows.setdefault(window, RequestAggregate()).merge(agg)
+        self._trim_windows()
+
+    def _trim_windows(self):
+        if len(self.windows) > self.max_windows:
+            for window in sorted(self.windows)[:-self.max_windows]:
+                del self.windows[window]
+
+    def copy(self):
+        state = StatsState(self.window_seconds, self.max_windows)
+        state.merge(self)
+        return state
+
+    def to_dict(self):
+        return {
+            "window_seconds": self.window_seconds,
+            "total": self.total.to_dict(),
+            "by_status": {str(k): v.to_dict() for k, v in self.by_status.items()},
+            "windows": {str(k): v.to_dict() for k, v in self.windows.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data, window_seconds=3600, max_windows=48):
+        state = cls(window_seconds, max_windows)
+        state.total = RequestAggregate.from_dict(data["total"])
+        state.by_status = {int(k): RequestAggregate.from_dict(v) for k, v in data["by_status"].items()}
+        # окна другой длины не совместимы - начинаем их заново
+        if data.get("window_seconds") == window_seconds:
+            state.windows = {int(k): RequestAggregate.from_dict(v) for k, v in data["windows"].items()}
+            state._trim_windows()
+        return state
+
+
+class RequestStats:
+    """
+    Инкрементальная статистика запросов для /stats.
+
+    Обновляется фоновой записью истории в той же транзакции, что и строки history,
+    и периодически сохраняется в таблицу request_stats. Сохранение идёт как слияние
+    накопленной дельты с сохранённым снапшотом, поэтому несколько воркеров uvicorn
+    на одной БД не затирают друг друга.
+    """
+
+    def __init__(self, persist_interval=5.0, window_seconds=3600, max_windows=48):
+        self.persist_interval = persist_interval
+        self.window_seconds = window_seconds
+        self.max_windows = max_windows
+
+        self._persisted = self._new_state()
+        self._pending = self._new_state()
+        self._last_persist = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _new_state(self):
+        return StatsState(self.window_seconds, self.max_windows)
+
+    def _read_snapshot(self, conn):
+        row = conn.execute("SELECT state FROM request_stats WHERE id = 1").fetchone()
+        if row is None:
+            return None
+        return StatsState.from_dict(json.loads(row[0]), self.window_seconds, self.max_windows)
+
+    def _write_snapshot(self, conn, state):
+        conn.execute(
+            "INSERT OR REPLACE INTO request_stats (id, updated_ts, state) VALUES (1, ?, ?)",
+            (datetime.now().isoformat(), json.dumps(state.to_dict())),
+        )
+
+    def load(self, conn):
+        """
+        Загрузка снапшота при старте. Если его ещё нет (БД старше этой таблицы),
+        агрегаты один раз собираются по всей таблице history.
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            state = self._read_snapshot(conn)
+            if state is None:
+                state = self._new_state()
+                cur = conn.execute(
+                    "SELECT ts, status_code, processing_time, input_size, input_tokens FROM history"
+                )
+                for ts, status, processing_time, input_size, input_tokens in cur:
+                    state.add(ts, status, processing_time, input_size, input_tokens)
+                self._write_snapshot(conn, state)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        with self._lock:
+            self._persisted = state
+
+    def record_rows(self, conn, rows):
+        """
+        Колбэк HistoryWriter: rows - строки, записанные в history в текущей
+        транзакции conn (ts, processing_time, input_size, input_tokens, status, ...)
+        """
+        with self._lock:
+            for row in rows:
+                ts, processing_time, input_size, input_tokens, status = row[:5]
+                self._pending.add(ts, status, processing_time, input_size, input_tokens)
+
+        if time.monotonic() - self._last_persist >= self.persist_interval:
+            self.persist(conn)
+
+    def persist(self, conn):
+        """Слить накопленную дельту со снапшотом в БД (в транзакции conn)"""
+        with self._lock:
+            pending = self._pending
+            self._pending = self._new_state()
+
+        try:
+            state = self._read_snapshot(conn) or self._new_state()
+            state.merge(pending)
+            self._write_snapshot(conn, state)
+        except Exception:
+            # дельта не сохранена - возвращаем её к накопленному с тех пор
+            with self._lock:
+                pending.merge(self._pending)
+                self._pending = pending
+            raise
+        self._last_persist = time.monotonic()
+
+        with self._lock:
+            self._persisted = state
+
+    def reset(self, conn):
+        """Очистка вместе с history"""
+        with self._lock:
+            self._persisted = self._new_state()
+            self._pending = self._new_state()
+        conn.execute("DELETE FROM request_stats")
+
+    def snapshot(self):
+        with self._lock:
+            state = self._persisted.copy()
+            state.merge(self._pending)
+        return state
+
+    def summary(self):
+        """Ответ /stats: O(число корзин скетча), не зависит от размера history"""
+        state = self.snapshot()
+        if state.total.time_count == 0:
+            return {"error": "No processing data available"}
+
+        return {
+            "processing_time": state.total.processing_time_summary(),
+            "input_characteristics": state.total.input_summary(),
+            "by_status": {
+                str(status): agg.processing_time_summary()
+                for status, agg in sorted(state.by_status.items())
+                if agg.time_count
+            },
+            "windows": [
+                {
+                    "start": datetime.fromtimestamp(window).isoformat(),
+                    "window_seconds": state.window_seconds,
+                    **agg.processing_time_summary(),
+                }
+                for window, agg in sorted(state.windows.items())
+                if agg.time_count
+            ],
+        }
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from utils.client_feature_cache import client_content_keys
+from utils.stage_timing import NULL_TIMER
+
+
+def batch_features(fe, clients, purchases, cache=None):
+    """
+    Признаки клиентов батча (индекс - client_id).
+    Признаки клиента не зависят от остального батча, поэтому с кэшем
+    calculate_features считается только по клиентам-промахам
+    """
+    if cache is None:
+        return fe.calculate_features(clients, purchases)
+
+    keys = client_content_keys(clients, purchases)
+    found = cache.get_many(keys)
+    if len(found) == len(keys):
+        return cache.to_frame(found)
+
+    miss_ids = [cid for cid in keys if cid not in found]
+    if found:
+        clients = clients[clients["client_id"].isin(miss_ids)]
+        purchases = purchases[purchases["client_id"].isin(miss_ids)]
+    df_miss = fe.calculate_features(clients, purchases).loc[miss_ids]
+    cache.put_frame({cid: keys[cid] for cid in miss_ids}, df_miss)
+
+    if not found:
+        return df_miss
+    return pd.concat([cache.to_frame(found), df_miss])
+
+
+def score_clients_batch(fe, model, client_df, purchases_df, cache=None, timer=NULL_TIMER):
+    """
+    Батчевый скоринг: признаки для всех клиентов считаются одним вызовом
+    calculate_features, uplift - одним model.predict на всей матрице.
+    cache - ClientFeatureCache для повторно присылаемых клиентов,
+    timer - StageTimer для этапов features / predict
+    """
+    # как и в поштучном режиме, берём первую строку каждого клиента
+    clients = client_df.drop_duplicates("client_id", keep="first")
+    if clients.empty:
+        return []
+
+    client_ids = np.sort(clients["client_id"].unique())
+    purchases = purchases_df[purchases_df["client_id"].isin(client_ids)]
+
+    with timer.stage("features"):
+        df_feat = batch_features(fe, clients, purchases, cache)
+        X = df_feat.loc[client_ids, fe.feature_names]
+
+    with timer.stage("predict"):
+        uplift = np.asarray(model.predict(X), dtype=float)
+    return [
+        {"client_id": int(cid), "uplift": float(u)}
+        for cid, u in zip(client_ids, uplift)
+    ]
+
+
+def score_clients_per_client(fe, model, client_df, purchases_df, timer=NULL_TIMER):
+    """Поштучный скоринг: отдельный calculate_features и predict на каждого клиента"""
+    results = []
+
+    for cid, one_client_rows in client_df.groupby("client_id"):
+        with timer.stage("features"):
+            one_client_df = one_client_rows.iloc[[0]].copy()
+            one_pur_df = purchases_df[purchases_df["client_id"] == cid].copy()
+
+            df_feat = fe.calculate_features(one_client_df, one_pur_df)
+            X = df_feat[fe.feature_names].copy()
+
+        with timer.stage("predict"):
+            u = float(model.predict(X)[0])
+        results.append({"client_id": int(cid), "uplift": u})
+
+    return results
@@ -0,0 +1,163 @@
+"""
+Вынос CPU-работы скоринга из event loop.
+
+ScoringPool запускает функции в пуле потоков или процессов с ограничением
+одновременных задач (max_workers) и длины очереди ожидания (max_queue).
+Если очередь полна - ScoringOverloaded (HTTP 429), если задача ждала
+дольше queue_timeout - ScoringQueueTimeout (HTTP 503).
+Для каждой задачи возвращается время ожидания в очереди и время вычисления.
+"""
+import asyncio
+import multiprocessing
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils.fused_scorer import build_fused_scorer
+from utils.inference_feature_extractor import UpliftFeatureExtractorInference
+from utils.model_artifact import load_model
+from utils.scoring import score_clients_batch, score_clients_per_client
+from utils.streaming import score_ndjson_batch
+from utils.client_state import ingest, score_clients_from_state
+from utils.stage_timing import NULL_TIMER, StageTimer
+
+POOL_KINDS = ("thread", "process")
+
+
+class ScoringOverloaded(Exception):
+    """Очередь пула заполнена"""
+
+
+class ScoringQueueTimeout(Exception):
+    """Задача не дождалась свободного воркера"""
+
+
+class ScoringPool:
+    def __init__(self, kind="thread", max_workers=2, max_queue=32, queue_timeout=30.0,
+                 initializer=None, initargs=()):
+        if kind not in POOL_KINDS:
+            raise ValueError(f"kind must be one of {POOL_KINDS}, got {kind!r}")
+
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        if kind == "process":
+            # spawn: в сервисе уже работают потоки (запись истории), fork с ними небезопасен
+            self._executor = ProcessPoolExecutor(
+                max_workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=initializer, initargs=initargs,
+            )
+        else:
+            self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="scoring")
+
+        self._semaphore = None
+        self._pending = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def pending(self):
+        """Задачи в очереди и в работе"""
+        return self._pending
+
+    async def run(self, fn, *args, admit=True):
+        """
+        Выполнить fn(*args) в пуле. Возвращает (результат, queue_time, compute_time) в секундах.
+        admit=False - без проверки длины очереди и таймаута (части уже принятого запроса)
+        """
+        if self._semaphore is None:
+            # семафор создаётся в event loop, в котором работает сервис
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        if admit and self._pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise ScoringOverloaded(f"Scoring queue is full ({self._pending} pending)")
+
+        self._pending += 1
+        enqueued = time.perf_counter()
+        try:
+            try:
+                timeout = self.queue_timeout if admit else None
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise ScoringQueueTimeout(f"Waited more than {self.queue_timeout}s for a scoring worker")
+
+            started = time.perf_counter()
+            try:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._executor, fn, *args)
+            finally:
+                self._semaphore.release()
+            return result, started - enqueued, time.perf_counter() - started
+        finally:
+            self._pending -= 1
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- воркер пула процессов: своя копия модели и экстрактора ---
+
+_worker = {}
+
+
+def init_scoring_worker(artifact_dir, pickle_path, fused_scorer=True, low_memory=False):
+    model, feature_names, preprocessing = load_model(artifact_dir, pickle_path)
+    if fused_scorer and model is not None:
+        model = build_fused_scorer(model, feature_names)
+    _worker["model"] = model
+    _worker["feature_names"] = feature_names
+    _worker["fe"] = UpliftFeatureExtractorInference(drop_redundant=True, low_memory=low_memory)
+    _worker["fe"].set_preprocessing(preprocessing)
+
+
+def score_in_worker(scoring_mode, client_df, purchases_df, timed=False):
+    """
+    Скоринг в процессе пула (кэш признаков живёт в основном процессе и здесь не используется).
+    Возвращает (результаты, этапы {features, predict}; пустой словарь при timed=False)
+    """
+    fe, model = _worker["fe"], _worker["model"]
+    timer = StageTimer() if timed else NULL_TIMER
+    if scoring_mode == "per_client":
+        results = score_clients_per_client(fe, model, client_df, purchases_df, timer)
+    else:
+        results = score_clients_batch(fe, model, client_df, purchases_df, timer=timer)
+    return results, timer.stages
+
+
+def score_ndjson_in_worker(clients, purchases):
+    """Микробатч /forward/stream в процессе пула"""
+    return score_ndjson_batch(_worker["fe"], _worker["model"], clients, purchases)
+
+
+def ingest_in_worker(db_file, client_df, purchases_df):
+    """Запись в состояние клиентов (/clients/ingest) в процессе пула"""
+    conn = sqlite3.connect(db_file)
+    try:
+        return ingest(conn, _worker["fe"], client_df, purchases_df)
+    finally:
+        conn.close()
+
+
+def score_state_in_worker(db_file, client_ids):
+    """Скоринг по client_id из состояния клиентов в процессе пула"""
+    conn = sqlite3.connect(db_file)
+    try:
+        return score_clients_from_state(
+            conn, _worker["fe"], _worker["model"], client_ids, _worker["feature_names"]
+        )
+    finally:
+        conn.close()
@@ -0,0 +1,137 @@
+"""
+Поэтапное время обработки запроса и метрики в формате Prometheus.
+
+StageTimer копит длительности этапов (time.perf_counter - монотонные часы)
+в словарь stages {этап: секунды}; повторный вход в этап суммируется.
+NULL_TIMER - заглушка с тем же интерфейсом, когда замеры выключены: этапы
+не создают объектов и не зовут часы.
+
+StageMetrics собирает гистограммы длительностей этапов и счётчики запросов
+по (endpoint, status) и отдаёт их текстом для /metrics.
+"""
+import threading
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+# границы корзин гистограмм, секунды
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL_CONTEXT = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+
+
+class StageTimer:
+    enabled = True
+
+    def __init__(self):
+        self.stages = {}
+
+    def stage(self, name):
+        """with timer.stage("features"): ..."""
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        """Добавить длительность, измеренную снаружи (например, queue_time пула)"""
+        if seconds is not None:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def update(self, stages):
+        for name, seconds in stages.items():
+            self.add(name, seconds)
+
+
+class _NullTimer:
+    enabled = False
+    stages = {}
+
+    def stage(self, name):
+        return _NULL_CONTEXT
+
+    def add(self, name, seconds):
+        pass
+
+    def update(self, stages):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+class StageMetrics:
+    """Гистограммы этапов и счётчики запросов (потокобезопасно)"""
+
+    def __init__(self, namespace="uplift", buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+
+        # (endpoint, stage) -> [счётчики корзин..., +Inf], сумма
+        self._histograms = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, status, stages):
+        """Учесть запрос: статус и длительности его этапов"""
+        with self._lock:
+            key = (endpoint, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for stage, seconds in stages.items():
+                hist = self._histograms.get((endpoint, stage))
+                if hist is None:
+                    hist = self._histograms[(endpoint, stage)] = [[0] * (len(self.buckets) + 1), 0.0]
+                hist[0][int(np.searchsorted(self.buckets, seconds))] += 1
+                hist[1] += seconds
+
+    def render(self, gauges=None, counters=None):
+        """
+        Текстовый формат Prometheus. gauges / counters - дополнительные значения
+        {имя: число} (у счётчиков имя с суффиксом _total)
+        """
+        ns = self.namespace
+        with self._lock:
+            requests = dict(self._requests)
+            histograms = {key: (list(counts), total) for key, (counts, total) in self._histograms.items()}
+
+        lines = [
+            f"# HELP {ns}_requests_total Requests by endpoint and HTTP status",
+            f"# TYPE {ns}_requests_total counter",
+        ]
+        for (endpoint, status), count in sorted(requests.items()):
+            lines.append(f"{ns}_requests_total{_labels(endpoint=endpoint, status=status)} {count}")
+
+        name = f"{ns}_request_stage_seconds"
+        lines += [
+            f"# HELP {name} Time spent in each stage of request processing",
+            f"# TYPE {name} histogram",
+        ]
+        for (endpoint, stage), (counts, total) in sorted(histograms.items()):
+            cumulative = np.cumsum(counts)
+            for bound, count in zip(self.buckets + ("+Inf",), cumulative):
+                lines.append(f"{name}_bucket{_labels(endpoint=endpoint, stage=stage, le=bound)} {count}")
+            lines.append(f"{name}_sum{_labels(endpoint=endpoint, stage=stage)} {total}")
+            lines.append(f"{name}_count{_labels(endpoint=endpoint, stage=stage)} {cumulative[-1]}")
+
+        for kind, values in (("gauge", gauges), ("counter", counters)):
+            for metric, value in (values or {}).items():
+                lines.append(f"# TYPE {ns}_{metric} {kind}")
+                lines.append(f"{ns}_{metric} {value}")
+
+        return "\n".join(lines) + "\n"
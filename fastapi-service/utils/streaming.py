@@ -0,0 +1,80 @@
+"""
+Потоковый скоринг NDJSON для /forward/stream.
+
+Каждая строка запроса - один клиент со своими покупками:
+
+    {"client": {"client_id": 1, "age": 35, ...}, "purchases": [{...}, {...}]}
+
+Строки читаются по одной, копятся в микробатч из batch_size клиентов,
+микробатч скорится score_clients_batch, результат отдаётся строками
+{"client_id": ..., "uplift": ...} в порядке клиентов во входном потоке.
+Строка с ошибкой даёт {"line": n, "error": ...} и не ломает остальной поток.
+"""
+import json
+
+import pandas as pd
+
+from utils.scoring import score_clients_batch
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+
+def iter_ndjson_batches(lines, batch_size=1000):
+    """
+    Разбить поток строк (bytes или str) на микробатчи.
+    Возвращает генератор (clients, purchases, errors): списки строк-словарей
+    клиентов и покупок и готовые строки ошибок разбора
+    """
+    clients, purchases, errors = [], [], []
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            client = record["client"]
+            client_id = client["client_id"]
+            rows = record.get("purchases") or []
+            if any(row.get("client_id", client_id) != client_id for row in rows):
+                raise ValueError("purchases of another client_id")
+        except Exception as e:
+            errors.append(_dumps({"line": line_no, "error": f"Invalid record: {e}"}))
+            continue
+
+        clients.append(client)
+        # client_id в строках покупок можно не повторять
+        purchases.extend(dict(row, client_id=client_id) for row in rows)
+
+        if len(clients) >= batch_size:
+            yield clients, purchases, errors
+            clients, purchases, errors = [], [], []
+
+    if clients or errors:
+        yield clients, purchases, errors
+
+
+def score_ndjson_batch(fe, model, clients, purchases, cache=None):
+    """
+    Скоринг микробатча. Возвращает (строки ответа, число оценённых клиентов).
+    Ошибка модели на батче превращается в одну строку с ошибкой
+    """
+    if not clients:
+        return [], 0
+
+    client_df = pd.DataFrame(clients)
+    purchases_df = pd.DataFrame(purchases, columns=None if purchases else ["client_id"])
+    try:
+        results = score_clients_batch(fe, model, client_df, purchases_df, cache)
+    except Exception as e:
+        client_ids = list(dict.fromkeys(c["client_id"] for c in clients))
+        return [_dumps({"client_ids": client_ids, "error": "Model processing failed", "details": str(e)})], 0
+
+    # score_clients_batch сортирует по client_id - возвращаем порядок входного потока
+    by_id = {r["client_id"]: r for r in results}
+    lines = []
+    for client_id in dict.fromkeys(c["client_id"] for c in clients):
+        result = by_id.get(int(client_id))
+        if result is not None:
+            lines.append(_dumps(result))
+    return lines, len(lines)
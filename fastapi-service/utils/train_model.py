@@ -1,27 +1,79 @@
+import os
 import pickle
+import time
+import pandas as pd
 from sklift.datasets import fetch_x5
-from utils.feature_extraction import UpliftFeatureExtractor
+from utils.feature_extraction import UpliftFeatureExtractor, read_purchases_chunks
+from utils.feature_snapshot import FeatureSnapshotCache, x5_files
 from utils.model_extraction import build_t_learner_logreg
+from utils.model_artifact import export_t_learner_artifact
+from utils.fused_scorer import FusedTLearnerScorer, validate_scorer
 
 TARGET_COL = "target"
 TREATMENT_COL = "treatment_flg"
 
-print("Загружается датасет")
+# FEATURES_CHUNKSIZE=2000000 - читать purchases по частям, не загружая таблицу целиком
+# (файлы X5 должны быть уже скачаны fetch_x5 в каталог sklift)
+FEATURES_CHUNKSIZE = os.getenv("FEATURES_CHUNKSIZE")
+# FEATURES_N_JOBS=-1 - поведенческие признаки в пуле процессов на всех ядрах
+FEATURES_N_JOBS = int(os.getenv("FEATURES_N_JOBS", "1"))
+# FEATURES_LOW_MEMORY=1 - без копий датафреймов и в компактных типах (float32, category)
+FEATURES_LOW_MEMORY = os.getenv("FEATURES_LOW_MEMORY", "0") == "1"
+# снапшоты признаков (Parquet) - повторное обучение на тех же данных без расчёта признаков;
+# FEATURES_SNAPSHOT_DIR= (пусто) - выключено
+FEATURES_SNAPSHOT_DIR = os.getenv("FEATURES_SNAPSHOT_DIR", "data/feature_snapshots")
 
-dataset = fetch_x5()
-data = dataset.data
+extractor = UpliftFeatureExtractor(
+    drop_redundant=True, n_jobs=FEATURES_N_JOBS, low_memory=FEATURES_LOW_MEMORY
+)
 
-extractor = UpliftFeatureExtractor(drop_redundant=True)
 
-print("Начинается создание признаков")
+def compute_features():
+    if FEATURES_CHUNKSIZE:
+        print("Признаки считаются по частям purchases")
 
-df = extractor.calculate_features(
-    clients_df=data.clients,
-    train_df=data.train,
-    treatment_df=dataset.treatment,
-    target_df=dataset.target,
-    purchases_df=data.purchases
-)
+        files = x5_files()
+        train = pd.read_csv(files["train"])
+        clients = pd.read_csv(files["clients"])
+
+        df = extractor.calculate_features_chunked(
+            clients_df=clients,
+            train_df=train.drop([TARGET_COL, TREATMENT_COL], axis=1),
+            treatment_df=train[TREATMENT_COL],
+            target_df=train[TARGET_COL],
+            purchases_chunks=read_purchases_chunks(
+                files["purchases"],
+                chunksize=int(FEATURES_CHUNKSIZE),
+            ),
+        )
+    else:
+        print("Загружается датасет")
+
+        dataset = fetch_x5()
+        data = dataset.data
+
+        print("Начинается создание признаков")
+
+        df = extractor.calculate_features(
+            clients_df=data.clients,
+            train_df=data.train,
+            treatment_df=dataset.treatment,
+            target_df=dataset.target,
+            purchases_df=data.purchases
+        )
+
+    return df
+
+
+if FEATURES_SNAPSHOT_DIR:
+    # ключ - хэш файлов X5 и конфигурации экстрактора; при повторном обучении
+    # с теми же данными и кодом признаков датасет даже не загружается
+    snapshot = FeatureSnapshotCache(FEATURES_SNAPSHOT_DIR)
+    start = time.perf_counter()
+    df = snapshot.cached_features(extractor, x5_files(), compute_features)
+    print(f"Признаки получены за {time.perf_counter() - start:.1f} s (снапшоты в {FEATURES_SNAPSHOT_DIR})")
+else:
+    df = compute_features()
 
 features = extractor.feature_names
 
@@ -45,9 +97,20 @@ with open("data/model.pkl", "wb") as f:
     pickle.dump(
         {
             "model": t_model,
-            "feature_names": features
+            "feature_names": features,
+            # статистики замены возраста и др. - инференс применяет их вместо расчёта по батчу
+            "preprocessing": extractor.preprocessing
         },
         f
     )
 
+# компактный mmap-артефакт, который сервис грузит вместо pickle
+export_t_learner_artifact(t_model, features, "data/model_artifact", extractor.preprocessing)
+
+# сервис предсказывает свёрнутым float32-скорером - сверяем его с моделью
+scorer = FusedTLearnerScorer.from_artifact("data/model_artifact")
+X_check = X_all.sample(n=min(len(X_all), 100_000), random_state=0)
+max_diff = validate_scorer(scorer, t_model, X_check, atol=1e-5)
+print(f"Расхождение fused-скорера с моделью: {max_diff:.2e}")
+
 print("Модель сохранена")
\ No newline at end of file
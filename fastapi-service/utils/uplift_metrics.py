@@ -0,0 +1,328 @@
+"""
+Метрики uplift: Qini- и uplift-кривые, AUUC, Qini AUC, uplift@k.
+
+Значения совпадают с sklift.metrics (uplift_curve, qini_curve, uplift_auc_score,
+qini_auc_score, uplift_at_k), но считаются одной сортировкой и кумулятивными
+суммами NumPy: идеальные кривые для нормировки строятся по четырём группам
+(y, treatment) без повторной сортировки, а uplift_metrics отдаёт все три
+метрики за один проход.
+
+UpliftHistogram - потоковый вариант для данных, которые не помещаются в память:
+счётчики по корзинам скора накапливаются по частям и складываются (merge),
+например, между процессами. Клиенты одной корзины считаются равными по скору,
+поэтому кривые - по границам корзин (с 1000 корзин AUUC и Qini AUC отличаются
+от точных в третьем-четвёртом знаке).
+
+bootstrap_metrics / bootstrap_ci - бутстреп без цикла по выборкам: выборка
+задаётся весами строк (мультиномиальные кратности), кривые всех выборок пачки
+считаются взвешенными кумулятивными суммами по один раз отсортированным данным.
+"""
+import numpy as np
+
+# ступени скора идеальных кривых (по убыванию) - списки групп (y, treatment)
+# perfect_uplift_curve: скор 2 * (y == t) + y, если control responders > treated non-responders, иначе + t
+# perfect_qini_curve(negative_effect=True): скор y * t - y * (1 - t), у (0, 0) и (0, 1) он общий
+PERFECT_STEPS = {
+    "uplift_by_y": [[(1, 1)], [(0, 0)], [(1, 0)], [(0, 1)]],
+    "uplift_by_t": [[(1, 1)], [(0, 0)], [(0, 1)], [(1, 0)]],
+    "qini": [[(1, 1)], [(0, 0), (0, 1)], [(1, 0)]],
+}
+
+
+def _div(a, b):
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64))
+    return np.divide(a, b, out=np.zeros_like(a), where=b != 0)
+
+
+def _curve_values(kind, n, n_t, y_t, y_c):
+    """Точки кривой по кумулятивным суммам: n - клиенты, n_t - из них treatment, y_t / y_c - отклики"""
+    if kind == "uplift":
+        return (_div(y_t, n_t) - _div(y_c, n - n_t)) * n
+    if kind == "qini":
+        return y_t - y_c * _div(n_t, n - n_t)
+    raise ValueError(f"Unknown curve kind: {kind}")
+
+
+def _with_origin(x, values):
+    """Кривая начинается в (0, 0)"""
+    zeros = np.zeros(values.shape[:-1] + (1,))
+    x = np.broadcast_to(x, values.shape)
+    return np.concatenate([zeros, x], axis=-1), np.concatenate([zeros, values], axis=-1)
+
+
+def _auc(x, y):
+    """Площадь под кривой методом трапеций по последней оси (как sklearn.metrics.auc)"""
+    return (np.diff(x, axis=-1) * (y[..., 1:] + y[..., :-1]) / 2.0).sum(axis=-1)
+
+
+def _normalized_auc(x, values, x_perfect, y_perfect):
+    """(AUC - AUC случайной) / (AUC идеальной - AUC случайной)"""
+    baseline = x_perfect[..., -1] * y_perfect[..., -1] / 2.0
+    return (_auc(x, values) - baseline) / (_auc(x_perfect, y_perfect) - baseline)
+
+
+def _group_totals(n, n_t, y_t, y_c):
+    """Размеры групп (y, treatment) по итоговым суммам"""
+    return {
+        (1, 1): y_t,
+        (1, 0): y_c,
+        (0, 1): n_t - y_t,
+        (0, 0): n - n_t - y_c,
+    }
+
+
+def _steps_cumsums(groups, steps):
+    """Кумулятивные (n, n_t, y_t, y_c) по ступеням идеальной кривой"""
+    zero = np.zeros_like(groups[(1, 1)])
+
+    def stack(selected):
+        return np.cumsum(
+            np.stack([sum((groups[g] for g in step if g in selected), zero) for step in steps], axis=-1),
+            axis=-1,
+        )
+
+    return stack(set(groups)), stack({(1, 1), (0, 1)}), stack({(1, 1)}), stack({(1, 0)})
+
+
+def _perfect_curve(kind, n, n_t, y_t, y_c):
+    """
+    Идеальная кривая (perfect_uplift_curve / perfect_qini_curve с negative_effect=True)
+    по итоговым суммам; n, n_t, y_t, y_c - скаляры или массивы по выборкам бутстрепа
+    """
+    groups = _group_totals(*(np.asarray(v, dtype=np.float64) for v in (n, n_t, y_t, y_c)))
+    if kind == "qini":
+        cum = _steps_cumsums(groups, PERFECT_STEPS["qini"])
+    else:
+        use_y = (groups[(1, 0)] > groups[(0, 1)])[..., None]
+        cum = tuple(
+            np.where(use_y, by_y, by_t)
+            for by_y, by_t in zip(
+                _steps_cumsums(groups, PERFECT_STEPS["uplift_by_y"]),
+                _steps_cumsums(groups, PERFECT_STEPS["uplift_by_t"]),
+            )
+        )
+    return _with_origin(cum[0], _curve_values(kind, *cum))
+
+
+def _qini_random_curve(n, n_t, y_t, y_c):
+    """perfect_qini_curve с negative_effect=False"""
+    ratio = y_t - n_t * _div(y_c, n - n_t)
+    x = np.stack(np.broadcast_arrays(np.zeros_like(ratio), ratio, np.asarray(n, dtype=np.float64)), axis=-1)
+    y = np.stack([np.zeros_like(ratio), ratio, ratio], axis=-1)
+    return x, y
+
+
+def _check_k(k, n):
+    k_type = np.asarray(k).dtype.kind
+    if k_type not in ("i", "f"):
+        raise ValueError(f"Invalid value for k: {k_type}")
+    if k_type == "i" and not 0 < k < n or k_type == "f" and not 0 < k < 1:
+        raise ValueError(f"k={k} should be either positive and smaller than the number of samples "
+                         f"{n} or a float in the (0, 1) range")
+    return int(n * k) if k_type == "f" else int(k)
+
+
+class _Sorted:
+    """Данные, отсортированные по убыванию uplift (как в sklift), и границы ступеней скора"""
+
+    def __init__(self, y_true, uplift, treatment):
+        y_true, uplift, treatment = np.asarray(y_true), np.asarray(uplift), np.asarray(treatment)
+        if not len(y_true) == len(uplift) == len(treatment):
+            raise ValueError("y_true, uplift and treatment must have the same length")
+
+        order = np.argsort(uplift, kind="mergesort")[::-1]
+        self.y = y_true[order].astype(np.float64)
+        self.t = treatment[order].astype(np.float64)
+        self.yt = self.y * self.t
+        self.yc = self.y - self.yt
+        self.thresholds = np.r_[np.flatnonzero(np.diff(uplift[order])), len(order) - 1]
+
+    def cumsums(self, weights=None):
+        """Кумулятивные (n, n_t, y_t, y_c) на границах ступеней; weights - (выборки, строки)"""
+        idx = self.thresholds
+        if weights is None:
+            return (idx + 1.0, np.cumsum(self.t)[idx], np.cumsum(self.yt)[idx], np.cumsum(self.yc)[idx])
+        return tuple(
+            np.cumsum(weights * values, axis=-1)[..., idx]
+            for values in (1.0, self.t, self.yt, self.yc)
+        )
+
+    def curve(self, kind, weights=None):
+        cum = self.cumsums(weights)
+        return _with_origin(cum[0], _curve_values(kind, *cum)), tuple(c[..., -1] for c in cum)
+
+    def score(self, kind, weights=None, negative_effect=True):
+        (x, values), totals = self.curve(kind, weights)
+        if kind == "qini" and not negative_effect:
+            x_perfect, y_perfect = _qini_random_curve(*totals)
+        else:
+            x_perfect, y_perfect = _perfect_curve(kind, *totals)
+        return _normalized_auc(x, values, x_perfect, y_perfect)
+
+    def uplift_at_k(self, k, weights=None):
+        """strategy="overall": разница откликов treatment и control среди первых int(n * k)"""
+        n_size = _check_k(k, len(self.y))
+        if weights is None:
+            top = slice(0, n_size)
+            y_t, n_t, y_c = self.yt[top].sum(), self.t[top].sum(), self.yc[top].sum()
+            n_c = n_size - n_t
+        else:
+            # сколько копий каждой строки попало в первые n_size строк выборки
+            cum = np.cumsum(weights, axis=-1)
+            taken = np.clip(n_size - (cum - weights), 0, weights)
+            y_t, n_t, y_c = taken @ self.yt, taken @ self.t, taken @ self.yc
+            n_c = taken.sum(axis=-1) - n_t
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.asarray(y_t / n_t - y_c / n_c, dtype=np.float64)[()]
+
+
+def uplift_curve(y_true, uplift, treatment):
+    """(число клиентов, значения uplift-кривой) - как sklift.metrics.uplift_curve"""
+    (x, values), _ = _Sorted(y_true, uplift, treatment).curve("uplift")
+    return x, values
+
+
+def qini_curve(y_true, uplift, treatment):
+    """(число клиентов, значения Qini-кривой) - как sklift.metrics.qini_curve"""
+    (x, values), _ = _Sorted(y_true, uplift, treatment).curve("qini")
+    return x, values
+
+
+def uplift_auc_score(y_true, uplift, treatment):
+    """AUUC, нормированная на идеальную кривую (sklift.metrics.uplift_auc_score)"""
+    return float(_Sorted(y_true, uplift, treatment).score("uplift"))
+
+
+def qini_auc_score(y_true, uplift, treatment, negative_effect=True):
+    """Qini AUC, нормированная на идеальную кривую (sklift.metrics.qini_auc_score)"""
+    return float(_Sorted(y_true, uplift, treatment).score("qini", negative_effect=negative_effect))
+
+
+def uplift_at_k(y_true, uplift, treatment, strategy="overall", k=0.3):
+    """sklift.metrics.uplift_at_k: overall - первые k всех клиентов, by_group - первые k каждой группы"""
+    if strategy == "overall":
+        return float(_Sorted(y_true, uplift, treatment).uplift_at_k(k))
+    if strategy != "by_group":
+        raise ValueError(f"Uplift score supports only calculating methods in ['overall', 'by_group'], got {strategy}.")
+
+    data = _Sorted(y_true, uplift, treatment)
+    scores = {}
+    for group in (0, 1):
+        y_group = data.y[data.t == group]
+        n_group = _check_k(k, len(y_group)) if np.asarray(k).dtype.kind == "f" else int(k)
+        if n_group > len(y_group):
+            raise ValueError(f"With k={k}, the number of the first k observations is bigger "
+                             f"than the number of samples in group treatment={group}: {len(y_group)}")
+        scores[group] = y_group[:n_group].mean()
+    return float(scores[1] - scores[0])
+
+
+def uplift_metrics(y_true, uplift, treatment, k=0.3):
+    """uplift@k (overall), Qini AUC и AUUC одной сортировкой"""
+    data = _Sorted(y_true, uplift, treatment)
+    return {
+        "uplift_at_k": float(data.uplift_at_k(k)),
+        "qini_auc": float(data.score("qini")),
+        "auuc": float(data.score("uplift")),
+    }
+
+
+def bootstrap_metrics(y_true, uplift, treatment, n_bootstrap=1000, k=0.3, random_state=None,
+                      batch_size=None):
+    """
+    Метрики uplift_metrics на n_bootstrap бутстреп-выборках: {метрика: массив (n_bootstrap,)}.
+    Выборки обрабатываются пачками по batch_size (по умолчанию - так, чтобы матрица весов
+    пачки была около 4 млн элементов)
+    """
+    data = _Sorted(y_true, uplift, treatment)
+    n = len(data.y)
+    rng = np.random.default_rng(random_state)
+    if batch_size is None:
+        batch_size = max(1, 4_000_000 // max(n, 1))
+
+    results = {"uplift_at_k": [], "qini_auc": [], "auuc": []}
+    p = np.full(n, 1.0 / n)
+    for start in range(0, n_bootstrap, batch_size):
+        weights = rng.multinomial(n, p, size=min(batch_size, n_bootstrap - start)).astype(np.float64)
+        results["uplift_at_k"].append(data.uplift_at_k(k, weights))
+        results["qini_auc"].append(data.score("qini", weights))
+        results["auuc"].append(data.score("uplift", weights))
+    return {name: np.concatenate([np.atleast_1d(v) for v in values]) for name, values in results.items()}
+
+
+def bootstrap_ci(y_true, uplift, treatment, n_bootstrap=1000, alpha=0.05, k=0.3, random_state=None,
+                 batch_size=None):
+    """Перцентильные доверительные интервалы уровня 1 - alpha: {метрика: (нижняя, верхняя)}"""
+    samples = bootstrap_metrics(y_true, uplift, treatment, n_bootstrap, k, random_state, batch_size)
+    return {
+        name: tuple(np.nanquantile(values, [alpha / 2, 1 - alpha / 2]).tolist())
+        for name, values in samples.items()
+    }
+
+
+class UpliftHistogram:
+    """
+    Потоковые метрики uplift по корзинам скора: update по частям данных, merge
+    гистограмм с одинаковыми границами. Скор вне score_range попадает в крайние корзины
+    """
+
+    def __init__(self, bins=1000, score_range=(-1.0, 1.0)):
+        self.edges = np.linspace(score_range[0], score_range[1], bins + 1)
+        # по корзинам: клиенты, из них treatment, отклики treatment, отклики control
+        self.counts = np.zeros((4, bins))
+
+    def update(self, y_true, uplift, treatment):
+        y, t = np.asarray(y_true, dtype=np.float64), np.asarray(treatment, dtype=np.float64)
+        bins = self.counts.shape[1]
+        idx = np.clip(np.searchsorted(self.edges, np.asarray(uplift), side="right") - 1, 0, bins - 1)
+        for row, weights in enumerate((None, t, y * t, y * (1 - t))):
+            self.counts[row] += np.bincount(idx, weights=weights, minlength=bins)
+        return self
+
+    def merge(self, other):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot merge UpliftHistogram with different bin edges")
+        self.counts += other.counts
+        return self
+
+    def _cumsums(self):
+        # корзины по убыванию скора
+        return tuple(np.cumsum(row[::-1]) for row in self.counts)
+
+    def curve(self, kind="uplift"):
+        """(число клиентов, значения кривой) по границам корзин"""
+        cum = self._cumsums()
+        return _with_origin(cum[0], _curve_values(kind, *cum))
+
+    def score(self, kind, negative_effect=True):
+        x, values = self.curve(kind)
+        totals = self.counts.sum(axis=1)
+        if kind == "qini" and not negative_effect:
+            x_perfect, y_perfect = _qini_random_curve(*totals)
+        else:
+            x_perfect, y_perfect = _perfect_curve(kind, *totals)
+        return float(_normalized_auc(x, values, x_perfect, y_perfect))
+
+    def uplift_auc_score(self):
+        return self.score("uplift")
+
+    def qini_auc_score(self, negative_effect=True):
+        return self.score("qini", negative_effect)
+
+    def uplift_at_k(self, k=0.3):
+        """strategy="overall"; корзина на границе берётся долей, пропорционально числу клиентов"""
+        n, n_t, y_t, y_c = self._cumsums()
+        n_size = _check_k(k, int(n[-1]))
+        b = int(np.searchsorted(n, n_size))
+        prev = [c[b - 1] if b > 0 else 0.0 for c in (n, n_t, y_t, y_c)]
+        share = (n_size - prev[0]) / (n[b] - prev[0])
+        n_top, n_t_top, y_t_top, y_c_top = (p + share * (c[b] - p) for p, c in zip(prev, (n, n_t, y_t, y_c)))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return float(y_t_top / n_t_top - y_c_top / (n_top - n_t_top))
+
+    def metrics(self, k=0.3):
+        return {
+            "uplift_at_k": self.uplift_at_k(k),
+            "qini_auc": self.qini_auc_score(),
+            "auuc": self.uplift_auc_score(),
+        }